@@ -0,0 +1,79 @@
+# Flash-sale checkout benchmark: many concurrent orders against a single SKU.
+#
+#   python -m benchmarks.flash_sale --checkouts 500 --stock 100
+#
+# Runs against DB_URL_ASYNCPG, seeds its own category/sub/product and removes them afterwards.
+import argparse
+import asyncio
+import time
+from sqlalchemy import delete, insert, select
+
+from src.database import models, schemas
+from src.database.database import db
+from src.database.services import InsufficientStockError, OrderService
+
+
+async def seed(stock: int) -> tuple[int, list[int]]:
+    marker = f"flash-sale-{time.time_ns()}"
+    async with db.session_factory() as session:
+        category_id = await session.scalar(insert(models.Category).values(
+            name=marker, slug_en=marker).returning(models.Category.id))
+        sub_id = await session.scalar(insert(models.Sub).values(
+            name=marker, slug_en=marker).returning(models.Sub.id))
+        product_id = await session.scalar(insert(models.Product).values(
+            name=marker, article=marker, base_price=1000, description=marker, weight=1,
+            product_origin="benchmark", category_id=category_id, sub_id=sub_id, sizes=["M"],
+            slug_en=marker).returning(models.Product.id))
+        await session.execute(insert(models.Stock).values(product_id=product_id, size="M", on_hand=stock))
+        await session.commit()
+    return product_id, [category_id, sub_id]
+
+
+async def checkout(product_id: int, quantity: int) -> str:
+    order = schemas.OrderCreate(full_name="Flash Sale", telephone="+77000000000", items=[
+        schemas.OrderItemCreate(product_id=product_id, quantity=quantity, size="M")])
+    async with db.session_factory() as session:
+        try:
+            await OrderService(session).create_order(order)
+        except InsufficientStockError:
+            return "sold_out"
+        except Exception as error:
+            return type(error).__name__
+    return "ok"
+
+
+async def main(checkouts: int, stock: int, quantity: int) -> None:
+    db.engine.echo = False
+    product_id, (category_id, sub_id) = await seed(stock)
+
+    started = time.perf_counter()
+    outcomes = await asyncio.gather(*(checkout(product_id, quantity) for _ in range(checkouts)))
+    elapsed = time.perf_counter() - started
+
+    async with db.session_factory() as session:
+        row = await session.scalar(select(models.Stock).where(models.Stock.product_id == product_id))
+        order_ids = select(models.OrderItem.order_id).where(
+            models.OrderItem.product_id == product_id)
+        await session.execute(delete(models.Order).where(models.Order.id.in_(order_ids)))
+        await session.execute(delete(models.Category).where(models.Category.id == category_id))
+        await session.execute(delete(models.Sub).where(models.Sub.id == sub_id))
+        await session.commit()
+
+    counts = {outcome: outcomes.count(outcome) for outcome in set(outcomes)}
+    print(f"checkouts={checkouts} stock={stock} quantity={quantity} elapsed={elapsed:.2f}s "
+          f"rate={checkouts / elapsed:.0f}/s outcomes={counts}")
+    print(f"on_hand={row.on_hand} reserved={row.reserved}")
+
+    expected = min(checkouts, stock // quantity)
+    assert counts.get("ok", 0) == expected, "unexpected number of successful checkouts"
+    assert row.reserved == expected * quantity, "reserved stock does not match placed orders"
+    assert set(counts) <= {"ok", "sold_out"}, "checkouts failed with errors"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--checkouts", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--quantity", type=int, default=1)
+    args = parser.parse_args()
+    asyncio.run(main(args.checkouts, args.stock, args.quantity))
@@ -0,0 +1,101 @@
+# Product listing plans: EXPLAIN ANALYZE of every listing and sort on a seeded catalogue.
+#
+#   python -m benchmarks.listings --products 500000
+#
+# Seeds products spread over a few categories and subs, about a fifth of them on sale, and prints
+# the plan nodes and execution time of one page of each listing. A listing served by its index
+# shows an Index Scan under the Limit and no Sort over the whole set. The seeded rows are removed
+# afterwards (unless --keep is passed).
+import argparse
+import asyncio
+import json
+import time
+from sqlalchemy import delete, insert, select, text
+from sqlalchemy.dialects import postgresql
+
+from src.database import models, schemas
+from src.database.database import db
+from src.database.services import PRODUCT_ON_SALE, _sort_products
+
+
+CATEGORIES = 10
+SUBS = 50
+PAGE = 20
+
+
+async def seed(products: int, marker: str) -> tuple[list[int], list[int]]:
+    async with db.session_factory() as session:
+        category_ids = [await session.scalar(insert(models.Category).values(
+            name=f"{marker}-{n}", slug_en=f"{marker}-{n}").returning(models.Category.id)) for n in range(CATEGORIES)]
+        sub_ids = [await session.scalar(insert(models.Sub).values(
+            name=f"{marker}-{n}", slug_en=f"{marker}-{n}").returning(models.Sub.id)) for n in range(SUBS)]
+        await session.execute(text("""
+            INSERT INTO products (name, article, base_price, sale_price, description, weight,
+                                  product_origin, category_id, sub_id, slug_en, created_at)
+            SELECT md5(n::text), :marker || '-' || n, 1000 + n % 50000,
+                   CASE WHEN n % 5 = 0 THEN 500 + n % 40000 END, :marker, 1, 'benchmark',
+                   (:category_ids)[1 + n % :categories], (:sub_ids)[1 + n % :subs], :marker || '-' || n,
+                   now() - (n % 100000) * interval '1 minute'
+            FROM generate_series(1, :products) AS n
+        """), {"marker": marker, "category_ids": category_ids, "sub_ids": sub_ids,
+               "categories": CATEGORIES, "subs": SUBS, "products": products})
+        await session.commit()
+        await session.execute(text("ANALYZE products"))
+    return category_ids, sub_ids
+
+
+def listings(category_id: int, sub_id: int) -> dict[str, object]:
+    return {
+        "all": select(models.Product),
+        "category": select(models.Product).where(models.Product.category_id == category_id),
+        "sub": select(models.Product).where(models.Product.sub_id == sub_id),
+        "sale": select(models.Product).where(PRODUCT_ON_SALE),
+    }
+
+
+def plan_nodes(plan: dict) -> list[str]:
+    node = plan["Node Type"]
+    if "Index Name" in plan:
+        node += f" ({plan['Index Name']})"
+    return [node] + [child for subplan in plan.get("Plans", []) for child in plan_nodes(subplan)]
+
+
+async def explain(stmt: object) -> tuple[float, list[str]]:
+    sql = str(stmt.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+    async with db.session_factory() as session:
+        result = await session.scalar(text(f"EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) {sql}"))
+    result = json.loads(result) if isinstance(result, str) else result
+    return result[0]["Execution Time"], plan_nodes(result[0]["Plan"])
+
+
+async def cleanup(marker: str) -> None:
+    async with db.session_factory() as session:
+        await session.execute(delete(models.Category).where(models.Category.name.startswith(marker)))
+        await session.execute(delete(models.Sub).where(models.Sub.name.startswith(marker)))
+        await session.commit()
+
+
+async def main(products: int, offset: int, keep: bool) -> None:
+    db.engine.echo = False
+    marker = f"listing-benchmark-{time.time_ns()}"
+
+    started = time.perf_counter()
+    category_ids, sub_ids = await seed(products, marker)
+    print(f"seeded {products} products in {time.perf_counter() - started:.1f}s")
+
+    for listing, stmt in listings(category_ids[0], sub_ids[0]).items():
+        for sort in schemas.ProductSort:
+            elapsed, nodes = await explain(_sort_products(stmt, sort).offset(offset).limit(PAGE))
+            print(f"{listing:<8} sort={sort.value:<10} {elapsed:8.2f}ms  {' > '.join(nodes)}")
+
+    if not keep:
+        await cleanup(marker)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--products", type=int, default=500_000)
+    parser.add_argument("--offset", type=int, default=0)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.products, args.offset, args.keep))
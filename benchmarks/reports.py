@@ -0,0 +1,117 @@
+# Sales report benchmark: rollup-backed reports vs. aggregating order_items directly.
+#
+#   python -m benchmarks.reports --items 1000000
+#
+# Seeds orders with ~5 items each spread over the last year, rebuilds the rollups, times both
+# paths for every grouping and removes the seeded rows afterwards (unless --keep is passed).
+import argparse
+import asyncio
+import time
+from sqlalchemy import delete, func, insert, select, text
+
+from src.database import models, schemas
+from src.database.database import db
+from src.database.services import RollupService
+
+
+ITEMS_PER_ORDER = 5
+PRODUCTS = 200
+
+
+async def seed(items: int, marker: str) -> None:
+    async with db.session_factory() as session:
+        category_id = await session.scalar(insert(models.Category).values(
+            name=marker, slug_en=marker).returning(models.Category.id))
+        sub_id = await session.scalar(insert(models.Sub).values(
+            name=marker, slug_en=marker).returning(models.Sub.id))
+        await session.execute(text("""
+            INSERT INTO products (name, article, base_price, sale_price, description, weight,
+                                  product_origin, category_id, sub_id, slug_en)
+            SELECT :marker || '-' || n, :marker || '-' || n, 1000 + n, NULL, :marker, 1,
+                   'benchmark', :category_id, :sub_id, :marker || '-' || n
+            FROM generate_series(1, :products) AS n
+        """), {"marker": marker, "category_id": category_id, "sub_id": sub_id, "products": PRODUCTS})
+        await session.execute(text("""
+            INSERT INTO orders (full_name, telephone, status, created_at)
+            SELECT :marker, '+77000000000',
+                   (ARRAY['Оформлен', 'Оплачен', 'В пути', 'Доставлен', 'Возврат'])[1 + n % 5],
+                   now() - (n % 365) * interval '1 day'
+            FROM generate_series(1, :orders) AS n
+        """), {"marker": marker, "orders": items // ITEMS_PER_ORDER})
+        await session.execute(text("""
+            INSERT INTO order_items (order_id, product_id, quantity, price, category_id, sub_id, created_at)
+            SELECT o.id, p.id, 1 + (o.id + k) % 3, p.base_price, p.category_id, p.sub_id, o.created_at
+            FROM orders o
+            CROSS JOIN generate_series(1, :per_order) AS k
+            JOIN products p ON p.slug_en = :marker || '-' || (1 + (o.id * 7 + k) % :products)
+            WHERE o.full_name = :marker
+        """), {"marker": marker, "per_order": ITEMS_PER_ORDER, "products": PRODUCTS})
+        await session.commit()
+
+
+async def naive_report(group_by: schemas.ReportGroupBy) -> float:
+    keys = {
+        schemas.ReportGroupBy.day: func.date(models.Order.created_at),
+        schemas.ReportGroupBy.status: models.Order.status,
+        schemas.ReportGroupBy.category: models.Product.category_id,
+        schemas.ReportGroupBy.sub: models.Product.sub_id,
+        schemas.ReportGroupBy.product: models.Product.id,
+    }
+    key = keys[group_by]
+    stmt = select(key, func.count(func.distinct(models.Order.id)), func.sum(models.OrderItem.quantity),
+                  func.sum(models.OrderItem.quantity * models.Product.base_price)).select_from(models.OrderItem).join(
+        models.Order, models.Order.id == models.OrderItem.order_id).join(
+        models.Product, models.Product.id == models.OrderItem.product_id).group_by(key)
+    started = time.perf_counter()
+    async with db.session_factory() as session:
+        (await session.execute(stmt)).all()
+    return time.perf_counter() - started
+
+
+async def rollup_report(group_by: schemas.ReportGroupBy) -> float:
+    started = time.perf_counter()
+    async with db.session_factory() as session:
+        await RollupService(session).get_sales_report(group_by=group_by)
+    return time.perf_counter() - started
+
+
+async def rebuild() -> float:
+    started = time.perf_counter()
+    async with db.session_factory() as session:
+        await RollupService(session).rebuild()
+    return time.perf_counter() - started
+
+
+async def cleanup(marker: str) -> None:
+    async with db.session_factory() as session:
+        await session.execute(delete(models.Order).where(models.Order.full_name == marker))
+        await session.execute(delete(models.Category).where(models.Category.name == marker))
+        await session.execute(delete(models.Sub).where(models.Sub.name == marker))
+        await session.commit()
+
+
+async def main(items: int, keep: bool) -> None:
+    db.engine.echo = False
+    marker = f"report-benchmark-{time.time_ns()}"
+
+    started = time.perf_counter()
+    await seed(items, marker)
+    print(f"seeded {items} order items in {time.perf_counter() - started:.1f}s")
+    print(f"full rollup rebuild: {await rebuild():.2f}s")
+
+    for group_by in schemas.ReportGroupBy:
+        naive = await naive_report(group_by)
+        rollup = await rollup_report(group_by)
+        print(f"group_by={group_by.value:<8} order_items scan={naive * 1000:8.1f}ms rollup={rollup * 1000:8.1f}ms")
+
+    if not keep:
+        await cleanup(marker)
+        await rebuild()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--items", type=int, default=1_000_000)
+    parser.add_argument("--keep", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.items, args.keep))
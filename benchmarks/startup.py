@@ -0,0 +1,102 @@
+# Cold start and memory profile of the app.
+#
+#   python -m benchmarks.startup                          # import-time report and RSS after import
+#   python -m benchmarks.startup --workers 4              # also per-worker memory under gunicorn (preload)
+#   python -m benchmarks.startup --workers 4 --no-preload # same without preload, for comparison
+#
+# Import numbers come from `python -X importtime`; worker memory is read from
+# /proc/<pid>/smaps_rollup, where Pss splits shared pages between the processes using them.
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+
+def import_report(top: int) -> None:
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import src.main"],
+                            capture_output=True, text=True, check=True)
+    wall = time.perf_counter() - started
+
+    packages = []
+    total = 0
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # Each module is listed once, when first imported; dotless names are whole packages
+        if "." not in name.strip():
+            packages.append((int(cumulative), name.strip()))
+        if name.strip() == "src.main":
+            total = int(cumulative)
+
+    print(f"python -c 'import src.main': {wall:.2f}s wall, src.main cumulative import {total / 1e6:.2f}s")
+    print(f"top {top} top-level packages by cumulative import time:")
+    for cumulative, name in sorted(packages, reverse=True)[:top]:
+        print(f"  {cumulative / 1000:9.1f}ms  {name}")
+
+    rss = subprocess.run([sys.executable, "-c",
+                          "import resource, src.main; print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"],
+                         capture_output=True, text=True, check=True).stdout.strip()
+    print(f"max RSS after import: {int(rss) / 1024:.1f} MiB")
+
+
+def memory(pid: int) -> dict[str, int]:
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as file:
+        for line in file:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return values
+
+
+def children(pid: int) -> list[int]:
+    with open(f"/proc/{pid}/task/{pid}/children") as file:
+        return [int(child) for child in file.read().split()]
+
+
+def worker_report(workers: int, preload: bool, port: int) -> None:
+    env = {**os.environ, "WEB_CONCURRENCY": str(workers), "GUNICORN_PRELOAD": "1" if preload else "0",
+           "GUNICORN_BIND": f"127.0.0.1:{port}"}
+    started = time.perf_counter()
+    master = subprocess.Popen(["gunicorn", "-c", "gunicorn.conf.py", "src.main:app"], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        # Ready means every worker has finished its lifespan warm-up
+        while True:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/health/ready", timeout=1):
+                    if len(children(master.pid)) == workers:
+                        break
+            except OSError:
+                pass
+            if master.poll() is not None:
+                raise SystemExit("gunicorn exited before becoming ready")
+            time.sleep(0.1)
+        print(f"gunicorn preload={preload} workers={workers}: ready in {time.perf_counter() - started:.2f}s")
+
+        for label, pid in [("master", master.pid)] + [("worker", child) for child in children(master.pid)]:
+            values = memory(pid)
+            shared = values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0)
+            private = values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)
+            print(f"  {label:<6} pid={pid:<7} rss={values['Rss'] / 1024:7.1f}MiB pss={values['Pss'] / 1024:7.1f}MiB "
+                  f"shared={shared / 1024:7.1f}MiB private={private / 1024:7.1f}MiB")
+    finally:
+        master.send_signal(signal.SIGTERM)
+        master.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--workers", type=int, default=0)
+    parser.add_argument("--no-preload", action="store_true")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    import_report(args.top)
+    if args.workers:
+        worker_report(args.workers, preload=not args.no_preload, port=args.port)
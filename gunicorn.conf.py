@@ -0,0 +1,27 @@
+# gunicorn -c gunicorn.conf.py src.main:app
+#
+# preload_app imports the app once in the master; workers are forked from it and share those
+# pages copy-on-write instead of each importing everything again.
+import gc
+import multiprocessing
+import os
+
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:8000")
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = os.getenv("GUNICORN_PRELOAD", "1") == "1"
+timeout = 60
+graceful_timeout = 30
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    # The libraries src.utils loads lazily are pulled in here, before the fork, so workers share
+    # them too; gc.freeze keeps the collector from touching (and so copying) those pages later
+    from src.utils import get_jwt, get_pwd_context, slugify
+    get_jwt()
+    get_pwd_context()
+    slugify("warm up")
+    gc.freeze()
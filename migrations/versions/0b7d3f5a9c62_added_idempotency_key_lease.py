@@ -0,0 +1,24 @@
+"""added idempotency key lease
+
+Revision ID: 0b7d3f5a9c62
+Revises: 2e6c9a4d8b51
+Create Date: 2026-10-20 01:14:36.418207
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '0b7d3f5a9c62'
+down_revision = '2e6c9a4d8b51'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('idempotency_keys', sa.Column('locked_until', sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('idempotency_keys', 'locked_until')
@@ -0,0 +1,52 @@
+"""added product sales stats
+
+Revision ID: 1c7e4a9b3f26
+Revises: 8d3f6b2a5e70
+Create Date: 2026-10-20 00:16:39.851264
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '1c7e4a9b3f26'
+down_revision = '8d3f6b2a5e70'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('product_sales_stats',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('units', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('revenue', sa.Numeric(), server_default='0', nullable=False),
+    sa.Column('trend_score', sa.Float(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('product_id')
+    )
+    op.create_index(op.f('ix_product_sales_stats_units'), 'product_sales_stats', ['units'], unique=False)
+    op.create_index(op.f('ix_product_sales_stats_revenue'), 'product_sales_stats', ['revenue'], unique=False)
+    op.create_index(op.f('ix_product_sales_stats_trend_score'), 'product_sales_stats', ['trend_score'], unique=False)
+    # Counters for the orders already placed; epoch and half-life (72h) match TREND_EPOCH and
+    # PRODUCT_TREND_HALF_LIFE_HOURS
+    op.execute("""
+        INSERT INTO product_sales_stats (product_id, units, revenue, trend_score)
+        SELECT oi.product_id,
+               sum(oi.quantity),
+               sum(oi.quantity * coalesce(oi.price, 0)),
+               sum(oi.quantity * power(2.0, extract(epoch FROM o.created_at - timestamptz '2026-01-01 00:00:00+00') / (72 * 3600)))
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id AND oi.created_at = o.created_at
+        JOIN products p ON p.id = oi.product_id
+        WHERE o.status <> 'Возврат'
+        GROUP BY oi.product_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_product_sales_stats_trend_score'), table_name='product_sales_stats')
+    op.drop_index(op.f('ix_product_sales_stats_revenue'), table_name='product_sales_stats')
+    op.drop_index(op.f('ix_product_sales_stats_units'), table_name='product_sales_stats')
+    op.drop_table('product_sales_stats')
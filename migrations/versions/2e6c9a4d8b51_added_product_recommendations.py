@@ -0,0 +1,53 @@
+"""added product recommendations
+
+Revision ID: 2e6c9a4d8b51
+Revises: 5b9d1e7c4a38
+Create Date: 2026-10-20 00:52:47.093158
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2e6c9a4d8b51'
+down_revision = '5b9d1e7c4a38'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('product_pairs',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('related_id', sa.Integer(), nullable=False),
+    sa.Column('orders', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['related_id'], ['products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('product_id', 'related_id')
+    )
+    op.create_index(op.f('ix_product_pairs_related_id'), 'product_pairs', ['related_id'], unique=False)
+    op.create_table('product_recommendations',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('rank', sa.Integer(), nullable=False),
+    sa.Column('related_id', sa.Integer(), nullable=False),
+    sa.Column('score', sa.Float(), nullable=False),
+    sa.Column('source', sa.String(), nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['related_id'], ['products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('product_id', 'rank')
+    )
+    op.create_index(op.f('ix_product_recommendations_related_id'), 'product_recommendations', ['related_id'], unique=False)
+    op.create_table('job_watermarks',
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('value', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('job_watermarks')
+    op.drop_index(op.f('ix_product_recommendations_related_id'), table_name='product_recommendations')
+    op.drop_table('product_recommendations')
+    op.drop_index(op.f('ix_product_pairs_related_id'), table_name='product_pairs')
+    op.drop_table('product_pairs')
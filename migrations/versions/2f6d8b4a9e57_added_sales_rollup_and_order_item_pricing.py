@@ -0,0 +1,91 @@
+"""added sales rollup and order item pricing
+
+Revision ID: 2f6d8b4a9e57
+Revises: c7a93f0e5d18
+Create Date: 2026-10-19 16:22:53.774120
+
+"""
+import os
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '2f6d8b4a9e57'
+down_revision = 'c7a93f0e5d18'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10_000
+
+
+def upgrade() -> None:
+    op.add_column('order_items', sa.Column('price', sa.Numeric(precision=8), nullable=True))
+    op.add_column('order_items', sa.Column('category_id', sa.Integer(), nullable=True))
+    op.add_column('order_items', sa.Column('sub_id', sa.Integer(), nullable=True))
+    op.create_table('sales_rollup',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('status', sa.String(), nullable=False),
+    sa.Column('dimension', sa.String(), nullable=False),
+    sa.Column('key', sa.Integer(), nullable=False),
+    sa.Column('orders', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('units', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('revenue', sa.Numeric(), server_default='0', nullable=False),
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('day', 'status', 'dimension', 'key')
+    )
+    op.create_index(op.f('ix_sales_rollup_id'), 'sales_rollup', ['id'], unique=False)
+    op.create_index('ix_sales_rollup_dimension_day', 'sales_rollup', ['dimension', 'day'], unique=False)
+
+    # Existing items get today's product price and category, the best information left
+    conn = op.get_bind()
+    max_id = conn.execute(sa.text("SELECT coalesce(max(id), 0) FROM order_items")).scalar()
+    for start in range(0, max_id + 1, BATCH_SIZE):
+        conn.execute(sa.text("""
+            UPDATE order_items SET
+                price = CASE WHEN coalesce(p.sale_price, 0) > 0 AND p.sale_price < p.base_price
+                             THEN p.sale_price ELSE p.base_price END,
+                category_id = p.category_id,
+                sub_id = p.sub_id
+            FROM products p
+            WHERE p.id = order_items.product_id AND order_items.id >= :start AND order_items.id < :end
+        """), {"start": start, "end": start + BATCH_SIZE})
+
+    conn.execute(sa.text("""
+        WITH lines AS (
+            SELECT o.id AS order_id,
+                   (o.created_at AT TIME ZONE :tz)::date AS day,
+                   o.status,
+                   oi.id AS item_id,
+                   oi.category_id AS category,
+                   oi.sub_id AS sub,
+                   oi.product_id AS product,
+                   oi.quantity,
+                   oi.quantity * coalesce(oi.price, 0) AS amount
+            FROM orders o LEFT JOIN order_items oi ON oi.order_id = o.id
+        )
+        INSERT INTO sales_rollup (day, status, dimension, key, orders, units, revenue)
+        SELECT day, status, 'total', 0, count(DISTINCT order_id), coalesce(sum(quantity), 0), coalesce(sum(amount), 0)
+        FROM lines GROUP BY day, status
+        UNION ALL
+        SELECT day, status, 'category', coalesce(category, 0), count(DISTINCT order_id), sum(quantity), sum(amount)
+        FROM lines WHERE item_id IS NOT NULL GROUP BY day, status, coalesce(category, 0)
+        UNION ALL
+        SELECT day, status, 'sub', coalesce(sub, 0), count(DISTINCT order_id), sum(quantity), sum(amount)
+        FROM lines WHERE item_id IS NOT NULL GROUP BY day, status, coalesce(sub, 0)
+        UNION ALL
+        SELECT day, status, 'product', product, count(DISTINCT order_id), sum(quantity), sum(amount)
+        FROM lines WHERE item_id IS NOT NULL GROUP BY day, status, product
+    """), {"tz": os.getenv("REPORT_TIMEZONE", "Asia/Almaty")})
+
+
+def downgrade() -> None:
+    op.drop_index('ix_sales_rollup_dimension_day', table_name='sales_rollup')
+    op.drop_index(op.f('ix_sales_rollup_id'), table_name='sales_rollup')
+    op.drop_table('sales_rollup')
+    op.drop_column('order_items', 'sub_id')
+    op.drop_column('order_items', 'category_id')
+    op.drop_column('order_items', 'price')
@@ -0,0 +1,55 @@
+"""added shipping zones and rates
+
+Revision ID: 4f8a2c6e1b93
+Revises: 7e1b5c3a9d42
+Create Date: 2026-10-19 23:41:52.208147
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f8a2c6e1b93'
+down_revision = '7e1b5c3a9d42'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('shipping_zones',
+    sa.Column('code', sa.String(), nullable=False),
+    sa.Column('name', sa.String(), nullable=False),
+    sa.Column('active', sa.Boolean(), server_default='True', nullable=False),
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('code')
+    )
+    op.create_index(op.f('ix_shipping_zones_id'), 'shipping_zones', ['id'], unique=False)
+    op.create_table('shipping_rates',
+    sa.Column('zone_id', sa.Integer(), nullable=False),
+    sa.Column('origin', sa.String(), server_default='', nullable=False),
+    sa.Column('max_weight', sa.Numeric(precision=10, scale=3), nullable=True),
+    sa.Column('price', sa.Integer(), nullable=False),
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.ForeignKeyConstraint(['zone_id'], ['shipping_zones.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('zone_id', 'origin', 'max_weight')
+    )
+    op.create_index(op.f('ix_shipping_rates_id'), 'shipping_rates', ['id'], unique=False)
+    # Added on the partitioned parent, so every monthly partition gets the columns
+    op.add_column('orders', sa.Column('shipping_zone', sa.String(), nullable=True))
+    op.add_column('orders', sa.Column('shipping_cost', sa.Integer(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('orders', 'shipping_cost')
+    op.drop_column('orders', 'shipping_zone')
+    op.drop_index(op.f('ix_shipping_rates_id'), table_name='shipping_rates')
+    op.drop_table('shipping_rates')
+    op.drop_index(op.f('ix_shipping_zones_id'), table_name='shipping_zones')
+    op.drop_table('shipping_zones')
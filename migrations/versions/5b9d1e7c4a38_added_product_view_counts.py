@@ -0,0 +1,32 @@
+"""added product view counts
+
+Revision ID: 5b9d1e7c4a38
+Revises: 1c7e4a9b3f26
+Create Date: 2026-10-20 00:34:12.590813
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b9d1e7c4a38'
+down_revision = '1c7e4a9b3f26'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('product_view_counts',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('views', sa.Integer(), server_default='0', nullable=False),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('day', 'product_id')
+    )
+    op.create_index(op.f('ix_product_view_counts_product_id'), 'product_view_counts', ['product_id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_product_view_counts_product_id'), table_name='product_view_counts')
+    op.drop_table('product_view_counts')
@@ -0,0 +1,31 @@
+"""added request item dedup columns
+
+Revision ID: 7e1b5c3a9d42
+Revises: 6a2d9e4b7c15
+Create Date: 2026-10-19 23:20:13.665390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7e1b5c3a9d42'
+down_revision = '6a2d9e4b7c15'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # telephone_e164 only feeds the recent-duplicate window, so existing rows are left as they are
+    op.add_column('request_items', sa.Column('telephone_e164', sa.String(), nullable=True))
+    op.add_column('request_items', sa.Column('submission_id', sa.String(), nullable=True))
+    op.create_unique_constraint('request_items_submission_id_key', 'request_items', ['submission_id'])
+    op.create_index('ix_request_items_telephone_e164_created_at', 'request_items', ['telephone_e164', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_request_items_telephone_e164_created_at', table_name='request_items')
+    op.drop_constraint('request_items_submission_id_key', 'request_items', type_='unique')
+    op.drop_column('request_items', 'submission_id')
+    op.drop_column('request_items', 'telephone_e164')
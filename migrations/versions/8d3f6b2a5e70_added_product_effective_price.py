@@ -0,0 +1,47 @@
+"""added product effective price
+
+Revision ID: 8d3f6b2a5e70
+Revises: 4f8a2c6e1b93
+Create Date: 2026-10-19 23:58:06.417329
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d3f6b2a5e70'
+down_revision = '4f8a2c6e1b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # A stored generated column rewrites products once; every row gets its value here
+    op.add_column('products', sa.Column('effective_price', sa.Numeric(precision=8), sa.Computed(
+        'CASE WHEN sale_price > 0 AND sale_price < base_price THEN sale_price ELSE base_price END', persisted=True), nullable=True))
+    op.drop_index('ix_products_category_id_created_at', table_name='products')
+    op.create_index('ix_products_category_id_created_at_id', 'products', ['category_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_products_effective_price_id', 'products', ['effective_price', 'id'], unique=False)
+    op.create_index('ix_products_created_at_id', 'products', ['created_at', 'id'], unique=False)
+    op.create_index('ix_products_category_id_effective_price_id', 'products', ['category_id', 'effective_price', 'id'], unique=False)
+    op.create_index('ix_products_category_id_name_id', 'products', ['category_id', 'name', 'id'], unique=False)
+    op.create_index('ix_products_sub_id_effective_price_id', 'products', ['sub_id', 'effective_price', 'id'], unique=False)
+    op.create_index('ix_products_sub_id_created_at_id', 'products', ['sub_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_products_sub_id_name_id', 'products', ['sub_id', 'name', 'id'], unique=False)
+    op.create_index('ix_products_on_sale_effective_price_id', 'products', ['effective_price', 'id'], unique=False,
+                    postgresql_where=sa.text('effective_price < base_price'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_on_sale_effective_price_id', table_name='products')
+    op.drop_index('ix_products_sub_id_name_id', table_name='products')
+    op.drop_index('ix_products_sub_id_created_at_id', table_name='products')
+    op.drop_index('ix_products_sub_id_effective_price_id', table_name='products')
+    op.drop_index('ix_products_category_id_name_id', table_name='products')
+    op.drop_index('ix_products_category_id_effective_price_id', table_name='products')
+    op.drop_index('ix_products_created_at_id', table_name='products')
+    op.drop_index('ix_products_effective_price_id', table_name='products')
+    op.drop_index('ix_products_category_id_created_at_id', table_name='products')
+    op.create_index('ix_products_category_id_created_at', 'products', ['category_id', 'created_at'], unique=False)
+    op.drop_column('products', 'effective_price')
@@ -0,0 +1,40 @@
+"""added stock table and order item size
+
+Revision ID: 8e4b2d61c0f3
+Revises: 5c1e0a9f7b21
+Create Date: 2026-10-19 12:40:08.530911
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e4b2d61c0f3'
+down_revision = '5c1e0a9f7b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('stock',
+    sa.Column('product_id', sa.Integer(), nullable=False),
+    sa.Column('size', sa.String(), server_default='', nullable=False),
+    sa.Column('on_hand', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('reserved', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.CheckConstraint('reserved >= 0 AND reserved <= on_hand', name='ck_stock_reserved_within_on_hand'),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('product_id', 'size')
+    )
+    op.create_index(op.f('ix_stock_id'), 'stock', ['id'], unique=False)
+    op.add_column('order_items', sa.Column('size', sa.String(), server_default='', nullable=False))
+
+
+def downgrade() -> None:
+    op.drop_column('order_items', 'size')
+    op.drop_index(op.f('ix_stock_id'), table_name='stock')
+    op.drop_table('stock')
@@ -0,0 +1,45 @@
+"""added order events outbox
+
+Revision ID: 9c4f1a8e3d27
+Revises: 3b9e2c7d1f60
+Create Date: 2026-10-19 22:18:44.092617
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4f1a8e3d27'
+down_revision = '3b9e2c7d1f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table('order_events',
+    sa.Column('order_id', sa.Integer(), nullable=False),
+    sa.Column('event_type', sa.String(), nullable=False),
+    sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+    sa.Column('published_to', sa.ARRAY(sa.String()), server_default='{}', nullable=False),
+    sa.Column('attempts', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('next_attempt_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+    sa.Column('processed_at', sa.DateTime(timezone=True), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_order_events_id'), 'order_events', ['id'], unique=False)
+    op.create_index(op.f('ix_order_events_order_id'), 'order_events', ['order_id'], unique=False)
+    op.create_index('ix_order_events_pending', 'order_events', ['next_attempt_at'], unique=False,
+                    postgresql_where=sa.text('processed_at IS NULL'))
+
+
+def downgrade() -> None:
+    op.drop_index('ix_order_events_pending', table_name='order_events')
+    op.drop_index(op.f('ix_order_events_order_id'), table_name='order_events')
+    op.drop_index(op.f('ix_order_events_id'), table_name='order_events')
+    op.drop_table('order_events')
@@ -0,0 +1,42 @@
+"""added product snapshot to order items
+
+Revision ID: a41f7c3e2b96
+Revises: 2f6d8b4a9e57
+Create Date: 2026-10-19 17:48:19.265530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41f7c3e2b96'
+down_revision = '2f6d8b4a9e57'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10_000
+
+
+def upgrade() -> None:
+    op.add_column('order_items', sa.Column('product_name', sa.String(), nullable=True))
+    op.add_column('order_items', sa.Column('product_article', sa.String(), nullable=True))
+    op.add_column('order_items', sa.Column('product_image', sa.String(), nullable=True))
+
+    conn = op.get_bind()
+    max_id = conn.execute(sa.text("SELECT coalesce(max(id), 0) FROM order_items")).scalar()
+    for start in range(0, max_id + 1, BATCH_SIZE):
+        conn.execute(sa.text("""
+            UPDATE order_items SET
+                product_name = p.name,
+                product_article = p.article,
+                product_image = p.images[1]
+            FROM products p
+            WHERE p.id = order_items.product_id AND order_items.id >= :start AND order_items.id < :end
+        """), {"start": start, "end": start + BATCH_SIZE})
+
+
+def downgrade() -> None:
+    op.drop_column('order_items', 'product_image')
+    op.drop_column('order_items', 'product_article')
+    op.drop_column('order_items', 'product_name')
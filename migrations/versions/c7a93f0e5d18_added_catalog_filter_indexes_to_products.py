@@ -0,0 +1,30 @@
+"""added catalog filter indexes to products
+
+Revision ID: c7a93f0e5d18
+Revises: 8e4b2d61c0f3
+Create Date: 2026-10-19 14:05:47.102384
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7a93f0e5d18'
+down_revision = '8e4b2d61c0f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_products_category_id_product_origin', 'products', ['category_id', 'product_origin'], unique=False)
+    op.create_index('ix_products_sub_id_product_origin', 'products', ['sub_id', 'product_origin'], unique=False)
+    op.create_index('ix_products_category_id_created_at', 'products', ['category_id', 'created_at'], unique=False)
+    op.create_index('ix_products_sizes', 'products', ['sizes'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_sizes', table_name='products')
+    op.drop_index('ix_products_category_id_created_at', table_name='products')
+    op.drop_index('ix_products_sub_id_product_origin', table_name='products')
+    op.drop_index('ix_products_category_id_product_origin', table_name='products')
@@ -0,0 +1,58 @@
+"""added normalized phone to orders
+
+Revision ID: d93b6e1f4a08
+Revises: a41f7c3e2b96
+Create Date: 2026-10-19 19:03:36.820417
+
+"""
+import os
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd93b6e1f4a08'
+down_revision = 'a41f7c3e2b96'
+branch_labels = None
+depends_on = None
+
+BATCH_SIZE = 10_000
+
+
+def upgrade() -> None:
+    op.add_column('orders', sa.Column('telephone_e164', sa.String(), nullable=True))
+
+    # Same rules as src.utils.normalize_phone
+    conn = op.get_bind()
+    params = {
+        "country_code": os.getenv("PHONE_COUNTRY_CODE", "7"),
+        "trunk_prefix": os.getenv("PHONE_TRUNK_PREFIX", "8"),
+        "national_length": int(os.getenv("PHONE_NATIONAL_LENGTH", "10")),
+    }
+    max_id = conn.execute(sa.text("SELECT coalesce(max(id), 0) FROM orders")).scalar()
+    for start in range(0, max_id + 1, BATCH_SIZE):
+        conn.execute(sa.text("""
+            UPDATE orders SET telephone_e164 = normalized.phone
+            FROM (
+                SELECT id, CASE
+                    WHEN digits = '' THEN NULL
+                    WHEN ltrim(telephone) LIKE '+%' THEN '+' || digits
+                    WHEN length(digits) = :national_length THEN '+' || :country_code || digits
+                    WHEN length(digits) = :national_length + 1 AND left(digits, length(:trunk_prefix)) = :trunk_prefix
+                        THEN '+' || :country_code || substr(digits, length(:trunk_prefix) + 1)
+                    ELSE '+' || digits
+                END AS phone
+                FROM (
+                    SELECT id, telephone, regexp_replace(telephone, '\\D', '', 'g') AS digits
+                    FROM orders WHERE id >= :start AND id < :end
+                ) AS raw
+            ) AS normalized
+            WHERE orders.id = normalized.id
+        """), {**params, "start": start, "end": start + BATCH_SIZE})
+
+    op.create_index('ix_orders_telephone_e164_created_at', 'orders', ['telephone_e164', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_orders_telephone_e164_created_at', table_name='orders')
+    op.drop_column('orders', 'telephone_e164')
@@ -0,0 +1,179 @@
+"""partitioned orders and order items by month
+
+Revision ID: e5a07d2c9b43
+Revises: d93b6e1f4a08
+Create Date: 2026-10-19 21:04:37.118260
+
+"""
+from datetime import date, datetime, timezone
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a07d2c9b43'
+down_revision = 'd93b6e1f4a08'
+branch_labels = None
+depends_on = None
+
+MONTHS_AHEAD = 3
+
+ORDER_COLUMNS = "id, created_at, updated_at, full_name, telephone, telephone_e164, status"
+ITEM_COLUMNS = ("id, created_at, updated_at, order_id, product_id, quantity, size, price, category_id, sub_id, "
+                "product_name, product_article, product_image")
+
+
+def _month_start(day: date, offset: int = 0) -> date:
+    month = day.month - 1 + offset
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def _order_columns(id_sequence: str) -> list:
+    return [
+        sa.Column('id', sa.Integer(), server_default=sa.text(f"nextval('{id_sequence}'::regclass)"), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('full_name', sa.String(), nullable=False),
+        sa.Column('telephone', sa.String(), nullable=False),
+        sa.Column('telephone_e164', sa.String(), nullable=True),
+        sa.Column('status', sa.String(), nullable=False),
+    ]
+
+
+def _item_columns(id_sequence: str) -> list:
+    return [
+        sa.Column('id', sa.Integer(), server_default=sa.text(f"nextval('{id_sequence}'::regclass)"), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('order_id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('quantity', sa.Integer(), nullable=False),
+        sa.Column('size', sa.String(), server_default='', nullable=False),
+        sa.Column('price', sa.Numeric(precision=8), nullable=True),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('sub_id', sa.Integer(), nullable=True),
+        sa.Column('product_name', sa.String(), nullable=True),
+        sa.Column('product_article', sa.String(), nullable=True),
+        sa.Column('product_image', sa.String(), nullable=True),
+    ]
+
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    op.execute("LOCK TABLE orders, order_items IN ACCESS EXCLUSIVE MODE")
+
+    # Move the plain tables aside, keeping their id sequences for the new ones
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY NONE")
+    op.execute("ALTER SEQUENCE order_items_id_seq OWNED BY NONE")
+    op.rename_table('order_items', 'order_items_unpartitioned')
+    op.rename_table('orders', 'orders_unpartitioned')
+    op.execute("ALTER TABLE order_items_unpartitioned DROP CONSTRAINT IF EXISTS order_items_order_id_fkey")
+    op.execute("ALTER TABLE order_items_unpartitioned DROP CONSTRAINT IF EXISTS order_items_product_id_fkey")
+    op.execute("ALTER TABLE order_items_unpartitioned RENAME CONSTRAINT order_items_pkey TO order_items_unpartitioned_pkey")
+    op.execute("ALTER TABLE orders_unpartitioned RENAME CONSTRAINT orders_pkey TO orders_unpartitioned_pkey")
+    op.drop_index('ix_order_items_id', table_name='order_items_unpartitioned')
+    op.drop_index('ix_orders_telephone_e164_created_at', table_name='orders_unpartitioned')
+    op.drop_index('ix_orders_id', table_name='orders_unpartitioned')
+
+    op.create_table('orders',
+    *_order_columns('orders_id_seq'),
+    sa.PrimaryKeyConstraint('id', 'created_at'),
+    postgresql_partition_by='RANGE (created_at)'
+    )
+    op.create_index(op.f('ix_orders_id'), 'orders', ['id'], unique=False)
+    op.create_index('ix_orders_created_at', 'orders', ['created_at'], unique=False)
+    op.create_index('ix_orders_telephone_e164_created_at', 'orders', ['telephone_e164', 'created_at'], unique=False)
+
+    op.create_table('order_items',
+    *_item_columns('order_items_id_seq'),
+    sa.ForeignKeyConstraint(['order_id', 'created_at'], ['orders.id', 'orders.created_at'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id', 'created_at'),
+    postgresql_partition_by='RANGE (created_at)'
+    )
+    op.create_index(op.f('ix_order_items_id'), 'order_items', ['id'], unique=False)
+    op.create_index('ix_order_items_order_id_created_at', 'order_items', ['order_id', 'created_at'], unique=False)
+
+    oldest = conn.execute(sa.text("SELECT min(created_at) FROM orders_unpartitioned")).scalar()
+    today = datetime.now(timezone.utc).date()
+    month = _month_start((oldest or datetime.now(timezone.utc)).astimezone(timezone.utc).date())
+    last = _month_start(today, MONTHS_AHEAD)
+    while month <= last:
+        upper = _month_start(month, 1)
+        for table in ('orders', 'order_items'):
+            op.execute(f"CREATE TABLE {table}_p{month:%Y_%m} PARTITION OF {table} "
+                       f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')")
+        month = upper
+    op.execute("CREATE TABLE orders_default PARTITION OF orders DEFAULT")
+    op.execute("CREATE TABLE order_items_default PARTITION OF order_items DEFAULT")
+
+    # Items move into the partition of their order, so both can be detached together later
+    op.execute(f"""
+        INSERT INTO orders ({ORDER_COLUMNS})
+        SELECT id, coalesce(created_at, now()), updated_at, full_name, telephone, telephone_e164, status
+        FROM orders_unpartitioned
+    """)
+    op.execute(f"""
+        INSERT INTO order_items ({ITEM_COLUMNS})
+        SELECT i.id, o.created_at, i.updated_at, i.order_id, i.product_id, i.quantity, i.size, i.price,
+               i.category_id, i.sub_id, i.product_name, i.product_article, i.product_image
+        FROM order_items_unpartitioned i JOIN orders o ON o.id = i.order_id
+    """)
+    op.drop_table('order_items_unpartitioned')
+    op.drop_table('orders_unpartitioned')
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    op.execute("ALTER SEQUENCE order_items_id_seq OWNED BY order_items.id")
+
+    op.create_table('order_archives',
+    sa.Column('partition', sa.String(), nullable=False),
+    sa.Column('range_start', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('range_end', sa.DateTime(timezone=True), nullable=False),
+    sa.Column('min_order_id', sa.Integer(), nullable=True),
+    sa.Column('max_order_id', sa.Integer(), nullable=True),
+    sa.Column('orders_table', sa.String(), nullable=True),
+    sa.Column('items_table', sa.String(), nullable=True),
+    sa.Column('file_path', sa.String(), nullable=True),
+    sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('partition')
+    )
+    op.create_index(op.f('ix_order_archives_id'), 'order_archives', ['id'], unique=False)
+    op.create_index(op.f('ix_order_archives_min_order_id'), 'order_archives', ['min_order_id'], unique=False)
+    op.create_index(op.f('ix_order_archives_max_order_id'), 'order_archives', ['max_order_id'], unique=False)
+
+
+def downgrade() -> None:
+    # Archived partitions are not brought back; only the hot tier is copied
+    op.drop_index(op.f('ix_order_archives_max_order_id'), table_name='order_archives')
+    op.drop_index(op.f('ix_order_archives_min_order_id'), table_name='order_archives')
+    op.drop_index(op.f('ix_order_archives_id'), table_name='order_archives')
+    op.drop_table('order_archives')
+
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY NONE")
+    op.execute("ALTER SEQUENCE order_items_id_seq OWNED BY NONE")
+    op.create_table('orders_unpartitioned',
+    *_order_columns('orders_id_seq'),
+    sa.PrimaryKeyConstraint('id', name='orders_unpartitioned_pkey')
+    )
+    op.create_table('order_items_unpartitioned',
+    *_item_columns('order_items_id_seq'),
+    sa.PrimaryKeyConstraint('id', name='order_items_unpartitioned_pkey')
+    )
+    op.execute(f"INSERT INTO orders_unpartitioned ({ORDER_COLUMNS}) SELECT {ORDER_COLUMNS} FROM orders")
+    op.execute(f"INSERT INTO order_items_unpartitioned ({ITEM_COLUMNS}) SELECT {ITEM_COLUMNS} FROM order_items")
+    op.drop_table('order_items')
+    op.drop_table('orders')
+
+    op.rename_table('orders_unpartitioned', 'orders')
+    op.rename_table('order_items_unpartitioned', 'order_items')
+    op.execute("ALTER TABLE orders RENAME CONSTRAINT orders_unpartitioned_pkey TO orders_pkey")
+    op.execute("ALTER TABLE order_items RENAME CONSTRAINT order_items_unpartitioned_pkey TO order_items_pkey")
+    op.create_index(op.f('ix_orders_id'), 'orders', ['id'], unique=False)
+    op.create_index('ix_orders_telephone_e164_created_at', 'orders', ['telephone_e164', 'created_at'], unique=False)
+    op.create_index(op.f('ix_order_items_id'), 'order_items', ['id'], unique=False)
+    op.create_foreign_key(None, 'order_items', 'products', ['product_id'], ['id'], ondelete='CASCADE')
+    op.create_foreign_key(None, 'order_items', 'orders', ['order_id'], ['id'], ondelete='CASCADE')
+    op.execute("ALTER SEQUENCE orders_id_seq OWNED BY orders.id")
+    op.execute("ALTER SEQUENCE order_items_id_seq OWNED BY order_items.id")
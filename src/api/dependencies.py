@@ -1,10 +1,12 @@
-from fastapi import Depends, HTTPException, status
+from datetime import datetime
+from typing import Any
+from fastapi import Depends, Header, HTTPException, status
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..database.models import User
 from ..utils import get_current_user
 from ..database.database import db
-from ..database.services import ContentService, CategoryService, PageContentService, RequestItemService, RouteMappingService, SizeService, SubService, ProductService, UserService, OrderService
+from ..database.services import ContentService, CategoryService, PageContentService, RequestItemService, RouteMappingService, SizeService, SubService, ProductService, UserService, OrderService, IdempotencyService, StockService, RollupService, OrderEventService, CartService, ShippingService, ProductSalesService, ProductViewService
 
 
 async def staff_only(cur_user: User = Depends(get_current_user)):
@@ -21,6 +23,22 @@ async def admin_only(cur_user: User = Depends(get_current_user)):
     return cur_user
 
 
+def entity_tag(row: Any) -> str:
+    # The row's version is its updated_at (created_at until first updated), so clients can build
+    # the If-Match value from any response that includes the row
+    return f'"{(row.updated_at or row.created_at).isoformat()}"'
+
+
+async def if_match(if_match: str | None = Header(None)) -> datetime | None:
+    if if_match is None or if_match.strip() == "*":
+        return None
+    try:
+        return datetime.fromisoformat(if_match.strip().removeprefix("W/").strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED,
+                            detail="If-Match does not hold a valid version")
+
+
 async def get_content_service(session: AsyncSession = Depends(db.get_session)):
     yield ContentService(session)
 
@@ -59,3 +77,35 @@ async def get_page_content_service(session: AsyncSession = Depends(db.get_sessio
 
 async def get_route_mapping_service(session: AsyncSession = Depends(db.get_session)):
     yield RouteMappingService(session)
+
+
+async def get_idempotency_service(session: AsyncSession = Depends(db.get_session)):
+    yield IdempotencyService(session)
+
+
+async def get_stock_service(session: AsyncSession = Depends(db.get_session)):
+    yield StockService(session)
+
+
+async def get_rollup_service(session: AsyncSession = Depends(db.get_session)):
+    yield RollupService(session)
+
+
+async def get_order_event_service(session: AsyncSession = Depends(db.get_session)):
+    yield OrderEventService(session)
+
+
+async def get_cart_service(session: AsyncSession = Depends(db.get_session)):
+    yield CartService(session)
+
+
+async def get_shipping_service(session: AsyncSession = Depends(db.get_session)):
+    yield ShippingService(session)
+
+
+async def get_product_sales_service(session: AsyncSession = Depends(db.get_session)):
+    yield ProductSalesService(session)
+
+
+async def get_product_view_service(session: AsyncSession = Depends(db.get_session)):
+    yield ProductViewService(session)
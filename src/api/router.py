@@ -1,6 +1,6 @@
 from fastapi import APIRouter
 
-from .routes import user, category, auth, order, product, sub, request_item, size, content, page_content
+from .routes import user, category, auth, order, product, sub, request_item, size, content, page_content, stock, report, cart, shipping, autocomplete
 
 
 api_router = APIRouter(prefix="/api")
@@ -14,3 +14,8 @@ api_router.include_router(request_item.router)
 api_router.include_router(size.router)
 api_router.include_router(content.router)
 api_router.include_router(page_content.router)
+api_router.include_router(stock.router)
+api_router.include_router(report.router)
+api_router.include_router(cart.router)
+api_router.include_router(shipping.router)
+api_router.include_router(autocomplete.router)
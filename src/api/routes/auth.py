@@ -6,7 +6,9 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from src.database.schemas import Token
 from src.database.database import db
 from src.database import models
-from src.utils import pwd_context, create_access_token
+from src.utils import get_pwd_context, create_access_token
+from src.config import settings
+from src.ratelimit import limiter
 
 
 router = APIRouter(
@@ -14,8 +16,10 @@ router = APIRouter(
 )
 
 
-@router.post("/login", response_model=Token)
+@router.post("/login", response_model=Token, dependencies=[Depends(limiter.per_ip("login", settings.RATE_LIMIT_LOGIN_PER_IP))])
 async def login(user_credentials: OAuth2PasswordRequestForm = Depends(), session: AsyncSession = Depends(db.get_session)):
+    # Checked before the bcrypt verify, which is the expensive part
+    await limiter.check("login:email", user_credentials.username.strip().lower(), settings.RATE_LIMIT_LOGIN_PER_EMAIL)
     async with session:
         user = await session.scalar(select(models.User).filter(models.User.email == user_credentials.username))
 
@@ -23,7 +27,7 @@ async def login(user_credentials: OAuth2PasswordRequestForm = Depends(), session
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Invalid username or password")
 
-    if not pwd_context.verify(user_credentials.password, user.password):
+    if not get_pwd_context().verify(user_credentials.password, user.password):
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN,
                             detail="Invalid username or password")
 
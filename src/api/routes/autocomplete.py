@@ -0,0 +1,17 @@
+from typing import Sequence
+from fastapi import APIRouter, Query, status
+
+from src.autocomplete import autocomplete_index
+from src.database import schemas
+from src.config import settings
+
+
+router = APIRouter(
+    prefix="/autocomplete",
+    tags=["Autocomplete Endpoint"]
+)
+
+
+@router.get("", response_model=Sequence[schemas.AutocompleteSuggestion], status_code=status.HTTP_200_OK)
+async def autocomplete(q: str = Query(..., min_length=1, max_length=100), limit: int = Query(10, ge=1, le=settings.AUTOCOMPLETE_MAX_RESULTS)):
+    return [entry._asdict() for entry in autocomplete_index.search(q, limit)]
@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Depends, status
+
+from src.api.dependencies import get_cart_service
+from src.database.services import CartService
+from src.database import schemas
+
+
+router = APIRouter(
+    prefix="/cart",
+    tags=["Cart Endpoint"]
+)
+
+
+@router.post("/quote", response_model=schemas.CartQuote, status_code=status.HTTP_200_OK)
+async def quote_cart(cart: schemas.CartQuoteRequest, cart_service: CartService = Depends(get_cart_service)):
+    return await cart_service.quote(cart.items, zone=cart.zone)
@@ -1,11 +1,14 @@
+from datetime import datetime
 from typing import Sequence
 from fastapi import APIRouter, Depends, HTTPException, Response, status
-from slugify import slugify
+from sqlalchemy.exc import IntegrityError
 
 from src.api.dependencies import get_category_service
-from src.database.services import CategoryService
+from src.database.services import CategoryService, PreconditionFailedError
 from src.database import schemas
-from src.api.dependencies import staff_only
+from src.api.dependencies import entity_tag, if_match, staff_only
+from src.utils import slugify
+from src.autocomplete import autocomplete_index
 
 
 router = APIRouter(
@@ -22,6 +25,7 @@ async def create_new_category(category: schemas.CategoryCreate, category_service
         raise HTTPException(status_code=status.HTTP_409_CONFLICT,
                             detail="This category name is already registered.")
     new_category = await category_service.create_category(category)
+    autocomplete_index.upsert("category", new_category.id, new_category.name, new_category.slug_en)
     return new_category
 
 
@@ -35,10 +39,32 @@ async def category_update(category: schemas.CategoryUpdate, category_service: Ca
                             detail=f"Category with id: {category.id} does not exist")
 
     updated_category = await category_service.update_category(category)
+    autocomplete_index.upsert("category", updated_category.id, updated_category.name, updated_category.slug_en)
 
     return updated_category
 
 
+@router.patch("/{id}", response_model=schemas.CategoryResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def category_patch(id: int, category: schemas.CategoryPatch, response: Response, version: datetime | None = Depends(if_match), category_service: CategoryService = Depends(get_category_service)):
+    try:
+        patched_category = await category_service.patch_category(id, category, version)
+    except PreconditionFailedError as error:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(error))
+    except IntegrityError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error.orig).split("\n")[-1].replace("DETAIL:  ", "")
+        )
+
+    if not patched_category:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Category with id: {id} does not exist")
+
+    autocomplete_index.upsert("category", patched_category.id, patched_category.name, patched_category.slug_en)
+    response.headers["ETag"] = entity_tag(patched_category)
+    return patched_category
+
+
 @router.delete("/delete/{id}", response_model=schemas.CategoryResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
 async def category_delete(id: int, category_service: CategoryService = Depends(get_category_service)):
 
@@ -49,12 +75,14 @@ async def category_delete(id: int, category_service: CategoryService = Depends(g
                             detail=f"Category with id: {id} does not exist")
 
     await category_service.delete_category(id=id)
+    # Its products go with it; the index drops them on its next refresh
+    autocomplete_index.remove("category", id)
 
     return Response(status_code=status.HTTP_200_OK)
 
 
 @router.get("/{category_slug}", response_model=list[schemas.ProductResponse], status_code=status.HTTP_200_OK)
-async def fetch_category_products(category_slug: str, offset: int = 0, limit: int = 20, category_service: CategoryService = Depends(get_category_service)):
+async def fetch_category_products(category_slug: str, offset: int = 0, limit: int = 20, sort: schemas.ProductSort = schemas.ProductSort.newest, category_service: CategoryService = Depends(get_category_service)):
 
     category = await category_service.get_category_by_slug(category_slug=category_slug)
 
@@ -64,7 +92,7 @@ async def fetch_category_products(category_slug: str, offset: int = 0, limit: in
             detail=f"Category does not exist"
         )
 
-    category_products = await category_service.get_category_products(category_id=category.id, offset=offset, limit=limit)
+    category_products = await category_service.get_category_products(category_id=category.id, offset=offset, limit=limit, sort=sort)
 
     if not category_products:
         return []
@@ -1,10 +1,12 @@
+from datetime import datetime
 from typing import Sequence
 from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.exc import IntegrityError
 
 from src.api.dependencies import get_content_service, get_route_mapping_service
-from src.database.services import ContentService, RouteMappingService
+from src.database.services import ContentService, PreconditionFailedError, RouteMappingService
 from src.database import schemas
-from src.api.dependencies import staff_only
+from src.api.dependencies import entity_tag, if_match, staff_only
 
 
 router = APIRouter(
@@ -38,6 +40,26 @@ async def content_update(content: schemas.ContentUpdate, content_service: Conten
     return updated_content
 
 
+@router.patch("/{id}", response_model=schemas.ContentResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def content_patch(id: int, content: schemas.ContentPatch, response: Response, version: datetime | None = Depends(if_match), content_service: ContentService = Depends(get_content_service)):
+    try:
+        patched_content = await content_service.patch_content(id, content, version)
+    except PreconditionFailedError as error:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(error))
+    except IntegrityError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error.orig).split("\n")[-1].replace("DETAIL:  ", "")
+        )
+
+    if not patched_content:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Content with id: {id} does not exist")
+
+    response.headers["ETag"] = entity_tag(patched_content)
+    return patched_content
+
+
 @router.delete("/delete/{id}", response_model=schemas.ContentResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
 async def content_delete(id: int, content_service: ContentService = Depends(get_content_service)):
 
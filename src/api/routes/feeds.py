@@ -0,0 +1,45 @@
+from fastapi import APIRouter, HTTPException, Request, Response, status
+from fastapi.responses import StreamingResponse
+
+from src.feeds import feed_cache
+
+
+router = APIRouter(
+    tags=["Feeds Endpoint"]
+)
+
+
+@router.get("/sitemap.xml", status_code=status.HTTP_200_OK)
+async def get_sitemap_index(request: Request):
+
+    manifest = await feed_cache.refresh()
+
+    return Response(content=feed_cache.sitemap_index(manifest, base_url=str(request.base_url)), media_type="application/xml")
+
+
+@router.get("/sitemaps/{name}", status_code=status.HTTP_200_OK)
+async def get_sitemap(name: str):
+
+    try:
+        handle = await feed_cache.open_sitemap(name)
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Sitemap is being regenerated, try again later")
+
+    if handle is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Sitemap {name} does not exist")
+
+    return StreamingResponse(feed_cache.iter_sitemap(handle), media_type="application/xml")
+
+
+@router.get("/feeds/products.xml", status_code=status.HTTP_200_OK)
+async def get_product_feed():
+
+    try:
+        handles = await feed_cache.open_product_feed()
+    except FileNotFoundError:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            detail="Product feed is being regenerated, try again later")
+
+    return StreamingResponse(feed_cache.iter_product_feed(handles), media_type="application/xml")
@@ -0,0 +1,26 @@
+from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+
+from src.health import readiness
+
+
+router = APIRouter(
+    prefix="/health",
+    tags=["Health Endpoint"]
+)
+
+
+@router.get("/live", status_code=status.HTTP_200_OK)
+async def live():
+    return {"status": "ok"}
+
+
+@router.get("/ready", status_code=status.HTTP_200_OK)
+async def ready():
+
+    result = await readiness.status()
+
+    if not result["ready"]:
+        return JSONResponse(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, content=result)
+
+    return result
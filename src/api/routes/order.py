@@ -1,11 +1,17 @@
 from typing import Sequence
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, Header, HTTPException, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import IntegrityError
 
-from src.api.dependencies import get_order_service
-from src.database.services import OrderService
+from src.api.dependencies import get_idempotency_service, get_order_event_service, get_order_service
+from src.database.services import IdempotencyService, InsufficientStockError, InvalidCartError, OrderEventService, OrderService, ShippingUnavailableError
 from src.database import schemas
 from src.api.dependencies import staff_only
+from src.idempotency import run_idempotent
+from src.order_stream import stream_order_events
+from src.config import settings
+from src.ratelimit import limiter
+from src.utils import normalize_phone
 
 router = APIRouter(
     prefix="/orders",
@@ -13,20 +19,48 @@ router = APIRouter(
 )
 
 
-@router.post("/create", response_model=schemas.OrderResponse, status_code=status.HTTP_201_CREATED)
-async def create_order(order: schemas.OrderCreate, order_service: OrderService = Depends(get_order_service)):
-    try:
-        result = await order_service.create_order(order)
-
-    except IntegrityError as error:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail=str(error.orig).split("\n")[-1].replace("DETAIL:  ", "")
-        )
-    return result
-
-
-@router.put("/return", response_model=schemas.OrderResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+@router.post("/create", response_model=schemas.OrderSummaryResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(limiter.per_ip("orders:create", settings.RATE_LIMIT_ORDERS_PER_IP))])
+async def create_order(
+    order: schemas.OrderCreate,
+    idempotency_key: str | None = Header(default=None),
+    order_service: OrderService = Depends(get_order_service),
+    idempotency_service: IdempotencyService = Depends(get_idempotency_service)
+):
+    async def place_order():
+        await limiter.check("orders:create:phone", normalize_phone(order.telephone), settings.RATE_LIMIT_ORDERS_PER_PHONE)
+        try:
+            result = await order_service.create_order(order)
+
+        except IntegrityError as error:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=str(error.orig).split("\n")[-1].replace("DETAIL:  ", "")
+            )
+
+        except InsufficientStockError as error:
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT, detail=str(error))
+
+        except (InvalidCartError, ShippingUnavailableError) as error:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+        return result
+
+    if not idempotency_key:
+        return await place_order()
+
+    return await run_idempotent(
+        scope="orders:create",
+        idempotency_key=idempotency_key,
+        payload=order,
+        handler=place_order,
+        response_model=schemas.OrderSummaryResponse,
+        status_code=status.HTTP_201_CREATED,
+        service=idempotency_service
+    )
+
+
+@router.put("/return", response_model=schemas.OrderSummaryResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
 async def return_order(order: schemas.OrderUpdate, order_service: OrderService = Depends(get_order_service)):
     try:
         result = await order_service.return_order(order)
@@ -36,10 +70,18 @@ async def return_order(order: schemas.OrderUpdate, order_service: OrderService =
             status_code=status.HTTP_404_NOT_FOUND,
             detail=str(error.orig).split("\n")[-1].replace("DETAIL:  ", "")
         )
+
+    except InsufficientStockError as error:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(error))
+
+    if not result:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Order id: {order.id} doesn't exist.")
     return result
 
 
-@router.put("/update", response_model=schemas.OrderResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+@router.put("/update", response_model=schemas.OrderSummaryResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
 async def update_order_info(order: schemas.OrderUpdate, order_service: OrderService = Depends(get_order_service)):
     try:
         result = await order_service.update_order_info(order)
@@ -49,10 +91,18 @@ async def update_order_info(order: schemas.OrderUpdate, order_service: OrderServ
             status_code=status.HTTP_404_NOT_FOUND,
             detail=str(error.orig).split("\n")[-1].replace("DETAIL:  ", "")
         )
+
+    except InsufficientStockError as error:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT, detail=str(error))
+
+    if not result:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Order id: {order.id} doesn't exist.")
     return result
 
 
-@router.get("/", response_model=Sequence[schemas.OrderResponse], status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+@router.get("/", response_model=Sequence[schemas.OrderSummaryResponse], status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
 async def get_all_orders(offset: int = 0, limit: int = 20, order_service: OrderService = Depends(get_order_service)):
 
     orders = await order_service.get_all_orders(offset=offset, limit=limit)
@@ -64,10 +114,35 @@ async def get_all_orders(offset: int = 0, limit: int = 20, order_service: OrderS
     return orders
 
 
+@router.get("/customer", response_model=Sequence[schemas.OrderSummaryResponse], status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def get_customer_orders(phone: str, offset: int = 0, limit: int = 20, order_service: OrderService = Depends(get_order_service)):
+
+    if normalize_phone(phone) is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Invalid phone: {phone}")
+
+    orders = await order_service.get_customer_orders(phone_numb=phone, offset=offset, limit=limit)
+
+    if not orders:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"No orders found for phone: {phone}")
+
+    return orders
+
+
+@router.get("/stream", status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def stream_orders(last_event_id: str | None = Header(default=None), order_event_service: OrderEventService = Depends(get_order_event_service)):
+    return StreamingResponse(
+        stream_order_events(order_event_service, last_event_id),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @router.get("/{order_id}", response_model=schemas.OrderResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
 async def get_order(order_id: int, order_service: OrderService = Depends(get_order_service)):
 
-    order = await order_service.get_order_by_id(id=order_id)
+    order = await order_service.get_order_detail(id=order_id)
 
     if not order:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
@@ -79,8 +154,12 @@ async def get_order(order_id: int, order_service: OrderService = Depends(get_ord
 @router.delete("/delete/{id}", status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
 async def update_order_info(id: int, order_service: OrderService = Depends(get_order_service)):
     try:
-        await order_service.delete_order(id)
+        deleted_order = await order_service.delete_order(id)
     except:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="Order has been not found")
+
+    if not deleted_order:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Order has been not found")
     return {"detail": f"Order with id: {id} has been successfully deleted"}
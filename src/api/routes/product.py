@@ -1,11 +1,15 @@
+from datetime import datetime
 from typing import Sequence
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.exc import IntegrityError
 
-from src.api.dependencies import get_product_service
-from src.database.services import ProductService
+from src.api.dependencies import get_product_sales_service, get_product_service
+from src.database.services import EmptySelectionError, PreconditionFailedError, ProductSalesService, ProductService
 from src.database import schemas
-from src.api.dependencies import staff_only
+from src.api.dependencies import entity_tag, if_match, staff_only
+from src.config import settings
+from src.view_counter import product_views
+from src.autocomplete import autocomplete_index
 
 router = APIRouter(
     prefix="/products",
@@ -23,6 +27,7 @@ async def create_product(product: schemas.ProductCreate, product_service: Produc
             status_code=status.HTTP_400_BAD_REQUEST,
             detail=str(error.orig).split("\n")[-1].replace("DETAIL:  ", "")
         )
+    autocomplete_index.upsert_product(result)
     return result
 
 
@@ -41,9 +46,31 @@ async def update_product(product: schemas.ProductUpdate, product_service: Produc
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail="Product not found")
 
+    autocomplete_index.upsert_product(result)
     return result
 
 
+@router.patch("/{id}", response_model=schemas.ProductResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def patch_product(id: int, product: schemas.ProductPatch, response: Response, version: datetime | None = Depends(if_match), product_service: ProductService = Depends(get_product_service)):
+    try:
+        patched_product = await product_service.patch_product(id, product, version)
+    except PreconditionFailedError as error:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(error))
+    except IntegrityError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error.orig).split("\n")[-1].replace("DETAIL:  ", "")
+        )
+
+    if not patched_product:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Product with id: {id} does not exist")
+
+    autocomplete_index.upsert_product(patched_product)
+    response.headers["ETag"] = entity_tag(patched_product)
+    return patched_product
+
+
 @router.delete("/delete/{id}", status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
 async def delete_product(id: int, product_service: ProductService = Depends(get_product_service)):
 
@@ -52,9 +79,140 @@ async def delete_product(id: int, product_service: ProductService = Depends(get_
     except:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
                             detail="Product has been not found")
+    autocomplete_index.remove("product", id)
     return {"detail": f"Product with id: {id} has been successfully deleted"}
 
 
+async def _run_bulk(operation, bulk: schemas.ProductSelection) -> dict:
+    if bulk.ids and len(bulk.ids) > settings.PRODUCT_BULK_MAX_IDS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"At most {settings.PRODUCT_BULK_MAX_IDS} ids can be passed at once, use a filter instead")
+    try:
+        return await operation(bulk)
+    except EmptySelectionError as error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+    except IntegrityError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error.orig).split("\n")[-1].replace("DETAIL:  ", "")
+        )
+
+
+@router.post("/bulk/price", response_model=schemas.ProductBulkResult, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def bulk_update_prices(bulk: schemas.ProductBulkPrice, product_service: ProductService = Depends(get_product_service)):
+    return await _run_bulk(product_service.bulk_update_prices, bulk)
+
+
+@router.post("/bulk/status", response_model=schemas.ProductBulkResult, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def bulk_update_status(bulk: schemas.ProductBulkStatus, product_service: ProductService = Depends(get_product_service)):
+    return await _run_bulk(product_service.bulk_update_status, bulk)
+
+
+@router.post("/bulk/move", response_model=schemas.ProductBulkResult, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def bulk_move_products(bulk: schemas.ProductBulkMove, product_service: ProductService = Depends(get_product_service)):
+    if bulk.category_id is None and bulk.sub_id is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Pass category_id and/or sub_id to move products to")
+    return await _run_bulk(product_service.bulk_move_products, bulk)
+
+
+@router.post("/bulk/delete", response_model=schemas.ProductBulkResult, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def bulk_delete_products(bulk: schemas.ProductSelection, product_service: ProductService = Depends(get_product_service)):
+    result = await _run_bulk(product_service.bulk_delete_products, bulk)
+    if not bulk.dry_run:
+        # Only the sampled ids are known here, the rest drop out on the next index refresh
+        for id in result["ids"]:
+            autocomplete_index.remove("product", id)
+    return result
+
+
+@router.get("/catalog", response_model=schemas.CatalogResponse, status_code=status.HTTP_200_OK)
+async def get_catalog(
+    category_id: int = None,
+    sub_id: int = None,
+    min_price: int = None,
+    max_price: int = None,
+    origin: list[str] = Query(None),
+    size: list[str] = Query(None),
+    product_status: str = Query(None, alias="status"),
+    on_sale: bool = None,
+    sort: schemas.ProductSort = schemas.ProductSort.newest,
+    offset: int = 0,
+    limit: int = 20,
+    product_service: ProductService = Depends(get_product_service)
+):
+    catalog_filter = schemas.CatalogFilter(
+        category_id=category_id,
+        sub_id=sub_id,
+        min_price=min_price,
+        max_price=max_price,
+        origin=origin,
+        size=size,
+        status=product_status,
+        on_sale=on_sale
+    )
+    return await product_service.get_catalog(catalog_filter=catalog_filter, sort=sort, offset=offset, limit=limit)
+
+
+@router.get("/batch", response_model=schemas.ProductBatchResponse, status_code=status.HTTP_200_OK)
+async def get_products_batch(
+    ids: list[str] = Query(None),
+    slugs: list[str] = Query(None),
+    product_service: ProductService = Depends(get_product_service)
+):
+    # Accepts both ?ids=1&ids=2 and ?ids=1,2
+    product_slugs = list(dict.fromkeys(slug.strip() for value in slugs or [] for slug in value.split(",") if slug.strip()))
+    try:
+        product_ids = list(dict.fromkeys(int(id) for value in ids or [] for id in value.split(",") if id.strip()))
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="ids must be integers")
+
+    if len(product_ids) + len(product_slugs) > settings.PRODUCT_BATCH_MAX_KEYS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"At most {settings.PRODUCT_BATCH_MAX_KEYS} products can be requested at once")
+
+    return await product_service.get_products_batch(ids=product_ids, slugs=product_slugs)
+
+
+@router.get("/sale", response_model=Sequence[schemas.ProductResponse], status_code=status.HTTP_200_OK)
+async def get_sale_products(
+    sort: schemas.ProductSort = schemas.ProductSort.price_asc,
+    offset: int = 0,
+    limit: int = 20,
+    product_service: ProductService = Depends(get_product_service)
+):
+    return await product_service.get_sale_products(offset=offset, limit=limit, sort=sort)
+
+
+@router.get("/popular", response_model=Sequence[schemas.ProductResponse], status_code=status.HTTP_200_OK)
+async def get_popular_products(
+    metric: schemas.PopularityMetric = schemas.PopularityMetric.units,
+    category_id: int = None,
+    sub_id: int = None,
+    limit: int = Query(10, ge=1, le=settings.PRODUCT_POPULAR_MAX),
+    product_sales_service: ProductSalesService = Depends(get_product_sales_service)
+):
+    return await product_sales_service.get_popular_products(metric=metric, limit=limit, category_id=category_id, sub_id=sub_id)
+
+
+@router.get("/{product_slug}/related", response_model=Sequence[schemas.ProductResponse], status_code=status.HTTP_200_OK)
+async def get_related_products(
+    product_slug: str,
+    limit: int = Query(settings.RELATED_PRODUCTS_K, ge=1, le=settings.RELATED_PRODUCTS_K),
+    product_service: ProductService = Depends(get_product_service)
+):
+
+    result = await product_service.get_related_products(slug=product_slug, limit=limit)
+
+    if result is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Product {product_slug} does not exist"
+        )
+    return result
+
+
 @router.get("/{product_slug}", response_model=schemas.ProductResponse, status_code=status.HTTP_200_OK)
 async def get_product(product_slug: str, product_service: ProductService = Depends(get_product_service)):
 
@@ -65,6 +223,7 @@ async def get_product(product_slug: str, product_service: ProductService = Depen
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Product with key id: {id} does not exists"
         )
+    product_views.record(result.id)
     return result
 
 
@@ -73,10 +232,11 @@ async def get_all_products(
     offset: int = 0,
     limit: int = 20,
     search: str = None,
+    sort: schemas.ProductSort = schemas.ProductSort.newest,
     product_service: ProductService = Depends(get_product_service)
 ):
 
-    result = await product_service.get_all_products(offset=offset, limit=limit, search_query=search)
+    result = await product_service.get_all_products(offset=offset, limit=limit, search_query=search, sort=sort)
 
     if not result:
         raise HTTPException(
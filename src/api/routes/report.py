@@ -0,0 +1,69 @@
+import csv
+import io
+from datetime import date
+from typing import Sequence
+from fastapi import APIRouter, Depends, Query, status
+from fastapi.responses import StreamingResponse
+
+from src.api.dependencies import get_product_view_service, get_rollup_service
+from src.database.services import ProductViewService, RollupService
+from src.database import schemas
+from src.api.dependencies import admin_only, staff_only
+
+
+router = APIRouter(
+    prefix="/reports",
+    tags=["Reports Endpoint"]
+)
+
+
+@router.get("/sales", response_model=Sequence[schemas.SalesReportRow], status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def get_sales_report(
+    group_by: schemas.ReportGroupBy = schemas.ReportGroupBy.day,
+    date_from: date = None,
+    date_to: date = None,
+    order_status: list[str] = Query(None, alias="status"),
+    rollup_service: RollupService = Depends(get_rollup_service)
+):
+    return await rollup_service.get_sales_report(group_by=group_by, date_from=date_from, date_to=date_to, statuses=order_status)
+
+
+@router.get("/sales.csv", status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def export_sales_report(
+    group_by: schemas.ReportGroupBy = schemas.ReportGroupBy.day,
+    date_from: date = None,
+    date_to: date = None,
+    order_status: list[str] = Query(None, alias="status"),
+    rollup_service: RollupService = Depends(get_rollup_service)
+):
+    async def csv_rows():
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["key", "label", "orders", "units", "revenue"])
+        async for row in rollup_service.stream_sales_report(group_by=group_by, date_from=date_from, date_to=date_to, statuses=order_status):
+            writer.writerow([row["key"], row["label"], row["orders"], row["units"], row["revenue"]])
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        yield buffer.getvalue()
+
+    return StreamingResponse(csv_rows(), media_type="text/csv", headers={
+        "Content-Disposition": f'attachment; filename="sales-by-{group_by.value}.csv"'})
+
+
+@router.get("/product-views", response_model=Sequence[schemas.ProductViewsRow], status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def get_product_views_report(
+    date_from: date = None,
+    date_to: date = None,
+    limit: int = Query(100, ge=1, le=1000),
+    product_view_service: ProductViewService = Depends(get_product_view_service)
+):
+    return await product_view_service.get_views_report(date_from=date_from, date_to=date_to, limit=limit)
+
+
+@router.post("/rebuild", status_code=status.HTTP_200_OK, dependencies=[Depends(admin_only)])
+async def rebuild_reports(rollup_service: RollupService = Depends(get_rollup_service)):
+
+    await rollup_service.rebuild()
+
+    return {"detail": "Sales rollups have been rebuilt"}
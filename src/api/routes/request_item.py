@@ -5,6 +5,10 @@ from src.api.dependencies import get_request_item_service
 from src.database.services import RequestItemService
 from src.database import schemas
 from src.api.dependencies import staff_only
+from src.config import settings
+from src.lead_buffer import lead_buffer
+from src.ratelimit import limiter
+from src.utils import normalize_phone
 
 
 router = APIRouter(
@@ -13,9 +17,16 @@ router = APIRouter(
 )
 
 
-@router.post("/create", response_model=schemas.RequestItem, status_code=status.HTTP_201_CREATED)
+@router.post("/create", response_model=schemas.RequestItemAccepted, status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(limiter.per_ip("request:create", settings.RATE_LIMIT_REQUESTS_PER_IP))])
 async def create_new_request_item(request_item: schemas.RequestItemCreate, request_item_service: RequestItemService = Depends(get_request_item_service)):
-    return await request_item_service.create_request_item(request_item)
+    await limiter.check("request:create:phone", normalize_phone(request_item.telephone), settings.RATE_LIMIT_REQUESTS_PER_PHONE)
+
+    if not settings.LEAD_BUFFER_ENABLED:
+        await request_item_service.create_request_item(request_item)
+        return {"submission_id": None, "duplicate": False}
+
+    submission_id, duplicate = lead_buffer.submit(request_item)
+    return {"submission_id": submission_id, "duplicate": duplicate}
 
 
 @router.delete("/delete/{id}", response_model=schemas.RequestItem, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
@@ -0,0 +1,79 @@
+from typing import Sequence
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.exc import IntegrityError
+
+from src.api.dependencies import get_shipping_service
+from src.database.services import ShippingService, ShippingUnavailableError
+from src.database import schemas
+from src.api.dependencies import staff_only
+
+
+router = APIRouter(
+    prefix="/shipping",
+    tags=["Shipping Endpoint"]
+)
+
+
+@router.post("/quote", response_model=schemas.ShippingQuote, status_code=status.HTTP_200_OK)
+async def quote_shipping(quote: schemas.ShippingQuoteRequest, shipping_service: ShippingService = Depends(get_shipping_service)):
+    try:
+        return await shipping_service.quote(quote)
+    except ShippingUnavailableError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=str(error))
+
+
+@router.post("/zones", response_model=schemas.ShippingZoneResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(staff_only)])
+async def create_zone(zone: schemas.ShippingZoneCreate, shipping_service: ShippingService = Depends(get_shipping_service)):
+    try:
+        return await shipping_service.create_zone(zone)
+    except IntegrityError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=f"Shipping zone with code: {zone.code} already exists")
+
+
+@router.get("/zones", response_model=Sequence[schemas.ShippingZoneResponse], status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def get_all_zones(shipping_service: ShippingService = Depends(get_shipping_service)):
+    return await shipping_service.get_all_zones()
+
+
+@router.put("/zones/{id}", response_model=schemas.ShippingZoneResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def update_zone(id: int, zone: schemas.ShippingZoneCreate, shipping_service: ShippingService = Depends(get_shipping_service)):
+    try:
+        updated_zone = await shipping_service.update_zone(id, zone)
+    except IntegrityError:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail=f"Shipping zone with code: {zone.code} already exists")
+
+    if not updated_zone:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Shipping zone with id: {id} does not exist")
+
+    return updated_zone
+
+
+@router.put("/zones/{id}/rates", response_model=schemas.ShippingZoneResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def set_zone_rates(id: int, rates: list[schemas.ShippingRateCreate], shipping_service: ShippingService = Depends(get_shipping_service)):
+    try:
+        zone = await shipping_service.set_zone_rates(id, rates)
+    except IntegrityError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Rates repeat the same origin and max_weight")
+
+    if not zone:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Shipping zone with id: {id} does not exist")
+
+    return zone
+
+
+@router.delete("/zones/{id}", status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def delete_zone(id: int, shipping_service: ShippingService = Depends(get_shipping_service)):
+
+    deleted_zone = await shipping_service.delete_zone(id)
+
+    if not deleted_zone:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Shipping zone with id: {id} does not exist")
+
+    return Response(status_code=status.HTTP_200_OK)
@@ -0,0 +1,51 @@
+from typing import Sequence
+from fastapi import APIRouter, Depends, HTTPException, status
+from sqlalchemy.exc import IntegrityError
+
+from src.api.dependencies import get_stock_service
+from src.database.services import StockService
+from src.database import schemas
+from src.api.dependencies import staff_only
+
+
+router = APIRouter(
+    prefix="/stock",
+    tags=["Stock Endpoint"]
+)
+
+
+@router.put("/update", response_model=schemas.StockResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def stock_update(stock: schemas.StockUpdate, stock_service: StockService = Depends(get_stock_service)):
+    try:
+        result = await stock_service.set_stock(stock)
+
+    except IntegrityError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error.orig).split("\n")[-1].replace("DETAIL:  ", "")
+        )
+    return result
+
+
+@router.delete("/delete/{id}", status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def stock_delete(id: int, stock_service: StockService = Depends(get_stock_service)):
+
+    deleted_stock = await stock_service.delete_stock(id=id)
+
+    if not deleted_stock:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Stock with id: {id} does not exist")
+
+    return {"detail": f"Stock with id: {id} has been successfully deleted"}
+
+
+@router.get("/{product_id}", response_model=Sequence[schemas.StockResponse], status_code=status.HTTP_200_OK)
+async def get_product_stock(product_id: int, stock_service: StockService = Depends(get_stock_service)):
+
+    stock = await stock_service.get_product_stock(product_id=product_id)
+
+    if not stock:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Product id: {product_id} has no stock records")
+
+    return stock
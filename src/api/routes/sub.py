@@ -1,10 +1,13 @@
+from datetime import datetime
 from typing import Sequence
 from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.exc import IntegrityError
 
 from src.api.dependencies import get_sub_service
-from src.database.services import SubService
+from src.database.services import PreconditionFailedError, SubService
 from src.database import schemas
-from src.api.dependencies import staff_only
+from src.api.dependencies import entity_tag, if_match, staff_only
+from src.autocomplete import autocomplete_index
 
 
 router = APIRouter(
@@ -21,6 +24,7 @@ async def create_new_sub(sub: schemas.SubCreate, sub_service: SubService = Depen
         raise HTTPException(status_code=status.HTTP_409_CONFLICT,
                             detail="This subcategory name is already registered.")
     new_sub = await sub_service.create_sub(sub)
+    autocomplete_index.upsert("sub", new_sub.id, new_sub.name, new_sub.slug_en)
     return new_sub
 
 
@@ -34,10 +38,32 @@ async def sub_update(sub: schemas.SubUpdate, sub_service: SubService = Depends(g
                             detail=f"Sub with id: {sub.id} does not exist")
 
     updated_sub = await sub_service.update_sub(sub)
+    autocomplete_index.upsert("sub", updated_sub.id, updated_sub.name, updated_sub.slug_en)
 
     return updated_sub
 
 
+@router.patch("/{id}", response_model=schemas.SubResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
+async def sub_patch(id: int, sub: schemas.SubPatch, response: Response, version: datetime | None = Depends(if_match), sub_service: SubService = Depends(get_sub_service)):
+    try:
+        patched_sub = await sub_service.patch_sub(id, sub, version)
+    except PreconditionFailedError as error:
+        raise HTTPException(status_code=status.HTTP_412_PRECONDITION_FAILED, detail=str(error))
+    except IntegrityError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error.orig).split("\n")[-1].replace("DETAIL:  ", "")
+        )
+
+    if not patched_sub:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Sub with id: {id} does not exist")
+
+    autocomplete_index.upsert("sub", patched_sub.id, patched_sub.name, patched_sub.slug_en)
+    response.headers["ETag"] = entity_tag(patched_sub)
+    return patched_sub
+
+
 @router.delete("/delete", response_model=schemas.SubResponse, status_code=status.HTTP_200_OK, dependencies=[Depends(staff_only)])
 async def sub_delete(id: int, sub_service: SubService = Depends(get_sub_service)):
 
@@ -48,14 +74,15 @@ async def sub_delete(id: int, sub_service: SubService = Depends(get_sub_service)
                             detail=f"Sub with id: {id} does not exist")
 
     deleted_sub = await sub_service.delete_sub(id=id)
+    autocomplete_index.remove("sub", id)
 
     return Response(status_code=status.HTTP_200_OK, content=f"Subcategory with id: {deleted_sub.id} has been deleted")
 
 
 @router.get("/{id}", response_model=list[schemas.ProductResponse], status_code=status.HTTP_200_OK)
-async def fetch_sub_products(id: int, offset: int = 0, limit: int = 20, sub_service: SubService = Depends(get_sub_service)):
+async def fetch_sub_products(id: int, offset: int = 0, limit: int = 20, sort: schemas.ProductSort = schemas.ProductSort.newest, sub_service: SubService = Depends(get_sub_service)):
 
-    sub_products = await sub_service.get_sub_products(sub_id=id, offset=offset, limit=limit)
+    sub_products = await sub_service.get_sub_products(sub_id=id, offset=offset, limit=limit, sort=sort)
 
     if not sub_products:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
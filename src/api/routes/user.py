@@ -4,6 +4,8 @@ from fastapi import APIRouter, Depends, HTTPException, Response, status
 from ..dependencies import get_user_service, admin_only
 from src.database import schemas
 from src.database.services import UserService
+from src.config import settings
+from src.ratelimit import limiter
 
 
 router = APIRouter(
@@ -12,7 +14,7 @@ router = APIRouter(
 )
 
 
-@router.post("/register/superuser", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED)
+@router.post("/register/superuser", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED, dependencies=[Depends(limiter.per_ip("users:register", settings.RATE_LIMIT_REGISTER_PER_IP))])
 async def create_new_superuser(user_credentials: schemas.UserCreate, user_service: UserService = Depends(get_user_service)):
 
     user_exists = await user_service.get_user_by_email(email=user_credentials.email)
@@ -0,0 +1,121 @@
+# Moves old monthly partitions of orders/order_items out of the hot tables.
+#
+#   python -m src.archive --older-than-days 365 --mode detach
+#   python -m src.archive --older-than-days 365 --mode export
+#
+# detach keeps each month as a pair of standalone tables; export also writes already detached
+# months to gzipped JSONL in ORDER_ARCHIVE_DIR and drops the tables. Either way the month is
+# recorded in order_archives, which OrderService.get_order_by_id falls back to.
+import argparse
+import asyncio
+import gzip
+import os
+import re
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import insert, select, text, update
+
+from .config import settings
+from .database import models
+from .database.database import db
+from .database.services import archived_orders_sql
+from .partitions import partition_bounds, partition_name
+
+
+PARTITION_PATTERN = re.compile(r"orders_p(\d{4})_(\d{2})")
+
+
+async def archivable_months(cutoff: datetime) -> list[date]:
+    async with db.engine.connect() as conn:
+        names = await conn.scalars(text("""
+            SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+            WHERE i.inhparent = 'orders'::regclass
+        """))
+        months = []
+        for name in names:
+            match = PARTITION_PATTERN.fullmatch(name)
+            if match:
+                month = date(int(match[1]), int(match[2]), 1)
+                if partition_bounds(month)[1] <= cutoff:
+                    months.append(month)
+    return sorted(months)
+
+
+async def detach_month(month: date) -> None:
+    orders_table = partition_name("orders", month)
+    items_table = partition_name("order_items", month)
+    range_start, range_end = partition_bounds(month)
+
+    async with db.engine.begin() as conn:
+        min_id, max_id = (await conn.execute(text(f"SELECT min(id), max(id) FROM {orders_table}"))).one()
+
+        # Items go first and lose their foreign key to orders, otherwise the orders partition
+        # could not be detached while archived items still point at it
+        await conn.execute(text(f"ALTER TABLE order_items DETACH PARTITION {items_table}"))
+        constraints = await conn.scalars(text("""
+            SELECT conname FROM pg_constraint
+            WHERE conrelid = CAST(:table AS regclass) AND contype = 'f' AND confrelid = 'orders'::regclass
+        """), {"table": items_table})
+        for constraint in constraints.all():
+            await conn.execute(text(f'ALTER TABLE {items_table} DROP CONSTRAINT "{constraint}"'))
+        await conn.execute(text(f"ALTER TABLE orders DETACH PARTITION {orders_table}"))
+
+        await conn.execute(insert(models.OrderArchive).values(
+            partition=f"{month:%Y_%m}",
+            range_start=range_start,
+            range_end=range_end,
+            min_order_id=min_id,
+            max_order_id=max_id,
+            orders_table=orders_table,
+            items_table=items_table,
+        ))
+
+
+async def export_archive(archive: models.OrderArchive) -> str:
+    os.makedirs(settings.ORDER_ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(settings.ORDER_ARCHIVE_DIR, f"orders_{archive.partition}.jsonl.gz")
+    tmp_path = f"{path}.tmp"
+
+    # Lines are written in id order, which lets lookups stop scanning early
+    async with db.engine.connect() as conn:
+        result = await conn.stream(text(archived_orders_sql(
+            archive.orders_table, archive.items_table)).execution_options(yield_per=1000))
+        with gzip.open(tmp_path, "wt", encoding="utf-8") as file:
+            async for (line,) in result:
+                file.write(line)
+                file.write("\n")
+    os.replace(tmp_path, path)
+
+    async with db.engine.begin() as conn:
+        await conn.execute(update(models.OrderArchive).where(models.OrderArchive.id == archive.id).values(
+            file_path=path, orders_table=None, items_table=None))
+        await conn.execute(text(f"DROP TABLE {archive.items_table}"))
+        await conn.execute(text(f"DROP TABLE {archive.orders_table}"))
+    return path
+
+
+async def main(older_than_days: int, mode: str) -> None:
+    db.engine.echo = False
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+
+    for month in await archivable_months(cutoff):
+        await detach_month(month)
+        print(f"detached {partition_name('orders', month)} and {partition_name('order_items', month)}")
+
+    if mode == "export":
+        async with db.session_factory() as session:
+            archives = (await session.scalars(select(models.OrderArchive).where(
+                models.OrderArchive.orders_table.isnot(None),
+                models.OrderArchive.range_end <= cutoff
+            ).order_by(models.OrderArchive.range_start))).all()
+        for archive in archives:
+            print(f"exported {archive.orders_table} to {await export_archive(archive)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--older-than-days", type=int, required=True)
+    parser.add_argument("--mode", choices=["detach", "export"], default="detach")
+    args = parser.parse_args()
+    if args.older_than_days < 1:
+        parser.error("--older-than-days must be positive")
+    asyncio.run(main(args.older_than_days, args.mode))
@@ -0,0 +1,145 @@
+import asyncio
+import heapq
+import logging
+import re
+from bisect import bisect_left, insort
+from typing import Any, NamedTuple
+from sqlalchemy import func, select
+from text_unidecode import unidecode
+
+from .config import settings
+from .database import models
+from .database.database import db
+from .database.services import PRODUCT_ACTIVE_STATUS
+
+
+logger = logging.getLogger(__name__)
+
+WORD = re.compile(r"\w+")
+# Categories and subs are suggested ahead of products that match equally
+KIND_PRIORITY = {"category": 0, "sub": 1, "product": 2}
+
+
+class Entry(NamedTuple):
+    kind: str
+    id: int
+    label: str
+    slug: str | None
+    score: float
+    terms: frozenset[str]
+
+
+def normalize(text: str) -> list[str]:
+    # Every word in its own script and transliterated, so "кроссовки" and "krossovki" both
+    # reach Cyrillic and Latin names
+    words = []
+    for word in WORD.findall(text.lower()):
+        words.append(word)
+        latin = "".join(WORD.findall(unidecode(word).lower()))
+        if latin and latin != word:
+            words.append(latin)
+    return words
+
+
+# Per-worker prefix index over product names and articles, category and sub names. Terms are
+# kept in one sorted list, so the terms starting with a prefix are a contiguous range found by
+# bisect. Requests never touch the database: the index is loaded by maintain(), which reloads
+# it when a version query shows changes from other workers, and product and catalog routes of
+# this worker apply their own changes straight away
+class AutocompleteIndex:
+    def __init__(self, scan_limit: int) -> None:
+        self.scan_limit = scan_limit
+        self._entries: dict[tuple[str, int], Entry] = {}
+        self._terms: list[tuple[str, str, int]] = []
+        self._version: tuple[Any, ...] | None = None
+
+    def search(self, query: str, limit: int) -> list[Entry]:
+        words = WORD.findall(query.lower())
+        if not words:
+            return []
+        variants = [set(normalize(word)) or {word} for word in words]
+
+        # The range of the last (usually still being typed) word, the others must match too
+        found = set()
+        for prefix in variants[-1]:
+            index = bisect_left(self._terms, (prefix,))
+            scanned = 0
+            while index < len(self._terms) and self._terms[index][0].startswith(prefix) and scanned < self.scan_limit:
+                found.add(self._terms[index][1:])
+                index += 1
+                scanned += 1
+
+        matches = []
+        for key in found:
+            entry = self._entries[key]
+            if all(any(term.startswith(prefix) for term in entry.terms for prefix in options) for options in variants[:-1]):
+                matches.append(entry)
+        return heapq.nsmallest(limit, matches, key=lambda entry: (
+            KIND_PRIORITY[entry.kind], -entry.score, entry.label))
+
+    def upsert(self, kind: str, id: int, label: str, slug: str | None, extra: str = "", score: float | None = None) -> None:
+        previous = self._entries.get((kind, id))
+        if score is None:
+            score = previous.score if previous else 0.0
+        self.remove(kind, id)
+        entry = Entry(kind, id, label, slug, score, frozenset(normalize(f"{label} {extra}")))
+        self._entries[(kind, id)] = entry
+        for term in entry.terms:
+            insort(self._terms, (term, kind, id))
+
+    def remove(self, kind: str, id: int) -> None:
+        entry = self._entries.pop((kind, id), None)
+        if entry is None:
+            return
+        for term in entry.terms:
+            index = bisect_left(self._terms, (term, kind, id))
+            if index < len(self._terms) and self._terms[index] == (term, kind, id):
+                del self._terms[index]
+
+    def upsert_product(self, product: Any) -> None:
+        if product.status != PRODUCT_ACTIVE_STATUS:
+            self.remove("product", product.id)
+            return
+        self.upsert("product", product.id, product.name, product.slug_en, extra=product.article)
+
+    async def refresh(self) -> bool:
+        async with db.session_factory() as session:
+            versions = []
+            for model in (models.Product, models.Category, models.Sub):
+                versions.extend((await session.execute(select(
+                    func.count(model.id), func.max(func.coalesce(model.updated_at, model.created_at))))).one())
+            version = tuple(versions)
+            if version == self._version:
+                return False
+
+            products = await session.execute(select(
+                models.Product.id, models.Product.name, models.Product.article, models.Product.slug_en,
+                func.coalesce(models.ProductSalesStats.units, 0)
+            ).outerjoin(models.ProductSalesStats).where(models.Product.status == PRODUCT_ACTIVE_STATUS))
+            categories = await session.execute(select(models.Category.id, models.Category.name, models.Category.slug_en))
+            subs = await session.execute(select(models.Sub.id, models.Sub.name, models.Sub.slug_en))
+
+        # Built aside and swapped in, so searches meanwhile keep using the old index
+        entries = {}
+        for id, name, article, slug, units in products:
+            entries[("product", id)] = Entry("product", id, name, slug, float(units),
+                                             frozenset(normalize(f"{name} {article}")))
+        for kind, rows in (("category", categories), ("sub", subs)):
+            for id, name, slug in rows:
+                entries[(kind, id)] = Entry(kind, id, name, slug, 0.0, frozenset(normalize(name)))
+        self._terms = sorted((term, kind, id) for (kind, id), entry in entries.items() for term in entry.terms)
+        self._entries = entries
+        self._version = version
+        return True
+
+    async def maintain(self) -> None:
+        while True:
+            try:
+                if await self.refresh():
+                    logger.info("Loaded %s autocomplete entries", len(self._entries))
+            except Exception:
+                logger.exception("Autocomplete index refresh failed")
+            await asyncio.sleep(settings.AUTOCOMPLETE_REFRESH_SECONDS)
+
+
+autocomplete_index = AutocompleteIndex(scan_limit=settings.AUTOCOMPLETE_SCAN_LIMIT)
@@ -8,11 +8,134 @@ load_dotenv()
 
 class Settings(BaseSettings):
     SQLALCHEMY_DATABASE_URI = os.getenv("DB_URL_ASYNCPG")
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_WARM_CONNECTIONS: int = 5
+
+    MIGRATIONS_DIR: str = "migrations"
+    HEALTH_CACHE_SECONDS: float = 5.0
+    HEALTH_CHECK_TIMEOUT_SECONDS: float = 2.0
+
+    PRODUCT_BATCH_MAX_KEYS: int = 100
+    PRODUCT_LOADER_SHARED: bool = False
+    # Changing the half-life needs product_sales_stats.trend_score to be recomputed
+    PRODUCT_TREND_HALF_LIFE_HOURS: float = 72.0
+    # 30 days is 10 half-lives: stored weights stay below 2^11 or so between rebases
+    PRODUCT_TREND_REBASE_DAYS: int = 30
+    PRODUCT_TREND_REBASE_CHECK_SECONDS: int = 60 * 60 * 6
+    PRODUCT_POPULAR_CACHE_SECONDS: float = 60.0 * 5
+    PRODUCT_POPULAR_CACHE_KEYS: int = 1000
+    PRODUCT_POPULAR_MAX: int = 100
+    PRODUCT_VIEWS_ENABLED: bool = True
+    PRODUCT_VIEWS_FLUSH_SECONDS: float = 10.0
+    PRODUCT_VIEWS_MAX_KEYS: int = 10_000
+    PRODUCT_VIEWS_WINDOW_DAYS: int = 30
+    PRODUCT_BULK_CHUNK_SIZE: int = 1000
+    PRODUCT_BULK_MAX_IDS: int = 10_000
+    PRODUCT_BULK_SAMPLE_IDS: int = 100
+    RELATED_PRODUCTS_K: int = 12
+    RELATED_BATCH_ORDERS: int = 10_000
+    RELATED_MAX_ORDER_PRODUCTS: int = 50
+    RELATED_LAG_SECONDS: int = 60 * 5
+    RELATED_REFRESH_SECONDS: int = 60 * 10
+
+    AUTOCOMPLETE_REFRESH_SECONDS: float = 60.0
+    AUTOCOMPLETE_MAX_RESULTS: int = 20
+    AUTOCOMPLETE_SCAN_LIMIT: int = 5000
+
+    SHIPPING_CACHE_SECONDS: float = 60.0
 
     SECRET_KEY: str = secrets.token_urlsafe(32)
     ALGORITHM: str = "HS256"
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 60 * 24 * 7
 
+    IDEMPOTENCY_KEY_TTL_HOURS: int = 24
+    IDEMPOTENCY_CACHE_SIZE: int = 10_000
+    IDEMPOTENCY_WAIT_SECONDS: float = 10.0
+    # A claim with no response after this long is treated as crashed and may be taken over
+    IDEMPOTENCY_LOCK_SECONDS: int = 60
+    IDEMPOTENCY_CLEANUP_INTERVAL_SECONDS: int = 60 * 10
+    IDEMPOTENCY_CLEANUP_BATCH_SIZE: int = 1000
+
+    SITE_URL: str = "http://localhost:3000"
+    SITEMAP_PRODUCT_PATH: str = "/products/{slug}"
+    SITEMAP_CATEGORY_PATH: str = "/categories/{slug}"
+    SITEMAP_SUB_PATH: str = "/sub/{id}"
+    SITEMAP_MAX_URLS: int = 50_000
+    FEED_CACHE_DIR: str = "media/feeds"
+    FEED_REFRESH_SECONDS: int = 60 * 5
+    FEED_TITLE: str = "Opt_expert"
+    FEED_CURRENCY: str = "KZT"
+    FEED_WEIGHT_UNIT: str = "kg"
+
+    REPORT_TIMEZONE: str = "Asia/Almaty"
+
+    PHONE_COUNTRY_CODE: str = "7"
+    PHONE_TRUNK_PREFIX: str = "8"
+    PHONE_NATIONAL_LENGTH: int = 10
+
+    ORDER_PARTITION_MONTHS_AHEAD: int = 3
+    ORDER_PARTITION_CHECK_INTERVAL_SECONDS: int = 60 * 60 * 6
+    ORDER_ARCHIVE_DIR: str = "media/archive"
+
+    TASK_WORKERS: int = 4
+    TASK_QUEUE_SIZE: int = 1000
+    TASK_QUEUE_DURABLE: bool = False
+    TASK_MAX_ATTEMPTS: int = 5
+    TASK_RETRY_BASE_SECONDS: float = 1.0
+    TASK_RETRY_MAX_SECONDS: float = 60.0 * 5
+    TASK_POLL_INTERVAL_SECONDS: float = 1.0
+    TASK_LOCK_SECONDS: int = 60 * 5
+    TASK_DRAIN_TIMEOUT_SECONDS: float = 30.0
+
+    OUTBOX_BATCH_SIZE: int = 100
+    OUTBOX_POLL_INTERVAL_SECONDS: float = 2.0
+    OUTBOX_MAX_ATTEMPTS: int = 10
+    OUTBOX_RETRY_BASE_SECONDS: float = 5.0
+    OUTBOX_RETRY_MAX_SECONDS: float = 60.0 * 30
+    OUTBOX_RETENTION_DAYS: int = 7
+    OUTBOX_SEND_TIMEOUT_SECONDS: float = 10.0
+    # Has to outlast a send to every sink, or a slow batch is claimed and sent a second time
+    OUTBOX_LEASE_SECONDS: int = 60 * 5
+    ORDER_WEBHOOK_URL: str | None = None
+    ORDER_WEBHOOK_SECRET: str | None = None
+    SMTP_HOST: str | None = None
+    SMTP_PORT: int = 587
+    SMTP_USERNAME: str | None = None
+    SMTP_PASSWORD: str | None = None
+    SMTP_STARTTLS: bool = True
+    SMTP_SENDER: str = "orders@localhost"
+    ORDER_NOTIFY_EMAILS: list[str] = []
+    TELEGRAM_API_URL: str = "https://api.telegram.org"
+    TELEGRAM_BOT_TOKEN: str | None = None
+    TELEGRAM_CHAT_ID: str | None = None
+
+    ORDER_STREAM_HEARTBEAT_SECONDS: float = 15.0
+    ORDER_STREAM_QUEUE_SIZE: int = 100
+    ORDER_STREAM_REPLAY_LIMIT: int = 500
+    ORDER_STREAM_RETRY_MS: int = 3000
+
+    RATE_LIMIT_ENABLED: bool = True
+    RATE_LIMIT_BACKEND: str = "memory"
+    RATE_LIMIT_MAX_KEYS: int = 100_000
+    RATE_LIMIT_IDLE_SECONDS: int = 60 * 60 * 24
+    RATE_LIMIT_TRUST_FORWARDED: bool = False
+    RATE_LIMIT_ORDERS_PER_IP: str = "10/minute"
+    RATE_LIMIT_ORDERS_PER_PHONE: str = "5/hour"
+    RATE_LIMIT_REQUESTS_PER_IP: str = "5/minute"
+    RATE_LIMIT_REQUESTS_PER_PHONE: str = "3/hour"
+    RATE_LIMIT_LOGIN_PER_IP: str = "10/minute"
+    RATE_LIMIT_LOGIN_PER_EMAIL: str = "5/minute"
+    RATE_LIMIT_REGISTER_PER_IP: str = "3/hour"
+
+    LEAD_BUFFER_ENABLED: bool = True
+    LEAD_SPOOL_DIR: str = "media/spool"
+    LEAD_SPOOL_FSYNC: bool = False
+    LEAD_FLUSH_ROWS: int = 500
+    LEAD_FLUSH_INTERVAL_MS: int = 200
+    LEAD_DEDUP_SECONDS: int = 60 * 10
+    LEAD_DEDUP_MAX_KEYS: int = 100_000
+
     class Config:
         env_file = ".env"
 
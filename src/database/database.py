@@ -8,7 +8,8 @@ class DatabaseManager:
     def __init__(self, settings: Settings) -> None:
         self.settings = settings
         self.engine = create_async_engine(
-            self.settings.SQLALCHEMY_DATABASE_URI, echo=True, pool_pre_ping=True
+            self.settings.SQLALCHEMY_DATABASE_URI, echo=True, pool_pre_ping=True,
+            pool_size=self.settings.DB_POOL_SIZE, max_overflow=self.settings.DB_MAX_OVERFLOW
         )
         self.session_factory = async_sessionmaker(
             self.engine, expire_on_commit=False
@@ -1,4 +1,5 @@
-from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, Numeric, String, Text, func, ARRAY
+from sqlalchemy import Boolean, CheckConstraint, Column, Computed, Date, DateTime, Float, ForeignKey, ForeignKeyConstraint, Index, Integer, Numeric, String, Text, UniqueConstraint, func, text, ARRAY
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship
 
@@ -47,11 +48,34 @@ class Sub(BaseModel):
 
 class Product(BaseModel):
     __tablename__ = "products"
+    __table_args__ = (
+        Index("ix_products_category_id_product_origin",
+              "category_id", "product_origin"),
+        Index("ix_products_sub_id_product_origin", "sub_id", "product_origin"),
+        Index("ix_products_category_id_created_at_id",
+              "category_id", "created_at", "id"),
+        Index("ix_products_sizes", "sizes", postgresql_using="gin"),
+        # One index per listing and sort, so each page is read in order instead of sorted
+        Index("ix_products_effective_price_id", "effective_price", "id"),
+        Index("ix_products_created_at_id", "created_at", "id"),
+        Index("ix_products_category_id_effective_price_id",
+              "category_id", "effective_price", "id"),
+        Index("ix_products_category_id_name_id", "category_id", "name", "id"),
+        Index("ix_products_sub_id_effective_price_id",
+              "sub_id", "effective_price", "id"),
+        Index("ix_products_sub_id_created_at_id", "sub_id", "created_at", "id"),
+        Index("ix_products_sub_id_name_id", "sub_id", "name", "id"),
+        Index("ix_products_on_sale_effective_price_id", "effective_price", "id",
+              postgresql_where=text("effective_price < base_price")),
+    )
 
     name = Column(String, index=True, nullable=False)
     article = Column(String, index=True, nullable=False)
     base_price = Column(Numeric(precision=8), nullable=False)
     sale_price = Column(Numeric(precision=8))
+    # sale_price when it is an actual discount, so effective_price < base_price means on sale
+    effective_price = Column(Numeric(precision=8), Computed(
+        "CASE WHEN sale_price > 0 AND sale_price < base_price THEN sale_price ELSE base_price END", persisted=True))
     description = Column(Text, nullable=False)
     images = Column(ARRAY(String), default=[
                     "/Products/placeholder-image.png",])
@@ -71,6 +95,25 @@ class Product(BaseModel):
         'OrderItem', cascade='all, delete-orphan', back_populates='product')
 
 
+class Stock(BaseModel):
+    __tablename__ = "stock"
+    __table_args__ = (
+        UniqueConstraint("product_id", "size"),
+        CheckConstraint("reserved >= 0 AND reserved <= on_hand",
+                        name="ck_stock_reserved_within_on_hand"),
+    )
+
+    product_id = Column(Integer, ForeignKey(
+        "products.id", ondelete="CASCADE"), nullable=False)
+    size = Column(String, nullable=False, server_default="")
+    on_hand = Column(Integer, nullable=False, server_default="0")
+    reserved = Column(Integer, nullable=False, server_default="0")
+
+    @property
+    def available(self) -> int:
+        return self.on_hand - self.reserved
+
+
 class User(BaseModel):
     __tablename__ = "users"
 
@@ -80,12 +123,25 @@ class User(BaseModel):
     is_superuser = Column(Boolean, server_default="False", nullable=False)
 
 
+# orders and order_items are range-partitioned by month on created_at (see src/partitions.py),
+# so created_at is part of their primary keys and items carry their order's created_at
 class Order(BaseModel):
     __tablename__ = "orders"
-
+    __table_args__ = (
+        Index("ix_orders_telephone_e164_created_at",
+              "telephone_e164", "created_at"),
+        Index("ix_orders_created_at", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    created_at = Column(DateTime(timezone=True),
+                        server_default=func.now(), primary_key=True)
     full_name = Column(String, nullable=False)
     telephone = Column(String, nullable=False)
+    telephone_e164 = Column(String)
     status = Column(String, nullable=False)
+    shipping_zone = Column(String)
+    shipping_cost = Column(Integer)
 
     items = relationship(
         'OrderItem', cascade="all, delete-orphan", backref="order")
@@ -93,23 +149,43 @@ class Order(BaseModel):
 
 class OrderItem(BaseModel):
     __tablename__ = "order_items"
-
-    order_id = Column(Integer, ForeignKey(
-        "orders.id", ondelete="CASCADE"), nullable=False)
+    __table_args__ = (
+        ForeignKeyConstraint(["order_id", "created_at"], [
+                             "orders.id", "orders.created_at"], ondelete="CASCADE"),
+        Index("ix_order_items_order_id_created_at", "order_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+
+    created_at = Column(DateTime(timezone=True),
+                        server_default=func.now(), primary_key=True)
+    order_id = Column(Integer, nullable=False)
     product_id = Column(Integer, ForeignKey(
         "products.id", ondelete="CASCADE"), nullable=False)
     quantity = Column(Integer, nullable=False)
-
-    product = relationship(Product, lazy="joined",
+    size = Column(String, nullable=False, server_default="")
+    price = Column(Numeric(precision=8))
+    category_id = Column(Integer)
+    sub_id = Column(Integer)
+    product_name = Column(String)
+    product_article = Column(String)
+    product_image = Column(String)
+
+    product = relationship(Product, lazy="raise",
                            back_populates='order_items')
 
 
 class RequestItem(BaseModel):
     __tablename__ = "request_items"
+    __table_args__ = (
+        Index("ix_request_items_telephone_e164_created_at",
+              "telephone_e164", "created_at"),
+    )
 
     name = Column(String, nullable=False)
     telephone = Column(String, nullable=False)
     text = Column(String, nullable=False)
+    telephone_e164 = Column(String)
+    submission_id = Column(String, unique=True)
 
 
 class Size(BaseModel):
@@ -147,3 +223,177 @@ class RouteMapping(BaseModel):
 
     slug_en = Column(String, unique=True, nullable=False)
     name = Column(String, nullable=False)
+
+
+class IdempotencyKey(BaseModel):
+    __tablename__ = "idempotency_keys"
+
+    key = Column(String, unique=True, nullable=False)
+    request_hash = Column(String, nullable=False)
+    status_code = Column(Integer)
+    response = Column(JSONB)
+    # Lease of the request that claimed the key, until it stores a response
+    locked_until = Column(DateTime(timezone=True))
+    expires_at = Column(DateTime(timezone=True), index=True, nullable=False)
+
+
+class SalesRollup(BaseModel):
+    __tablename__ = "sales_rollup"
+    __table_args__ = (
+        UniqueConstraint("day", "status", "dimension", "key"),
+        Index("ix_sales_rollup_dimension_day", "dimension", "day"),
+    )
+
+    day = Column(Date, nullable=False)
+    status = Column(String, nullable=False)
+    dimension = Column(String, nullable=False)
+    key = Column(Integer, nullable=False)
+    orders = Column(Integer, nullable=False, server_default="0")
+    units = Column(Integer, nullable=False, server_default="0")
+    revenue = Column(Numeric, nullable=False, server_default="0")
+
+
+# Running sales counters per product, kept by OrderService in the order's transaction.
+# trend_score is forward-decayed: each unit counts 2^((sold_at - epoch) / half_life), so ranking by
+# the stored value equals ranking by the decayed score at any moment. The weights double every
+# half-life, so the epoch is moved forward periodically and every row rescaled with it
+class ProductSalesStats(Base):
+    __tablename__ = "product_sales_stats"
+
+    product_id = Column(Integer, ForeignKey(
+        "products.id", ondelete="CASCADE"), primary_key=True)
+    units = Column(Integer, nullable=False, server_default="0", index=True)
+    revenue = Column(Numeric, nullable=False, server_default="0", index=True)
+    trend_score = Column(Float, nullable=False, server_default="0", index=True)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+# Daily view counts per product, written in batches by src/view_counter.py. Keyed by day first
+# so reports and the recent-views ranking read one range of the primary key
+class ProductViewCount(Base):
+    __tablename__ = "product_view_counts"
+
+    day = Column(Date, primary_key=True)
+    product_id = Column(Integer, ForeignKey(
+        "products.id", ondelete="CASCADE"), primary_key=True, index=True)
+    views = Column(Integer, nullable=False, server_default="0")
+
+
+# Sparse co-occurrence matrix: how many orders contained both products, stored both ways round
+class ProductPair(Base):
+    __tablename__ = "product_pairs"
+
+    product_id = Column(Integer, ForeignKey(
+        "products.id", ondelete="CASCADE"), primary_key=True)
+    related_id = Column(Integer, ForeignKey(
+        "products.id", ondelete="CASCADE"), primary_key=True, index=True)
+    orders = Column(Integer, nullable=False, server_default="0")
+
+
+# Top-K related products per product, built by src/recommendations.py from product_pairs with
+# same-sub and same-category best sellers filling the remaining ranks
+class ProductRecommendation(Base):
+    __tablename__ = "product_recommendations"
+
+    product_id = Column(Integer, ForeignKey(
+        "products.id", ondelete="CASCADE"), primary_key=True)
+    rank = Column(Integer, primary_key=True)
+    related_id = Column(Integer, ForeignKey(
+        "products.id", ondelete="CASCADE"), nullable=False, index=True)
+    score = Column(Float, nullable=False)
+    source = Column(String, nullable=False)
+
+
+# Progress of incremental batch jobs
+class JobWatermark(Base):
+    __tablename__ = "job_watermarks"
+
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False, server_default="0")
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+
+class OrderArchive(BaseModel):
+    __tablename__ = "order_archives"
+
+    partition = Column(String, unique=True, nullable=False)
+    range_start = Column(DateTime(timezone=True), nullable=False)
+    range_end = Column(DateTime(timezone=True), nullable=False)
+    min_order_id = Column(Integer, index=True)
+    max_order_id = Column(Integer, index=True)
+    orders_table = Column(String)
+    items_table = Column(String)
+    file_path = Column(String)
+
+
+class Task(BaseModel):
+    __tablename__ = "tasks"
+    __table_args__ = (
+        Index("ix_tasks_status_run_at", "status", "run_at"),
+    )
+
+    name = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False, server_default="{}")
+    status = Column(String, nullable=False, server_default="pending")
+    attempts = Column(Integer, nullable=False, server_default="0")
+    run_at = Column(DateTime(timezone=True),
+                    nullable=False, server_default=func.now())
+    locked_until = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+
+
+# Outbox: written in the same transaction as the order change, published by src/outbox.py
+class OrderEvent(BaseModel):
+    __tablename__ = "order_events"
+    __table_args__ = (
+        Index("ix_order_events_pending", "next_attempt_at",
+              postgresql_where=text("processed_at IS NULL")),
+    )
+
+    order_id = Column(Integer, nullable=False, index=True)
+    event_type = Column(String, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    published_to = Column(ARRAY(String), nullable=False, server_default="{}")
+    attempts = Column(Integer, nullable=False, server_default="0")
+    next_attempt_at = Column(DateTime(timezone=True),
+                             nullable=False, server_default=func.now())
+    processed_at = Column(DateTime(timezone=True))
+    last_error = Column(Text)
+
+
+# Shared token buckets for src/ratelimit.py; UNLOGGED since losing them on a crash is harmless
+class RateLimitBucket(Base):
+    __tablename__ = "rate_limit_buckets"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    allowed = Column(Boolean, nullable=False)
+    updated_at = Column(DateTime(timezone=True), nullable=False,
+                        server_default=func.now(), index=True)
+
+
+class ShippingZone(BaseModel):
+    __tablename__ = "shipping_zones"
+
+    code = Column(String, unique=True, nullable=False)
+    name = Column(String, nullable=False)
+    active = Column(Boolean, server_default="True", nullable=False)
+
+    rates = relationship("ShippingRate", cascade="all, delete-orphan",
+                         order_by="ShippingRate.max_weight")
+
+
+# Weight brackets: a parcel pays the price of the first bracket whose max_weight it fits under;
+# max_weight NULL is an open-ended last bracket, origin "" applies to any product_origin
+class ShippingRate(BaseModel):
+    __tablename__ = "shipping_rates"
+    __table_args__ = (
+        UniqueConstraint("zone_id", "origin", "max_weight"),
+    )
+
+    zone_id = Column(Integer, ForeignKey(
+        "shipping_zones.id", ondelete="CASCADE"), nullable=False)
+    origin = Column(String, nullable=False, server_default="")
+    max_weight = Column(Numeric(precision=10, scale=3))
+    price = Column(Integer, nullable=False)
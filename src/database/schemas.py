@@ -1,7 +1,8 @@
 from datetime import datetime
+from decimal import Decimal
 from enum import Enum
 from typing import Optional
-from pydantic import BaseModel, EmailStr
+from pydantic import BaseModel, EmailStr, confloat, conint
 
 ###########
 # Content #
@@ -17,6 +18,11 @@ class ContentUpdate(ContentCreate):
     id: int
 
 
+class ContentPatch(BaseModel):
+    title: Optional[str]
+    description: Optional[str]
+
+
 class ContentResponse(ContentUpdate):
     created_at: datetime = None
     updated_at: datetime = None
@@ -40,6 +46,11 @@ class CategoryUpdate(CategoryCreate):
     id: int
 
 
+class CategoryPatch(BaseModel):
+    name: Optional[str]
+    image: Optional[str]
+
+
 class CategoryResponse(CategoryUpdate):
     created_at: datetime = None
     updated_at: datetime = None
@@ -57,6 +68,10 @@ class SubCreate(BaseModel):
     name: str
 
 
+class SubPatch(BaseModel):
+    name: Optional[str]
+
+
 class SubUpdate(SubCreate):
     id: int
 
@@ -99,7 +114,24 @@ class ProductUpdate(ProductCreate):
         orm_mode = True
 
 
+# Sparse body for PATCH: only the fields sent are written
+class ProductPatch(BaseModel):
+    name: Optional[str]
+    article: Optional[str]
+    base_price: Optional[int]
+    sale_price: Optional[int]
+    description: Optional[str]
+    images: Optional[list[str]]
+    status: Optional[str]
+    weight: Optional[int]
+    product_origin: Optional[str]
+    category_id: Optional[int]
+    sub_id: Optional[int]
+    sizes: Optional[list[str]]
+
+
 class ProductResponse(ProductUpdate):
+    effective_price: Optional[int]
     category: Optional[CategoryResponse]
     sub: Optional[SubResponse]
 
@@ -107,6 +139,113 @@ class ProductResponse(ProductUpdate):
         orm_mode = True
 
 
+class AutocompleteSuggestion(BaseModel):
+    kind: str
+    id: int
+    label: str
+    slug: Optional[str]
+
+
+class ProductBatchResponse(BaseModel):
+    items: list[ProductResponse]
+    missing_ids: list[int] = []
+    missing_slugs: list[str] = []
+
+
+###########
+# Catalog #
+###########
+
+
+class ProductSort(str, Enum):
+    newest = "newest"
+    price_asc = "price_asc"
+    price_desc = "price_desc"
+    name = "name"
+    best_selling = "best_selling"
+    trending = "trending"
+
+
+class PopularityMetric(str, Enum):
+    units = "units"
+    revenue = "revenue"
+    trending = "trending"
+    views = "views"
+
+
+class CatalogFilter(BaseModel):
+    category_id: Optional[int]
+    sub_id: Optional[int]
+    min_price: Optional[int]
+    max_price: Optional[int]
+    origin: Optional[list[str]]
+    size: Optional[list[str]]
+    status: Optional[str]
+    on_sale: Optional[bool]
+
+
+class FacetCount(BaseModel):
+    value: str
+    count: int
+
+
+class CatalogFacets(BaseModel):
+    origin: list[FacetCount] = []
+    size: list[FacetCount] = []
+    sub: list[FacetCount] = []
+
+
+class CatalogResponse(BaseModel):
+    total: int
+    items: list[ProductResponse]
+    facets: CatalogFacets
+
+
+#################
+# Bulk products #
+#################
+
+
+class PriceField(str, Enum):
+    base_price = "base_price"
+    sale_price = "sale_price"
+
+
+class PriceAdjustment(str, Enum):
+    set = "set"
+    add = "add"
+    percent = "percent"
+
+
+# Products are picked by id list, by catalog filter, or both (intersection)
+class ProductSelection(BaseModel):
+    ids: Optional[list[int]]
+    filter: Optional[CatalogFilter]
+    dry_run: bool = False
+
+
+class ProductBulkPrice(ProductSelection):
+    field: PriceField = PriceField.base_price
+    mode: PriceAdjustment
+    value: Decimal
+
+
+class ProductBulkStatus(ProductSelection):
+    status: str
+
+
+class ProductBulkMove(ProductSelection):
+    category_id: Optional[int]
+    sub_id: Optional[int]
+
+
+class ProductBulkResult(BaseModel):
+    dry_run: bool
+    matched: int
+    affected: int
+    ids: list[int]
+
+
 ##############
 # Order Item #
 ##############
@@ -114,15 +253,48 @@ class ProductResponse(ProductUpdate):
 
 class OrderItemCreate(BaseModel):
     product_id: int
-    quantity: int
+    quantity: conint(gt=0)
+    size: str = ""
 
 
 class OrderItemUpdate(OrderItemCreate):
     order_id: int
 
 
-class OrderItemResponse(OrderItemUpdate):
-    product: ProductUpdate
+class OrderItemSnapshot(OrderItemUpdate):
+    price: Optional[int]
+    product_name: Optional[str]
+    product_article: Optional[str]
+    product_image: Optional[str]
+    created_at: datetime = None
+    updated_at: datetime = None
+
+    class Config:
+        orm_mode = True
+
+
+class OrderItemResponse(OrderItemSnapshot):
+    product: Optional[ProductUpdate]
+
+    class Config:
+        orm_mode = True
+
+
+#########
+# Stock #
+#########
+
+
+class StockUpdate(BaseModel):
+    product_id: int
+    size: str = ""
+    on_hand: conint(ge=0)
+
+
+class StockResponse(StockUpdate):
+    id: int
+    reserved: int
+    available: int
     created_at: datetime = None
     updated_at: datetime = None
 
@@ -147,6 +319,7 @@ class OrderCreate(BaseModel):
     full_name: str
     telephone: str
     status: OrderStatus = "Оформлен"
+    shipping_zone: Optional[str]
     items: list[OrderItemCreate]
 
 
@@ -155,8 +328,9 @@ class OrderUpdate(OrderCreate):
     items: list[OrderItemUpdate]
 
 
-class OrderResponse(OrderUpdate):
-    items: list[OrderItemResponse]
+class OrderSummaryResponse(OrderUpdate):
+    items: list[OrderItemSnapshot]
+    shipping_cost: Optional[int]
     created_at: datetime = None
     updated_at: datetime = None
 
@@ -164,6 +338,135 @@ class OrderResponse(OrderUpdate):
         orm_mode = True
 
 
+class OrderResponse(OrderSummaryResponse):
+    items: list[OrderItemResponse]
+
+    class Config:
+        orm_mode = True
+
+
+########
+# Cart #
+########
+
+
+class CartLine(OrderItemCreate):
+    # Price the customer was shown, to warn when it has changed since
+    price: Optional[int]
+
+
+class CartQuoteRequest(BaseModel):
+    items: list[CartLine]
+    zone: Optional[str]
+
+
+class CartLineQuote(BaseModel):
+    product_id: int
+    size: str
+    quantity: int
+    name: Optional[str]
+    article: Optional[str]
+    image: Optional[str]
+    base_price: Optional[int]
+    price: Optional[int]
+    line_total: int
+    weight: float
+    available: Optional[int]
+    warnings: list[str] = []
+
+
+class CartQuote(BaseModel):
+    items: list[CartLineQuote]
+    subtotal: int
+    total_weight: float
+    shipping: Optional[int]
+    total: int
+    warnings: list[str] = []
+    valid: bool
+
+
+############
+# Shipping #
+############
+
+
+class ShippingParcel(BaseModel):
+    origin: str = ""
+    weight: confloat(ge=0)
+
+
+class ShippingQuoteRequest(BaseModel):
+    zone: str
+    parcels: list[ShippingParcel]
+
+
+class ShippingParcelQuote(ShippingParcel):
+    price: int
+
+
+class ShippingQuote(BaseModel):
+    zone: str
+    zone_name: str
+    parcels: list[ShippingParcelQuote]
+    total: int
+
+
+class ShippingRateCreate(BaseModel):
+    origin: str = ""
+    # None is the open-ended last bracket
+    max_weight: Optional[Decimal]
+    price: conint(ge=0)
+
+
+class ShippingRateResponse(ShippingRateCreate):
+    id: int
+
+    class Config:
+        orm_mode = True
+
+
+class ShippingZoneCreate(BaseModel):
+    code: str
+    name: str
+    active: bool = True
+
+
+class ShippingZoneResponse(ShippingZoneCreate):
+    id: int
+    rates: list[ShippingRateResponse] = []
+
+    class Config:
+        orm_mode = True
+
+
+##########
+# Report #
+##########
+
+
+class ReportGroupBy(str, Enum):
+    day = "day"
+    status = "status"
+    category = "category"
+    sub = "sub"
+    product = "product"
+
+
+class SalesReportRow(BaseModel):
+    key: Optional[str]
+    label: Optional[str]
+    orders: int
+    units: int
+    revenue: Decimal
+
+
+class ProductViewsRow(BaseModel):
+    product_id: int
+    name: str
+    article: str
+    views: int
+
+
 ########
 # User #
 ########
@@ -216,6 +519,11 @@ class RequestItemCreate(BaseModel):
     text: str
 
 
+class RequestItemAccepted(BaseModel):
+    submission_id: Optional[str]
+    duplicate: bool = False
+
+
 class RequestItem(RequestItemCreate):
     id: int
     created_at: datetime = None
@@ -1,13 +1,28 @@
+import asyncio
+import gzip
+import json
+import time
 from abc import ABC
-from typing import Any, Sequence, Type
-from slugify import slugify
-from sqlalchemy import insert, select, update, delete
+from collections import OrderedDict
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Sequence, Type
+from sqlalchemy import ARRAY, Date, Integer, Numeric, String, and_, any_, bindparam, cast, column, distinct, func, insert, literal, not_, or_, select, text, true, union_all, update, delete, values
+from sqlalchemy.dialects.postgresql import array, insert as pg_insert
 
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import aliased, noload, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 from . import models
 from . import schemas
-from ..utils import pwd_context, upload_category_image, upload_content_image, upload_product_images
+from .database import db
+from ..config import settings
+from ..shipping import ShippingUnavailableError, shipping_rates
+from ..tasks import task_queue
+from ..utils import get_pwd_context, normalize_phone, save_images, slugify, upload_category_image, upload_content_image, upload_product_images
+
+
+class PreconditionFailedError(Exception):
+    pass
 
 
 class Base(ABC):
@@ -43,6 +58,36 @@ class Base(ABC):
             result = await session.scalars(stmt)
         return result.unique().all()
 
+    async def _patch(self, id: int, values: dict[str, Any], version: datetime | None = None, *options: Any,
+                     relations: dict[str, str] | None = None) -> tuple[models.BaseModel | None, set[str]]:
+        # Sparse update: the row is locked, checked against the If-Match version and only the
+        # columns whose value differs are written, so a body with nothing new is no write at all.
+        # Returns the row and the names of the columns that changed
+        async with self.session as session:
+            row = await session.scalar(select(self.model).where(self.model.id == id).options(
+                noload("*"), *options).with_for_update(of=self.model).execution_options(populate_existing=True))
+            if row is None:
+                return None, set()
+            if version is not None and (row.updated_at or row.created_at) != version:
+                raise PreconditionFailedError(
+                    f"{self.model.__name__} with id: {id} has been changed by someone else")
+
+            changed = {key: value for key, value in values.items() if getattr(row, key) != value}
+            if changed:
+                # Generated columns (products.effective_price) are read back along with updated_at
+                returned = [self.model.updated_at, *(getattr(self.model, column.key) for column in
+                                                      self.model.__table__.columns if column.computed is not None)]
+                written = (await session.execute(update(self.model).where(self.model.id == id).values(
+                    **changed).returning(*returned).execution_options(synchronize_session=False))).one()
+                for key, value in {**changed, **written._mapping}.items():
+                    set_committed_value(row, key, value)
+                # Relationships loaded through a changed foreign key are reloaded
+                stale = [relation for key, relation in (relations or {}).items() if key in changed]
+                if stale:
+                    await session.refresh(row, stale)
+            await session.commit()
+        return row, set(changed)
+
     async def _delete(self, *args: Any) -> models.BaseModel:
         async with self.session as session:
             stmt = delete(self.model).where(*args).returning(self.model)
@@ -71,6 +116,10 @@ class ContentService(Base):
             exclude_unset=True, exclude_none=True)
         return await self._update(models.Content.id == content.id, **content_data)
 
+    async def patch_content(self, id: int, content: schemas.ContentPatch, version: datetime | None = None) -> models.Content | None:
+        result, _ = await self._patch(id, content.dict(exclude_unset=True), version)
+        return result
+
     async def delete_content(self, id: int) -> models.Category:
         return await self._delete(models.Content.id == id)
 
@@ -80,16 +129,13 @@ class CategoryService(Base):
 
     async def create_category(self, category: schemas.CategoryCreate) -> models.Category:
         if category.image:
-            category.image = upload_category_image(category.image)
+            category.image = await upload_category_image(category.image)
 
         category.slug_en = slugify(category.name)
 
-        async with self.session as session:
-            stmt = insert(models.RouteMapping).values(
-                slug_en=category.slug_en, name=category.name)
-            await session.execute(stmt)
-            await session.commit()
-        return await self._insert(**category.dict(exclude_unset=True, exclude_none=True))
+        result = await self._insert(**category.dict(exclude_unset=True, exclude_none=True))
+        await task_queue.enqueue("sync_route_mapping", slug_en=category.slug_en, name=category.name)
+        return result
 
     async def get_category_by_id(self, id: int) -> models.Category:
         return await self._select_one(models.Category.id == id)
@@ -108,27 +154,41 @@ class CategoryService(Base):
         category.slug_en = slugify(category.name)
 
         if category.image.startswith("data:image"):
-            image_url = upload_category_image(category.image)
+            image_url = await upload_category_image(category.image)
             category.image = image_url
 
-        async with self.session as session:
-            stmt = insert(models.RouteMapping).values(
-                slug_en=category.slug_en, name=category.name)
-            await session.execute(stmt)
-            await session.commit()
-
         category_data = category.dict(exclude_unset=True, exclude_none=True)
-        return await self._update(models.Category.id == category.id, **category_data)
+        result = await self._update(models.Category.id == category.id, **category_data)
+        await task_queue.enqueue("sync_route_mapping", slug_en=category.slug_en, name=category.name)
+        return result
+
+    async def patch_category(self, id: int, category: schemas.CategoryPatch, version: datetime | None = None) -> models.Category | None:
+        values = category.dict(exclude_unset=True)
+        # A null name is left to the NOT NULL constraint (400) instead of failing in slugify
+        if values.get("name") is not None:
+            values["slug_en"] = slugify(values["name"])
+        # New images are written only once the update has gone through
+        pending: list[dict[str, Any]] = []
+        if (values.get("image") or "").startswith("data:image"):
+            values["image"] = await upload_category_image(values["image"], pending)
+
+        result, changed = await self._patch(id, values, version)
+        if "image" in changed:
+            await save_images(pending)
+        if "name" in changed:
+            await task_queue.enqueue("sync_route_mapping", slug_en=result.slug_en, name=result.name)
+        return result
 
     async def delete_category(self, id: int) -> models.Category:
         return await self._delete(models.Category.id == id)
 
-    async def get_category_products(self, category_id: int, offset: int, limit: int) -> list[models.Product]:
+    async def get_category_products(self, category_id: int, offset: int, limit: int,
+                                    sort: schemas.ProductSort = schemas.ProductSort.newest) -> list[models.Product]:
         async with self.session as session:
-            stmt = select(models.Product).where(
+            stmt = _sort_products(select(models.Product).where(
                 models.Product.category_id == category_id).options(
                 selectinload(models.Product.category),
-                selectinload(models.Product.sub)).offset(offset).limit(limit)
+                selectinload(models.Product.sub)), sort).offset(offset).limit(limit)
             result = await session.scalars(stmt)
         return result.all()
 
@@ -156,23 +216,152 @@ class SubService(Base):
             exclude_unset=True, exclude_none=True)
         return await self._update(models.Sub.id == sub.id, **sub_data)
 
+    async def patch_sub(self, id: int, sub: schemas.SubPatch, version: datetime | None = None) -> models.Sub | None:
+        result, _ = await self._patch(id, sub.dict(exclude_unset=True), version)
+        return result
+
     async def delete_sub(self, id: int) -> models.Sub:
         return await self._delete(models.Sub.id == id)
 
-    async def get_sub_products(self, sub_id: int, offset: int, limit: int) -> Any:
+    async def get_sub_products(self, sub_id: int, offset: int, limit: int,
+                               sort: schemas.ProductSort = schemas.ProductSort.newest) -> Any:
         async with self.session as session:
-            stmt = select(models.Product).where(
-                models.Product.sub_id == sub_id).offset(offset).limit(limit)
+            stmt = _sort_products(select(models.Product).where(
+                models.Product.sub_id == sub_id), sort).offset(offset).limit(limit)
             result = await session.scalars(stmt)
         return result.all()
 
 
+# Written exactly like the predicate of ix_products_on_sale_effective_price_id so the planner
+# can use that index
+PRODUCT_ON_SALE = models.Product.effective_price < models.Product.base_price
+
+# Ties are broken by id in the same direction, so a listing index is scanned forwards or backwards
+PRODUCT_SORTING = {
+    schemas.ProductSort.newest: (models.Product.created_at.desc(), models.Product.id.desc()),
+    schemas.ProductSort.price_asc: (models.Product.effective_price.asc(), models.Product.id.asc()),
+    schemas.ProductSort.price_desc: (models.Product.effective_price.desc(), models.Product.id.desc()),
+    schemas.ProductSort.name: (models.Product.name, models.Product.id),
+    schemas.ProductSort.best_selling: (models.ProductSalesStats.units.desc().nulls_last(), models.Product.id.desc()),
+    schemas.ProductSort.trending: (models.ProductSalesStats.trend_score.desc().nulls_last(), models.Product.id.desc()),
+}
+PRODUCT_STATS_SORTS = {schemas.ProductSort.best_selling, schemas.ProductSort.trending}
+
+
+def _sort_products(stmt: Any, sort: schemas.ProductSort) -> Any:
+    # Sales sorts read product_sales_stats; products that never sold come last
+    if sort in PRODUCT_STATS_SORTS:
+        stmt = stmt.outerjoin(models.ProductSalesStats,
+                              models.ProductSalesStats.product_id == models.Product.id)
+    return stmt.order_by(*PRODUCT_SORTING[sort])
+
+
+def _catalog_conditions(catalog_filter: schemas.CatalogFilter) -> list[Any]:
+    conditions = []
+    if catalog_filter.category_id is not None:
+        conditions.append(models.Product.category_id ==
+                          catalog_filter.category_id)
+    if catalog_filter.sub_id is not None:
+        conditions.append(models.Product.sub_id == catalog_filter.sub_id)
+    if catalog_filter.min_price is not None:
+        conditions.append(models.Product.effective_price >= catalog_filter.min_price)
+    if catalog_filter.max_price is not None:
+        conditions.append(models.Product.effective_price <= catalog_filter.max_price)
+    if catalog_filter.origin:
+        conditions.append(
+            models.Product.product_origin.in_(catalog_filter.origin))
+    if catalog_filter.size:
+        conditions.append(models.Product.sizes.op(
+            "&&")(array(catalog_filter.size)))
+    if catalog_filter.status:
+        conditions.append(models.Product.status == catalog_filter.status)
+    if catalog_filter.on_sale is not None:
+        conditions.append(
+            PRODUCT_ON_SALE if catalog_filter.on_sale else not_(PRODUCT_ON_SALE))
+    return conditions
+
+
+class EmptySelectionError(Exception):
+    pass
+
+
+def _selection_conditions(selection: schemas.ProductSelection) -> list[Any]:
+    conditions = _catalog_conditions(selection.filter) if selection.filter else []
+    if selection.ids is not None:
+        conditions.append(models.Product.id == any_(bindparam("ids", selection.ids, type_=ARRAY(Integer))))
+    # An empty selection would touch every product
+    if not conditions:
+        raise EmptySelectionError("Select products by ids or by at least one filter")
+    return conditions
+
+
+# Dataloader: by-id and by-slug lookups issued in the same event-loop tick are answered by one
+# query. Keys are bound as arrays (= ANY) so the statement text, and with it the asyncpg prepared
+# statement, is the same for any number of keys. Nothing is cached past the batch
+class ProductLoader:
+    def __init__(self, session: AsyncSession | None = None) -> None:
+        self.session = session
+        self._pending: dict[str, dict[Any, asyncio.Future]] = {"id": {}, "slug": {}}
+        self._dispatch: asyncio.Task | None = None
+
+    def load(self, kind: str, key: Any) -> asyncio.Future:
+        futures = self._pending[kind]
+        if key not in futures:
+            futures[key] = asyncio.get_running_loop().create_future()
+            if self._dispatch is None:
+                self._dispatch = asyncio.create_task(self._run())
+        # Shielded: one caller giving up must not cancel the lookup for others waiting on the key
+        return asyncio.shield(futures[key])
+
+    async def _run(self) -> None:
+        # Let every coroutine scheduled in this tick enqueue its keys first
+        await asyncio.sleep(0)
+        pending, self._pending = self._pending, {"id": {}, "slug": {}}
+        self._dispatch = None
+        try:
+            products = await self._fetch(list(pending["id"]), list(pending["slug"]))
+        except Exception as error:
+            for futures in pending.values():
+                for future in futures.values():
+                    if not future.done():
+                        future.set_exception(error)
+            return
+
+        by_id = {product.id: product for product in products}
+        by_slug = {product.slug_en: product for product in products}
+        for kind, found in (("id", by_id), ("slug", by_slug)):
+            for key, future in pending[kind].items():
+                if not future.done():
+                    future.set_result(found.get(key))
+
+    async def _fetch(self, ids: list[int], slugs: list[str]) -> Sequence[models.Product]:
+        stmt = select(models.Product).where(or_(
+            models.Product.id == any_(bindparam("ids", ids, type_=ARRAY(Integer))),
+            models.Product.slug_en == any_(bindparam("slugs", slugs, type_=ARRAY(String)))
+        )).options(
+            selectinload(models.Product.category),
+            selectinload(models.Product.sub))
+        if self.session is None:
+            async with db.session_factory() as session:
+                return (await session.scalars(stmt)).all()
+        async with self.session as session:
+            return (await session.scalars(stmt)).all()
+
+
+# Shared by every request in the worker when PRODUCT_LOADER_SHARED is on; it uses its own sessions
+shared_product_loader = ProductLoader()
+
+
 class ProductService(Base):
     model = models.Product
 
+    def __init__(self, session: AsyncSession) -> None:
+        super().__init__(session)
+        self.loader = shared_product_loader if settings.PRODUCT_LOADER_SHARED else ProductLoader(session)
+
     async def create_product(self, product: schemas.ProductCreate) -> models.Product:
         if product.images:
-            product.images = upload_product_images(product.images)
+            product.images = await upload_product_images(product.images)
         product.slug_en = slugify(product.name)
         product_insert = await self._insert(**product.dict(exclude_unset=True, exclude_none=True))
 
@@ -187,12 +376,49 @@ class ProductService(Base):
         return result
 
     async def get_product_by_slug(self, slug: str) -> models.Product:
+        return await self.loader.load("slug", slug)
+
+    async def get_products_batch(self, ids: list[int], slugs: list[str]) -> dict[str, Any]:
+        found = await asyncio.gather(
+            *(self.loader.load("id", id) for id in ids),
+            *(self.loader.load("slug", slug) for slug in slugs))
+
+        # Requested order, ids first, each product once even if asked for by id and slug
+        items, seen = [], set()
+        for product in found:
+            if product is not None and product.id not in seen:
+                seen.add(product.id)
+                items.append(product)
+        return {
+            "items": items,
+            "missing_ids": [id for id, product in zip(ids, found) if product is None],
+            "missing_slugs": [slug for slug, product in zip(slugs, found[len(ids):]) if product is None],
+        }
+
+    async def get_related_products(self, slug: str, limit: int) -> list[models.Product] | None:
+        # Precomputed by src/recommendations.py: one read of the product's rows in rank order
+        source = aliased(models.Product)
+        recommendation = models.ProductRecommendation
+        stmt = select(models.Product).join(
+            recommendation, recommendation.related_id == models.Product.id
+        ).join(source, source.id == recommendation.product_id).where(
+            source.slug_en == slug, models.Product.status == PRODUCT_ACTIVE_STATUS
+        ).options(
+            selectinload(models.Product.category),
+            selectinload(models.Product.sub)
+        ).order_by(recommendation.rank).limit(limit)
         async with self.session as session:
-            stmt = select(models.Product).where(models.Product.slug_en == slug).options(
-                selectinload(models.Product.category),
-                selectinload(models.Product.sub))
-            result = await session.scalar(stmt)
-        return result
+            related = (await session.scalars(stmt)).all()
+        if related:
+            return related
+
+        # Not computed yet (new product): best sellers of the same sub
+        product = await self.get_product_by_slug(slug)
+        if product is None:
+            return None
+        popular = await ProductSalesService(self.session).get_popular_products(
+            schemas.PopularityMetric.units, limit + 1, sub_id=product.sub_id)
+        return [item for item in popular if item.id != product.id][:limit]
 
     async def get_product_by_article(self, article: str) -> models.Product:
         async with self.session as session:
@@ -205,25 +431,107 @@ class ProductService(Base):
     async def update_product(self, product: schemas.ProductUpdate) -> models.Product:
         product.slug_en = slugify(product.name)
         if any(image.startswith("data:image") for image in product.images):
-            image_urls = upload_product_images(product.images)
+            image_urls = await upload_product_images(product.images)
             product.images = image_urls
         product_data = product.dict(exclude_unset=True, exclude_none=True)
         updated_product = await self._update(models.Product.id == product.id, **product_data)
 
         return await self.get_product_by_id(id=updated_product.id)
 
+    async def patch_product(self, id: int, product: schemas.ProductPatch, version: datetime | None = None) -> models.Product | None:
+        values = product.dict(exclude_unset=True)
+        # A null name is left to the NOT NULL constraint (400) instead of failing in slugify
+        if values.get("name") is not None:
+            values["slug_en"] = slugify(values["name"])
+        pending: list[dict[str, Any]] = []
+        if values.get("images"):
+            # Only newly attached images are uploaded, stored URLs are kept as they are. The files
+            # are written once the update has gone through
+            uploaded = iter(await upload_product_images(
+                [image for image in values["images"] if image.startswith("data:image")], pending))
+            values["images"] = [next(uploaded) if image.startswith("data:image") else image
+                                for image in values["images"]]
+
+        result, changed = await self._patch(
+            id, values, version,
+            selectinload(models.Product.category),
+            selectinload(models.Product.sub),
+            relations={"category_id": "category", "sub_id": "sub"})
+        if "images" in changed:
+            await save_images(pending)
+        return result
+
     async def delete_product(self, id: int) -> None:
         async with self.session as session:
             # Delete the product
             await session.execute(delete(models.Product).where(models.Product.id == id))
             await session.commit()
 
-    async def get_all_products(self, offset: int, limit: int, search_query: str = None) -> Sequence[models.Product]:
+    async def _bulk(self, selection: schemas.ProductSelection, stmt: Any, *conditions: Any) -> dict[str, Any]:
+        conditions = (*_selection_conditions(selection), *conditions)
+        sample_size = settings.PRODUCT_BULK_SAMPLE_IDS
+
+        if selection.dry_run:
+            async with self.session as session:
+                matched = await session.scalar(
+                    select(func.count()).select_from(models.Product).where(*conditions))
+                ids = (await session.scalars(select(models.Product.id).where(*conditions).order_by(
+                    models.Product.id).limit(sample_size))).all()
+            return {"dry_run": True, "matched": matched, "affected": 0, "ids": ids}
+
+        # Keyset over id with one short transaction per chunk: row locks are held for a single
+        # chunk and always taken in id order. A failing chunk leaves the earlier ones applied
+        affected, ids, last_id = 0, [], 0
+        while True:
+            chunk = select(models.Product.id).where(*conditions, models.Product.id > last_id).order_by(
+                models.Product.id).limit(settings.PRODUCT_BULK_CHUNK_SIZE)
+            async with self.session as session:
+                chunk_ids = (await session.scalars(
+                    stmt.where(models.Product.id.in_(chunk)).returning(models.Product.id),
+                    execution_options={"synchronize_session": False})).all()
+                await session.commit()
+            if not chunk_ids:
+                break
+            chunk_ids = sorted(chunk_ids)
+            affected += len(chunk_ids)
+            last_id = chunk_ids[-1]
+            ids.extend(chunk_ids[:sample_size - len(ids)])
+
+        return {"dry_run": False, "matched": affected, "affected": affected, "ids": ids}
+
+    async def bulk_update_prices(self, bulk: schemas.ProductBulkPrice) -> dict[str, Any]:
+        price_column = getattr(models.Product, bulk.field.value)
+        conditions = []
+        # Bound as unscaled numeric: next to the column it would take NUMERIC(8) and lose the fraction
+        if bulk.mode == schemas.PriceAdjustment.set:
+            price = literal(bulk.value, Numeric())
+        else:
+            # Relative changes only apply to prices that are set (sale_price is nullable)
+            conditions.append(price_column.isnot(None))
+            price = (price_column + literal(bulk.value, Numeric()) if bulk.mode == schemas.PriceAdjustment.add
+                     else price_column * literal(1 + bulk.value / 100, Numeric()))
+        stmt = update(models.Product).values({price_column: func.greatest(func.round(price), 0)})
+        return await self._bulk(bulk, stmt, *conditions)
+
+    async def bulk_update_status(self, bulk: schemas.ProductBulkStatus) -> dict[str, Any]:
+        # Rows already in the target status are not rewritten
+        stmt = update(models.Product).values(status=bulk.status)
+        return await self._bulk(bulk, stmt, models.Product.status != bulk.status)
+
+    async def bulk_move_products(self, bulk: schemas.ProductBulkMove) -> dict[str, Any]:
+        values = bulk.dict(include={"category_id", "sub_id"}, exclude_none=True)
+        return await self._bulk(bulk, update(models.Product).values(**values))
+
+    async def bulk_delete_products(self, bulk: schemas.ProductSelection) -> dict[str, Any]:
+        return await self._bulk(bulk, delete(models.Product))
+
+    async def get_all_products(self, offset: int, limit: int, search_query: str = None,
+                               sort: schemas.ProductSort = schemas.ProductSort.newest) -> Sequence[models.Product]:
         async with self.session as session:
-            stmt = select(models.Product).options(
+            stmt = _sort_products(select(models.Product).options(
                 selectinload(models.Product.category),
                 selectinload(models.Product.sub)
-            ).offset(offset).limit(limit)
+            ), sort).offset(offset).limit(limit)
 
             if search_query:
                 stmt = stmt.where(
@@ -232,13 +540,65 @@ class ProductService(Base):
             result = await session.scalars(stmt)
         return result.all()
 
+    async def get_sale_products(self, offset: int, limit: int,
+                                sort: schemas.ProductSort = schemas.ProductSort.price_asc) -> Sequence[models.Product]:
+        async with self.session as session:
+            stmt = _sort_products(select(models.Product).where(PRODUCT_ON_SALE).options(
+                selectinload(models.Product.category),
+                selectinload(models.Product.sub)
+            ), sort).offset(offset).limit(limit)
+            result = await session.scalars(stmt)
+        return result.all()
+
+    async def get_catalog(self, catalog_filter: schemas.CatalogFilter, sort: schemas.ProductSort, offset: int, limit: int) -> dict[str, Any]:
+        conditions = _catalog_conditions(catalog_filter)
+
+        # Every facet and the total come from one GROUPING SETS scan
+        product_size = func.unnest(models.Product.sizes).table_valued(
+            "value").render_derived().lateral("product_size")
+        facets_stmt = select(
+            func.grouping(models.Product.product_origin,
+                          models.Product.sub_id, product_size.c.value),
+            models.Product.product_origin,
+            models.Product.sub_id,
+            product_size.c.value,
+            func.count(distinct(models.Product.id))
+        ).select_from(models.Product).outerjoin(product_size, true()).where(*conditions).group_by(
+            func.grouping_sets(models.Product.product_origin, models.Product.sub_id, product_size.c.value, text("()")))
+
+        items_stmt = _sort_products(select(models.Product).where(*conditions).options(
+            selectinload(models.Product.category),
+            selectinload(models.Product.sub)
+        ), sort).offset(offset).limit(limit)
+
+        async with self.session as session:
+            facet_rows = (await session.execute(facets_stmt)).all()
+            items = (await session.scalars(items_stmt)).all()
+
+        total = 0
+        facets = {"origin": [], "size": [], "sub": []}
+        for grouping, origin, sub_id, size, count in facet_rows:
+            if grouping == 0b011:
+                facets["origin"].append({"value": origin, "count": count})
+            elif grouping == 0b101:
+                facets["sub"].append({"value": str(sub_id), "count": count})
+            elif grouping == 0b110 and size:
+                facets["size"].append({"value": size, "count": count})
+            elif grouping == 0b111:
+                total = count
+
+        for facet_values in facets.values():
+            facet_values.sort(key=lambda facet: (-facet["count"], facet["value"]))
+
+        return {"total": total, "items": items, "facets": facets}
+
 
 class UserService(Base):
     model = models.User
 
     def __init__(self, session: AsyncSession) -> None:
         super().__init__(session)
-        self._password_hasher = pwd_context
+        self._password_hasher = get_pwd_context()
 
     async def create_user(self, user: schemas.UserCreate) -> models.User:
         user.password = self._password_hasher.hash(user.password)
@@ -266,20 +626,682 @@ class UserService(Base):
         return await self._update(models.User.id == user.id, **payload)
 
 
+class InsufficientStockError(Exception):
+    def __init__(self, lines: list[tuple[int, str]]) -> None:
+        self.lines = lines
+        super().__init__("Not enough stock for " + ", ".join(
+            f"product {product_id}" + (f" size {size}" if size else "") for product_id, size in lines))
+
+
+# Orders hold a reservation until delivery; delivered goods are gone from hand
+STOCK_RESERVED_STATUSES = {schemas.OrderStatus.Оформлен,
+                           schemas.OrderStatus.Оплачен, schemas.OrderStatus.В_пути}
+STOCK_SHIPPED_STATUSES = {schemas.OrderStatus.Доставлен}
+
+
+def _stock_state(status: str | None) -> tuple[int, int]:
+    return int(status in STOCK_RESERVED_STATUSES), int(status in STOCK_SHIPPED_STATUSES)
+
+
+class StockService(Base):
+    model = models.Stock
+
+    async def get_product_stock(self, product_id: int) -> Sequence[models.Stock]:
+        async with self.session as session:
+            stmt = select(models.Stock).where(
+                models.Stock.product_id == product_id).order_by(models.Stock.size)
+            result = await session.scalars(stmt)
+        return result.all()
+
+    async def set_stock(self, stock: schemas.StockUpdate) -> models.Stock:
+        async with self.session as session:
+            stmt = pg_insert(models.Stock).values(**stock.dict())
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[models.Stock.product_id, models.Stock.size],
+                set_={"on_hand": stmt.excluded.on_hand, "updated_at": func.now()}
+            ).returning(models.Stock)
+            result = await session.scalar(stmt)
+            await session.commit()
+        return result
+
+    async def delete_stock(self, id: int) -> models.Stock:
+        return await self._delete(models.Stock.id == id)
+
+    async def move_stock(self, lines: dict[tuple[int, str], int], reserved: int, on_hand: int) -> None:
+        # Runs inside the caller's transaction. Rows are locked in id order by a single
+        # statement, so concurrent checkouts on the same SKU queue up instead of deadlocking.
+        if not lines or (reserved == 0 and on_hand == 0):
+            return
+
+        wanted = values(
+            column("product_id", Integer), column("size", String), column("quantity", Integer), name="wanted"
+        ).data([(product_id, size, quantity) for (product_id, size), quantity in lines.items()])
+        locked = select(models.Stock.id, wanted.c.quantity).join(
+            wanted, and_(models.Stock.product_id == wanted.c.product_id, models.Stock.size == wanted.c.size)
+        ).order_by(models.Stock.id).with_for_update(of=models.Stock).cte("locked")
+
+        stmt = update(models.Stock).where(models.Stock.id == locked.c.id).values(
+            reserved=models.Stock.reserved + reserved * locked.c.quantity,
+            on_hand=models.Stock.on_hand + on_hand * locked.c.quantity)
+        if reserved > 0:
+            stmt = stmt.where(models.Stock.on_hand -
+                              models.Stock.reserved >= locked.c.quantity)
+        result = await self.session.execute(stmt.returning(models.Stock.product_id, models.Stock.size))
+
+        if reserved <= 0:
+            return
+
+        # Products without any stock rows are not tracked and always pass
+        moved = {tuple(row) for row in result}
+        tracked = set(await self.session.scalars(select(models.Stock.product_id).where(
+            models.Stock.product_id.in_({product_id for product_id, _ in lines})).distinct()))
+        missing = [line for line in lines if line[0]
+                   in tracked and line not in moved]
+        if missing:
+            raise InsufficientStockError(missing)
+
+
+PRODUCT_ACTIVE_STATUS = "Активный"
+# Lines with these warnings can't be ordered; the rest are informational
+CART_BLOCKING_WARNINGS = {"not_found", "inactive"}
+
+
+class InvalidCartError(Exception):
+    def __init__(self, lines: list[dict[str, Any]]) -> None:
+        self.lines = lines
+        super().__init__("Cannot order " + ", ".join(
+            f"product {line['product_id']} ({', '.join(line['warnings'])})" for line in lines))
+
+
+class CartService(Base):
+    model = models.Product
+
+    async def quote(self, items: list[schemas.CartLine], zone: str | None = None) -> dict[str, Any]:
+        async with self.session:
+            return await self.quote_lines([item.dict() for item in items], zone=zone)
+
+    async def quote_lines(self, items: list[dict[str, Any]], zone: str | None = None) -> dict[str, Any]:
+        # Runs on self.session without committing, so create_order prices inside its transaction.
+        # One query for every line: product, effective price and the stock row for its size
+        lines = [{**item, "line": line} for line, item in enumerate(items)]
+        quote = {"items": [], "subtotal": 0, "total_weight": 0.0, "shipping": None, "total": 0,
+                 "warnings": [], "valid": True}
+        if not lines:
+            return quote
+
+        wanted = values(
+            column("line", Integer), column("product_id", Integer), column("size", String), column("quantity", Integer),
+            name="wanted"
+        ).data([(line["line"], line["product_id"], line.get("size") or "", line["quantity"]) for line in lines])
+        # Aliased so the EXISTS doesn't correlate against the stock row joined below
+        any_stock = aliased(models.Stock)
+        tracked = select(any_stock.id).where(
+            any_stock.product_id == wanted.c.product_id).exists()
+        stmt = select(
+            wanted.c.line,
+            models.Product.id,
+            models.Product.name,
+            models.Product.article,
+            models.Product.status,
+            models.Product.sizes,
+            models.Product.weight,
+            models.Product.product_origin,
+            models.Product.base_price,
+            models.Product.category_id,
+            models.Product.sub_id,
+            models.Product.images[1].label("image"),
+            models.Product.effective_price.label("price"),
+            (models.Stock.on_hand - models.Stock.reserved).label("available"),
+            tracked.label("tracked")
+        ).select_from(wanted).outerjoin(
+            models.Product, models.Product.id == wanted.c.product_id
+        ).outerjoin(
+            models.Stock, and_(models.Stock.product_id == wanted.c.product_id, models.Stock.size == wanted.c.size)
+        ).order_by(wanted.c.line)
+        rows = {row.line: row for row in await self.session.execute(stmt)}
+
+        parcels = {}
+        for line in lines:
+            row = rows[line["line"]]
+            size = line.get("size") or ""
+            warnings = []
+            if row.id is None:
+                warnings.append("not_found")
+            else:
+                if row.status != PRODUCT_ACTIVE_STATUS:
+                    warnings.append("inactive")
+                if any(row.sizes or []) and size not in row.sizes:
+                    warnings.append("size_unavailable")
+                if row.tracked and (row.available or 0) < line["quantity"]:
+                    warnings.append("insufficient_stock")
+                if line.get("price") is not None and line["price"] != row.price:
+                    warnings.append("price_changed")
+
+            price = int(row.price) if row.price is not None else None
+            line_total = price * line["quantity"] if price is not None else 0
+            weight = float(row.weight or 0) * line["quantity"]
+            quote["items"].append({
+                "product_id": line["product_id"],
+                "size": size,
+                "quantity": line["quantity"],
+                "name": row.name,
+                "article": row.article,
+                "image": row.image,
+                "category_id": row.category_id,
+                "sub_id": row.sub_id,
+                "base_price": row.base_price,
+                "price": price,
+                "line_total": line_total,
+                "weight": weight,
+                "available": row.available if row.tracked else None,
+                "warnings": warnings,
+            })
+            if CART_BLOCKING_WARNINGS.intersection(warnings):
+                quote["valid"] = False
+                continue
+            quote["subtotal"] += line_total
+            quote["total_weight"] += weight
+            origin = row.product_origin or ""
+            parcels[origin] = parcels.get(origin, 0.0) + weight
+
+        quote["warnings"] = sorted({warning for item in quote["items"] for warning in item["warnings"]})
+        quote["total"] = quote["subtotal"]
+        if zone is not None and quote["valid"]:
+            # Rates come from the in-memory tables, so this adds no query
+            try:
+                shipping = await shipping_rates.quote(zone, parcels)
+            except ShippingUnavailableError as error:
+                quote["warnings"].append("shipping_unavailable")
+                quote["shipping_error"] = str(error)
+                quote["valid"] = False
+            else:
+                quote["shipping"] = shipping["total"]
+                quote["total"] += shipping["total"]
+        return quote
+
+
+class ShippingService(Base):
+    model = models.ShippingZone
+
+    async def quote(self, quote: schemas.ShippingQuoteRequest) -> dict[str, Any]:
+        parcels = {}
+        for parcel in quote.parcels:
+            parcels[parcel.origin] = parcels.get(parcel.origin, 0.0) + parcel.weight
+        return await shipping_rates.quote(quote.zone, parcels)
+
+    async def create_zone(self, zone: schemas.ShippingZoneCreate) -> models.ShippingZone:
+        new_zone = await self._insert(**zone.dict())
+        shipping_rates.invalidate()
+        return await self.get_zone(new_zone.id)
+
+    async def get_zone(self, id: int) -> models.ShippingZone | None:
+        async with self.session as session:
+            stmt = select(models.ShippingZone).where(models.ShippingZone.id == id).options(
+                selectinload(models.ShippingZone.rates)).execution_options(populate_existing=True)
+            return await session.scalar(stmt)
+
+    async def get_all_zones(self) -> Sequence[models.ShippingZone]:
+        async with self.session as session:
+            stmt = select(models.ShippingZone).options(
+                selectinload(models.ShippingZone.rates)).order_by(models.ShippingZone.code)
+            result = await session.scalars(stmt)
+        return result.all()
+
+    async def update_zone(self, id: int, zone: schemas.ShippingZoneCreate) -> models.ShippingZone | None:
+        updated = await self._update(models.ShippingZone.id == id, **zone.dict())
+        shipping_rates.invalidate()
+        return await self.get_zone(id) if updated else None
+
+    async def set_zone_rates(self, id: int, rates: list[schemas.ShippingRateCreate]) -> models.ShippingZone | None:
+        # The whole table of a zone is replaced in one transaction, so quotes never see half of it
+        async with self.session as session:
+            zone_id = await session.scalar(select(models.ShippingZone.id).where(
+                models.ShippingZone.id == id).with_for_update())
+            if zone_id is None:
+                return None
+            await session.execute(delete(models.ShippingRate).where(models.ShippingRate.zone_id == id))
+            if rates:
+                await session.execute(insert(models.ShippingRate).values(
+                    [{**rate.dict(), "zone_id": id} for rate in rates]))
+            await session.commit()
+        shipping_rates.invalidate()
+        return await self.get_zone(id)
+
+    async def delete_zone(self, id: int) -> models.ShippingZone | None:
+        result = await self._delete(models.ShippingZone.id == id)
+        shipping_rates.invalidate()
+        return result
+
+
+ROLLUP_DIMENSIONS = ("category", "sub", "product")
+REPORT_LABELS = {
+    schemas.ReportGroupBy.category: models.Category,
+    schemas.ReportGroupBy.sub: models.Sub,
+    schemas.ReportGroupBy.product: models.Product,
+}
+
+
+class RollupService(Base):
+    model = models.SalesRollup
+
+    async def apply_order(self, order_id: int, status: str, sign: int) -> None:
+        # Runs inside the caller's transaction: adds (sign=1) or removes (sign=-1) one order
+        # using the price and category captured on its items, so removals mirror additions
+        await self.session.execute(self._upsert(self._rollup_rows(
+            models.Order.id == order_id, status=status, sign=sign)))
+
+    async def rebuild(self) -> None:
+        # Archived partitions are no longer in orders, so days up to the last archived one keep
+        # the rollups they already have and only the hot tier is recounted
+        async with self.session as session:
+            last_archived_day = await session.scalar(select(cast(func.timezone(
+                settings.REPORT_TIMEZONE, func.max(models.OrderArchive.range_end)), Date)))
+            if last_archived_day is None:
+                await session.execute(delete(models.SalesRollup))
+                await session.execute(self._upsert(self._rollup_rows(true())))
+            else:
+                await session.execute(delete(models.SalesRollup).where(
+                    models.SalesRollup.day > last_archived_day))
+                await session.execute(self._upsert(self._rollup_rows(cast(func.timezone(
+                    settings.REPORT_TIMEZONE, models.Order.created_at), Date) > last_archived_day)))
+            await session.commit()
+
+    def _rollup_rows(self, *conditions: Any, status: str | None = None, sign: int = 1) -> Any:
+        lines = select(
+            models.Order.id.label("order_id"),
+            cast(func.timezone(settings.REPORT_TIMEZONE,
+                 models.Order.created_at), Date).label("day"),
+            (literal(status) if status else models.Order.status).label("status"),
+            models.OrderItem.id.label("item_id"),
+            models.OrderItem.category_id.label("category"),
+            models.OrderItem.sub_id.label("sub"),
+            models.OrderItem.product_id.label("product"),
+            models.OrderItem.quantity,
+            (models.OrderItem.quantity *
+             func.coalesce(models.OrderItem.price, 0)).label("amount"),
+        ).select_from(models.Order).outerjoin(
+            models.OrderItem, and_(models.OrderItem.order_id == models.Order.id,
+                                   models.OrderItem.created_at == models.Order.created_at)
+        ).where(*conditions).subquery("lines")
+
+        measures = (
+            sign * func.count(distinct(lines.c.order_id)),
+            sign * func.coalesce(func.sum(lines.c.quantity), 0),
+            sign * func.coalesce(func.sum(lines.c.amount), 0),
+        )
+        rows = [select(lines.c.day, lines.c.status, literal("total"), literal(0), *measures).group_by(
+            lines.c.day, lines.c.status)]
+        for dimension in ROLLUP_DIMENSIONS:
+            key = func.coalesce(lines.c[dimension], 0)
+            rows.append(select(lines.c.day, lines.c.status, literal(dimension), key, *measures).where(
+                lines.c.item_id.isnot(None)).group_by(lines.c.day, lines.c.status, key))
+        return union_all(*rows)
+
+    def _upsert(self, rows: Any) -> Any:
+        rollup = models.SalesRollup
+        stmt = pg_insert(rollup).from_select(
+            ["day", "status", "dimension", "key", "orders", "units", "revenue"], rows)
+        return stmt.on_conflict_do_update(
+            index_elements=[rollup.day, rollup.status,
+                            rollup.dimension, rollup.key],
+            set_={
+                "orders": rollup.orders + stmt.excluded.orders,
+                "units": rollup.units + stmt.excluded.units,
+                "revenue": rollup.revenue + stmt.excluded.revenue,
+                "updated_at": func.now(),
+            })
+
+    def _report_stmt(self, group_by: schemas.ReportGroupBy, date_from: date | None, date_to: date | None, statuses: list[str] | None) -> Any:
+        rollup = models.SalesRollup
+        measures = (
+            func.sum(rollup.orders).label("orders"),
+            func.sum(rollup.units).label("units"),
+            func.sum(rollup.revenue).label("revenue"),
+        )
+        conditions = []
+        if date_from:
+            conditions.append(rollup.day >= date_from)
+        if date_to:
+            conditions.append(rollup.day <= date_to)
+        if statuses:
+            conditions.append(rollup.status.in_(statuses))
+
+        if group_by == schemas.ReportGroupBy.day:
+            key = cast(rollup.day, String)
+            return select(key.label("key"), key.label("label"), *measures).where(
+                rollup.dimension == "total", *conditions).group_by(rollup.day).order_by(rollup.day)
+
+        if group_by == schemas.ReportGroupBy.status:
+            return select(rollup.status.label("key"), rollup.status.label("label"), *measures).where(
+                rollup.dimension == "total", *conditions).group_by(rollup.status).order_by(rollup.status)
+
+        label_model = REPORT_LABELS[group_by]
+        return select(cast(rollup.key, String).label("key"), label_model.name.label("label"), *measures).outerjoin(
+            label_model, label_model.id == rollup.key
+        ).where(rollup.dimension == group_by.value, *conditions).group_by(
+            rollup.key, label_model.name).order_by(func.sum(rollup.revenue).desc())
+
+    async def get_sales_report(self, group_by: schemas.ReportGroupBy, date_from: date | None = None, date_to: date | None = None, statuses: list[str] | None = None) -> list[dict[str, Any]]:
+        async with self.session as session:
+            result = await session.execute(self._report_stmt(group_by, date_from, date_to, statuses))
+        return [row._asdict() for row in result]
+
+    async def stream_sales_report(self, group_by: schemas.ReportGroupBy, date_from: date | None = None, date_to: date | None = None, statuses: list[str] | None = None) -> AsyncIterator[dict[str, Any]]:
+        async with self.session as session:
+            result = await session.stream(self._report_stmt(group_by, date_from, date_to, statuses).execution_options(yield_per=1000))
+            async for row in result:
+                yield row._asdict()
+
+
+PRODUCT_SALE_STATUSES = STOCK_RESERVED_STATUSES | STOCK_SHIPPED_STATUSES
+# Origin of the forward-decayed trend_score; scores grow by 2x per half-life after it. The epoch
+# in use is TREND_EPOCH plus the days in job_watermarks, moved forward by rebase_trend_scores
+# before the weights get anywhere near float8's range
+TREND_EPOCH = datetime(2026, 1, 1, tzinfo=timezone.utc)
+TREND_EPOCH_WATERMARK = "product_trend_epoch_days"
+TREND_LOCK_KEY = 7_045_001
+POPULARITY_COLUMNS = {
+    schemas.PopularityMetric.units: models.ProductSalesStats.units,
+    schemas.PopularityMetric.revenue: models.ProductSalesStats.revenue,
+    schemas.PopularityMetric.trending: models.ProductSalesStats.trend_score,
+}
+REPORT_TODAY = cast(func.timezone(settings.REPORT_TIMEZONE, func.now()), Date)
+
+
+# Per-worker LRU of ranked product ids; entries expire so new sales show up within the TTL
+class PopularProductsCache:
+    def __init__(self, ttl: float, max_keys: int) -> None:
+        self.ttl = ttl
+        self.max_keys = max_keys
+        self._entries: OrderedDict[tuple[Any, ...], tuple[float, list[int]]] = OrderedDict()
+
+    def get(self, key: tuple[Any, ...]) -> list[int] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, ids = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return ids
+
+    def set(self, key: tuple[Any, ...], ids: list[int]) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, ids)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+
+
+popular_products_cache = PopularProductsCache(
+    ttl=settings.PRODUCT_POPULAR_CACHE_SECONDS, max_keys=settings.PRODUCT_POPULAR_CACHE_KEYS)
+
+
+class ProductSalesService(Base):
+    model = models.ProductSalesStats
+
+    async def apply_order(self, order_id: int, sign: int) -> None:
+        # Runs inside the caller's transaction, like RollupService.apply_order. Quantities, prices
+        # and the trend weight all come from the order itself, so a removal subtracts exactly
+        # what the addition added
+        # Shared with every other order; a rebase takes it exclusively, so the epoch read below
+        # can't change before this transaction commits
+        await self.session.execute(text("SELECT pg_advisory_xact_lock_shared(:key)"), {"key": TREND_LOCK_KEY})
+        half_life = settings.PRODUCT_TREND_HALF_LIFE_HOURS * 60 * 60
+        epoch_days = select(func.coalesce(func.max(models.JobWatermark.value), 0)).where(
+            models.JobWatermark.name == TREND_EPOCH_WATERMARK).scalar_subquery()
+        weight = func.power(2.0, (func.extract("epoch", models.Order.created_at - TREND_EPOCH)
+                                  - epoch_days * 86400) / half_life)
+        rows = select(
+            models.OrderItem.product_id,
+            sign * func.sum(models.OrderItem.quantity),
+            sign * func.sum(models.OrderItem.quantity * func.coalesce(models.OrderItem.price, 0)),
+            sign * func.sum(models.OrderItem.quantity * weight)
+        ).select_from(models.Order).join(
+            models.OrderItem, and_(models.OrderItem.order_id == models.Order.id,
+                                   models.OrderItem.created_at == models.Order.created_at)
+        ).where(models.Order.id == order_id, models.OrderItem.product_id.isnot(None)).group_by(
+            models.OrderItem.product_id).order_by(models.OrderItem.product_id)
+
+        stats = models.ProductSalesStats
+        stmt = pg_insert(stats).from_select(["product_id", "units", "revenue", "trend_score"], rows)
+        await self.session.execute(stmt.on_conflict_do_update(
+            index_elements=[stats.product_id],
+            set_={
+                "units": stats.units + stmt.excluded.units,
+                "revenue": stats.revenue + stmt.excluded.revenue,
+                "trend_score": stats.trend_score + stmt.excluded.trend_score,
+                "updated_at": func.now(),
+            }))
+
+    async def rebase_trend_scores(self, min_days: int) -> int:
+        # Moves the epoch to today and scales every score down by the same factor, which leaves
+        # the ranking as it was. Returns the number of days the epoch moved
+        watermarks = models.JobWatermark
+        stats = models.ProductSalesStats
+        async with self.session as session:
+            await session.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": TREND_LOCK_KEY})
+            epoch_days = await session.scalar(select(func.coalesce(func.max(watermarks.value), 0)).where(
+                watermarks.name == TREND_EPOCH_WATERMARK))
+            shift = (datetime.now(timezone.utc) - TREND_EPOCH).days - epoch_days
+            if shift < min_days:
+                return 0
+            # A negative power, so a long overdue shift underflows to 0 instead of overflowing
+            scale = 2.0 ** -(shift * 24 / settings.PRODUCT_TREND_HALF_LIFE_HOURS)
+            await session.execute(update(stats).values(trend_score=stats.trend_score * scale).execution_options(
+                synchronize_session=False))
+            stmt = pg_insert(watermarks).values(name=TREND_EPOCH_WATERMARK, value=epoch_days + shift)
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[watermarks.name],
+                set_={"value": stmt.excluded.value, "updated_at": func.now()}))
+            await session.commit()
+        return shift
+
+    async def get_popular_products(self, metric: schemas.PopularityMetric, limit: int,
+                                   category_id: int | None = None, sub_id: int | None = None) -> list[models.Product]:
+        key = (metric, category_id, sub_id)
+        ids = popular_products_cache.get(key)
+        if ids is None:
+            conditions = [models.Product.status == PRODUCT_ACTIVE_STATUS]
+            if category_id is not None:
+                conditions.append(models.Product.category_id == category_id)
+            if sub_id is not None:
+                conditions.append(models.Product.sub_id == sub_id)
+            if metric == schemas.PopularityMetric.views:
+                views = models.ProductViewCount
+                stmt = select(views.product_id).join(models.Product, models.Product.id == views.product_id).where(
+                    views.day > REPORT_TODAY - settings.PRODUCT_VIEWS_WINDOW_DAYS, *conditions).group_by(
+                    views.product_id).order_by(func.sum(views.views).desc(), views.product_id.desc())
+            else:
+                stats = models.ProductSalesStats
+                ranking = POPULARITY_COLUMNS[metric]
+                stmt = select(stats.product_id).join(models.Product, models.Product.id == stats.product_id).where(
+                    ranking > 0, *conditions).order_by(ranking.desc(), stats.product_id.desc())
+            stmt = stmt.limit(settings.PRODUCT_POPULAR_MAX)
+            async with self.session as session:
+                ids = (await session.scalars(stmt)).all()
+            popular_products_cache.set(key, ids)
+
+        # Products themselves are read fresh, in one query, so prices and stock stay current
+        loader = ProductLoader(self.session)
+        products = await asyncio.gather(*(loader.load("id", id) for id in ids[:limit]))
+        return [product for product in products if product is not None]
+
+
+class ProductViewService(Base):
+    model = models.ProductViewCount
+
+    async def add_views(self, counts: dict[int, int]) -> None:
+        # One statement per flush. Rows are sorted so concurrent flushes from other workers lock
+        # the same counters in the same order, and views of deleted products are dropped
+        views = models.ProductViewCount
+        viewed = values(column("product_id", Integer), column("views", Integer), name="viewed").data(
+            sorted(counts.items()))
+        rows = select(REPORT_TODAY, viewed.c.product_id, viewed.c.views).select_from(viewed).join(
+            models.Product, models.Product.id == viewed.c.product_id).order_by(viewed.c.product_id)
+        stmt = pg_insert(views).from_select(["day", "product_id", "views"], rows)
+        async with self.session as session:
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[views.day, views.product_id],
+                set_={"views": views.views + stmt.excluded.views}))
+            await session.commit()
+
+    async def get_views_report(self, date_from: date | None, date_to: date | None, limit: int) -> list[dict[str, Any]]:
+        views = models.ProductViewCount
+        conditions = []
+        if date_from:
+            conditions.append(views.day >= date_from)
+        if date_to:
+            conditions.append(views.day <= date_to)
+        total = func.sum(views.views)
+        stmt = select(views.product_id, models.Product.name, models.Product.article, total.label("views")).join(
+            models.Product, models.Product.id == views.product_id).where(*conditions).group_by(
+            views.product_id, models.Product.name, models.Product.article).order_by(
+            total.desc(), views.product_id).limit(limit)
+        async with self.session as session:
+            rows = await session.execute(stmt)
+        return [row._asdict() for row in rows]
+
+
+RELATED_WATERMARK = "related_products"
+RELATED_LOCK_KEY = 7_047_001
+
+# Candidates in priority order: products bought together, then best sellers of the same sub,
+# then of the same category. A product keeps its best source and the top K are ranked
+RECOMMENDATIONS_SQL = """
+    INSERT INTO product_recommendations (product_id, rank, related_id, score, source)
+    SELECT product_id, rank, related_id, score, source FROM (
+        SELECT product_id, related_id, score, source,
+               row_number() OVER (PARTITION BY product_id ORDER BY priority, score DESC, related_id) AS rank
+        FROM (
+            SELECT DISTINCT ON (product_id, related_id) product_id, related_id, score, source, priority
+            FROM (
+                SELECT t.product_id, pp.related_id, pp.orders::float8 AS score,
+                       'bought_together' AS source, 0 AS priority
+                FROM related_touched t
+                JOIN product_pairs pp ON pp.product_id = t.product_id
+                JOIN products q ON q.id = pp.related_id AND q.status = :active
+                UNION ALL
+                SELECT t.product_id, f.id, f.units, 'same_sub', 1
+                FROM related_touched t
+                JOIN products p ON p.id = t.product_id
+                CROSS JOIN LATERAL (
+                    SELECT q.id, coalesce(s.units, 0)::float8 AS units
+                    FROM products q LEFT JOIN product_sales_stats s ON s.product_id = q.id
+                    WHERE q.sub_id = p.sub_id AND q.id <> p.id AND q.status = :active
+                    ORDER BY s.units DESC NULLS LAST, q.id DESC
+                    LIMIT :k
+                ) f
+                UNION ALL
+                SELECT t.product_id, f.id, f.units, 'same_category', 2
+                FROM related_touched t
+                JOIN products p ON p.id = t.product_id
+                CROSS JOIN LATERAL (
+                    SELECT q.id, coalesce(s.units, 0)::float8 AS units
+                    FROM products q LEFT JOIN product_sales_stats s ON s.product_id = q.id
+                    WHERE q.category_id = p.category_id AND q.id <> p.id AND q.status = :active
+                    ORDER BY s.units DESC NULLS LAST, q.id DESC
+                    LIMIT :k
+                ) f
+            ) candidates
+            ORDER BY product_id, related_id, priority
+        ) best
+    ) ranked
+    WHERE rank <= :k
+"""
+
+
+class ProductPairService(Base):
+    model = models.ProductPair
+
+    async def apply_order(self, order_id: int, sign: int) -> None:
+        # Runs inside the caller's transaction when an order stops (sign=-1) or starts (sign=1) being
+        # counted. Only orders src/recommendations.py has already folded in are adjusted; it reads the
+        # status of later ones when it gets to them. The job holds the lock exclusively while it moves
+        # the watermark, so the two never both count or both skip an order
+        await self.session.execute(text("SELECT pg_advisory_xact_lock_shared(:key)"), {"key": RELATED_LOCK_KEY})
+        await self.session.execute(text("""
+            CREATE TEMP TABLE related_touched ON COMMIT DROP AS
+            SELECT DISTINCT oi.product_id
+            FROM orders o
+            JOIN order_items oi ON oi.order_id = o.id AND oi.created_at = o.created_at
+            WHERE o.id = :order_id AND oi.product_id IS NOT NULL
+              AND o.id <= (SELECT coalesce(max(value), 0) FROM job_watermarks WHERE name = :name)
+              AND (SELECT count(DISTINCT product_id) FROM order_items WHERE order_id = :order_id)
+                  BETWEEN 2 AND :max_products
+        """), {"order_id": order_id, "name": RELATED_WATERMARK, "max_products": settings.RELATED_MAX_ORDER_PRODUCTS})
+        await self.session.execute(text("""
+            INSERT INTO product_pairs (product_id, related_id, orders)
+            SELECT a.product_id, b.product_id, :sign
+            FROM related_touched a JOIN related_touched b ON b.product_id <> a.product_id
+            ORDER BY a.product_id, b.product_id
+            ON CONFLICT (product_id, related_id) DO UPDATE SET orders = product_pairs.orders + excluded.orders
+        """), {"sign": sign})
+        await self.session.execute(text("""
+            DELETE FROM product_pairs pp USING related_touched t WHERE pp.product_id = t.product_id AND pp.orders <= 0
+        """))
+        await self.session.execute(text("""
+            DELETE FROM product_recommendations r USING related_touched t WHERE r.product_id = t.product_id
+        """))
+        await self.session.execute(text(RECOMMENDATIONS_SQL), {
+            "active": PRODUCT_ACTIVE_STATUS, "k": settings.RELATED_PRODUCTS_K})
+        await self.session.execute(text("DROP TABLE related_touched"))
+
+
 class OrderService(Base):
     model = models.Order
 
     async def create_order(self, order: schemas.OrderCreate) -> models.Order:
-        new_order = await self._insert(**order.dict(exclude_unset=True, exclude_none=True, exclude={"items"}))
-        items = order.dict(
-            exclude_unset=True, exclude_none=True).get("items")
+        order_data = order.dict(exclude_none=True, exclude={"items"})
+        order_data["telephone_e164"] = normalize_phone(order.telephone)
+        items = [item.dict() for item in order.items]
 
-        for item in items:
-            item["order_id"] = new_order.id
-            async with self.session as session:
-                stmt = insert(models.OrderItem).values(**item)
-                await session.execute(stmt)
-                await session.commit()
+        async with self.session as session:
+            # Priced by the same query as /cart/quote. Items keep a snapshot of the product as it
+            # was sold: listings never load products, and rollups can be reversed exactly even
+            # after prices or categories change
+            quote = await CartService(session).quote_lines(items, zone=order.shipping_zone)
+            if "shipping_error" in quote:
+                raise ShippingUnavailableError(quote["shipping_error"])
+            if not quote["valid"]:
+                raise InvalidCartError([line for line in quote["items"]
+                                        if CART_BLOCKING_WARNINGS.intersection(line["warnings"])])
+            for item, line in zip(items, quote["items"]):
+                item.update(
+                    price=line["price"],
+                    category_id=line["category_id"],
+                    sub_id=line["sub_id"],
+                    product_name=line["name"],
+                    product_article=line["article"],
+                    product_image=line["image"]
+                )
+
+            order_data["shipping_cost"] = quote["shipping"]
+            new_order = await session.scalar(
+                insert(models.Order).values(**order_data).returning(models.Order))
+            if items:
+                await session.execute(insert(models.OrderItem).values(
+                    [{**item, "order_id": new_order.id, "created_at": new_order.created_at} for item in items]))
+
+            # Stock is reserved last so its row locks are only held until the commit
+            lines = {}
+            for item in items:
+                line = (item["product_id"], item["size"])
+                lines[line] = lines.get(line, 0) + item["quantity"]
+            await self._move_stock(lines, old_status=None, new_status=new_order.status)
+            await RollupService(session).apply_order(new_order.id, new_order.status, sign=1)
+            if new_order.status in PRODUCT_SALE_STATUSES:
+                await ProductSalesService(session).apply_order(new_order.id, sign=1)
+            await self._record_event(new_order.id, "order.created", {
+                "status": new_order.status,
+                "full_name": new_order.full_name,
+                "telephone": new_order.telephone,
+                "items": sum(item["quantity"] for item in items),
+                "total": int(sum(item["quantity"] * (item.get("price") or 0) for item in items)),
+                "shipping_zone": new_order.shipping_zone,
+                "shipping_cost": new_order.shipping_cost,
+            })
+            await session.commit()
 
         return await self.get_order_by_id(id=new_order.id)
 
@@ -288,48 +1310,210 @@ class OrderService(Base):
             stmt = select(models.Order).where(models.Order.id ==
                                               id).options(selectinload(models.Order.items))
             result = await session.scalar(stmt)
+        if result is None:
+            result = await OrderArchiveService(self.session).find_order(id)
+        return result
+
+    async def get_order_detail(self, id: int) -> models.Order:
+        async with self.session as session:
+            stmt = select(models.Order).where(models.Order.id == id).options(
+                selectinload(models.Order.items).joinedload(models.OrderItem.product))
+            result = await session.scalar(stmt)
+        if result is None:
+            result = await OrderArchiveService(self.session).find_order(id)
         return result
 
-    async def return_order(self, order: schemas.OrderUpdate) -> models.Order:
-        order_data = order.dict(exclude_unset=True, exclude_none=True)
-        order_data["status"] = "returned"
-        updated_order = await self._update(models.Order.id == order.id, **order_data)
-        return await self.get_order_by_id(id=updated_order.id)
+    async def return_order(self, order: schemas.OrderUpdate) -> models.Order | None:
+        order_data = order.dict(
+            exclude_unset=True, exclude_none=True, exclude={"items", "shipping_zone"})
+        order_data["status"] = schemas.OrderStatus.Возврат.value
+        return await self._update_order(order.id, order_data)
 
-    async def update_order_info(self, order: schemas.OrderUpdate) -> models.Order:
+    async def update_order_info(self, order: schemas.OrderUpdate) -> models.Order | None:
+        order_data = order.dict(
+            exclude_unset=True, exclude_none=True, exclude={"items", "shipping_zone"})
+        return await self._update_order(order.id, order_data)
+
+    async def delete_order(self, id: int) -> models.Order | None:
         async with self.session as session:
-            order_data = order.dict(
-                exclude_unset=True, exclude_none=True, exclude={"items"})
-            stmt = update(models.Order).where(
-                models.Order.id == order.id).values(**order_data)
-            await session.execute(stmt)
+            old_status = await self._lock_order_status(id)
+            if old_status is None:
+                return None
+            await self._move_order_stock(id, old_status=old_status, new_status=None)
+            await RollupService(session).apply_order(id, old_status, sign=-1)
+            if old_status in PRODUCT_SALE_STATUSES:
+                await ProductSalesService(session).apply_order(id, sign=-1)
+            if old_status != schemas.OrderStatus.Возврат.value:
+                await ProductPairService(session).apply_order(id, sign=-1)
+            await self._record_event(id, "order.deleted", {"status": old_status})
+            result = await session.scalar(
+                delete(models.Order).where(models.Order.id == id).returning(models.Order))
             await session.commit()
+        return result
 
-        return await self.get_order_by_id(id=order.id)
+    async def _update_order(self, id: int, order_data: dict[str, Any]) -> models.Order | None:
+        if "telephone" in order_data:
+            order_data["telephone_e164"] = normalize_phone(
+                order_data["telephone"])
 
-    async def delete_order(self, id: int) -> None:
-        return await self._delete(models.Order.id == id)
+        async with self.session as session:
+            old_status = await self._lock_order_status(id)
+            if old_status is None:
+                return None
+            await session.execute(update(models.Order).where(
+                models.Order.id == id).values(**order_data))
+
+            new_status = order_data.get("status", old_status)
+            if new_status != old_status:
+                await self._move_order_stock(id, old_status=old_status, new_status=new_status)
+                rollups = RollupService(session)
+                await rollups.apply_order(id, old_status, sign=-1)
+                await rollups.apply_order(id, new_status, sign=1)
+                was_sale, is_sale = old_status in PRODUCT_SALE_STATUSES, new_status in PRODUCT_SALE_STATUSES
+                if was_sale != is_sale:
+                    await ProductSalesService(session).apply_order(id, sign=1 if is_sale else -1)
+                was_returned, is_returned = old_status == schemas.OrderStatus.Возврат.value, new_status == schemas.OrderStatus.Возврат.value
+                if was_returned != is_returned:
+                    await ProductPairService(session).apply_order(id, sign=1 if was_returned else -1)
+                event_type = "order.returned" if new_status == schemas.OrderStatus.Возврат.value else "order.status_changed"
+                await self._record_event(id, event_type, {"status": new_status, "old_status": old_status})
+            else:
+                await self._record_event(id, "order.updated", {
+                    "status": old_status, "fields": sorted(set(order_data) - {"id", "telephone_e164"})})
+            await session.commit()
 
-    async def get_customer_orders(self, phone_numb: str) -> Sequence[models.Order]:
+        return await self.get_order_by_id(id=id)
+
+    async def _record_event(self, id: int, event_type: str, payload: dict[str, Any]) -> None:
+        # Outbox row in the caller's transaction: the event exists exactly when the change does.
+        # NOTIFY is transactional too, so stream listeners hear about it only after the commit
+        event = await self.session.scalar(insert(models.OrderEvent).values(
+            order_id=id, event_type=event_type, payload={"id": id, **payload}).returning(models.OrderEvent))
+        await self.session.execute(select(func.pg_notify(
+            ORDER_EVENTS_CHANNEL, json.dumps(order_event_body(event), ensure_ascii=False))))
+
+    async def _lock_order_status(self, id: int) -> str | None:
+        stmt = select(models.Order.status).where(
+            models.Order.id == id).with_for_update()
+        return await self.session.scalar(stmt)
+
+    async def _move_order_stock(self, id: int, old_status: str | None, new_status: str | None) -> None:
+        if _stock_state(old_status) == _stock_state(new_status):
+            return
+        stmt = select(models.OrderItem.product_id, models.OrderItem.size, func.sum(models.OrderItem.quantity)).where(
+            models.OrderItem.order_id == id).group_by(models.OrderItem.product_id, models.OrderItem.size)
+        rows = await self.session.execute(stmt)
+        lines = {(product_id, size): quantity for product_id, size, quantity in rows}
+        await self._move_stock(lines, old_status=old_status, new_status=new_status)
+
+    async def _move_stock(self, lines: dict[tuple[int, str], int], old_status: str | None, new_status: str | None) -> None:
+        old_reserved, old_shipped = _stock_state(old_status)
+        new_reserved, new_shipped = _stock_state(new_status)
+        await StockService(self.session).move_stock(
+            lines, reserved=new_reserved - old_reserved, on_hand=old_shipped - new_shipped)
+
+    async def get_customer_orders(self, phone_numb: str, offset: int = 0, limit: int = 20) -> Sequence[models.Order]:
+        telephone_e164 = normalize_phone(phone_numb)
+        if telephone_e164 is None:
+            # `== None` would compile to IS NULL and match every order without a phone
+            return []
         async with self.session as session:
             stmt = select(models.Order).where(
-                models.Order.telephone == phone_numb)
+                models.Order.telephone_e164 == telephone_e164
+            ).options(selectinload(models.Order.items)).order_by(
+                models.Order.created_at.desc(), models.Order.id.desc()).offset(offset).limit(limit)
             result = await session.scalars(stmt)
         return result.all()
 
     async def get_all_orders(self, offset: int, limit: int) -> Sequence[models.Order]:
         async with self.session as session:
             stmt = select(models.Order).options(selectinload(
-                models.Order.items)).offset(offset).limit(limit)
+                models.Order.items)).order_by(models.Order.created_at.desc(), models.Order.id.desc()).offset(offset).limit(limit)
             result = await session.scalars(stmt)
         return result.all()
 
 
+def archived_orders_sql(orders_table: str, items_table: str, condition: str = "TRUE") -> str:
+    # One JSON document per order with its items, the same shape as the export files
+    return f"""
+        SELECT (to_jsonb(o) || jsonb_build_object('items', coalesce((
+            SELECT jsonb_agg(to_jsonb(i) ORDER BY i.id) FROM {items_table} i WHERE i.order_id = o.id
+        ), '[]'::jsonb)))::text
+        FROM {orders_table} o WHERE {condition} ORDER BY o.id
+    """
+
+
+def _scan_archive_file(path: str, id: int) -> dict[str, Any] | None:
+    with gzip.open(path, "rt", encoding="utf-8") as file:
+        for line in file:
+            data = json.loads(line)
+            if data["id"] == id:
+                return data
+            if data["id"] > id:
+                return None
+    return None
+
+
+class OrderArchiveService(Base):
+    model = models.OrderArchive
+
+    async def find_order(self, id: int) -> models.Order | None:
+        # Cold lookup for orders whose partition was detached or exported by src/archive.py
+        async with self.session as session:
+            stmt = select(models.OrderArchive).where(
+                models.OrderArchive.min_order_id <= id,
+                models.OrderArchive.max_order_id >= id
+            ).order_by(models.OrderArchive.range_start.desc())
+            archives = (await session.scalars(stmt)).all()
+
+            for archive in archives:
+                if archive.orders_table:
+                    data = await session.scalar(text(archived_orders_sql(
+                        archive.orders_table, archive.items_table, "o.id = :id")), {"id": id})
+                    data = json.loads(data) if data else None
+                elif archive.file_path:
+                    data = await asyncio.to_thread(_scan_archive_file, archive.file_path, id)
+                else:
+                    data = None
+                if data:
+                    return self._build_order(data)
+        return None
+
+    def _build_order(self, data: dict[str, Any]) -> models.Order:
+        items = [models.OrderItem(**item) for item in data.pop("items")]
+        for item in items:
+            item.product = None
+        order = models.Order(**data)
+        order.items = items
+        return order
+
+
 class RequestItemService(Base):
     model = models.RequestItem
 
     async def create_request_item(self, request_item: schemas.RequestItemCreate) -> models.RequestItem:
-        return await self._insert(**request_item.dict(exclude_unset=True, exclude_none=True))
+        return await self._insert(**request_item.dict(exclude_unset=True, exclude_none=True),
+                                  telephone_e164=normalize_phone(request_item.telephone))
+
+    async def insert_request_items(self, rows: list[dict[str, Any]], dedup_seconds: float) -> int:
+        # Batch from the lead buffer: drops phones that already left a request within the window
+        # (other workers dedupe in their own memory only) and ignores replayed submissions
+        async with self.session as session:
+            phones = {row["telephone_e164"] for row in rows if row["telephone_e164"]}
+            if phones:
+                stmt = select(distinct(models.RequestItem.telephone_e164)).where(
+                    models.RequestItem.telephone_e164.in_(phones),
+                    models.RequestItem.created_at > func.now() - timedelta(seconds=dedup_seconds))
+                recent = set(await session.scalars(stmt))
+                rows = [row for row in rows if row["telephone_e164"] not in recent]
+
+            inserted = 0
+            for start in range(0, len(rows), 1000):
+                result = await session.execute(pg_insert(models.RequestItem).values(
+                    rows[start:start + 1000]).on_conflict_do_nothing(index_elements=[models.RequestItem.submission_id]))
+                inserted += result.rowcount
+            await session.commit()
+        return inserted
 
     async def get_request_item_by_id(self, id: int) -> models.RequestItem:
         return await self._select_one(models.RequestItem.id == id)
@@ -369,7 +1553,7 @@ class PageContentService(Base):
 
     async def create_page_content(self, content: schemas.PageContentCreate) -> models.PageContent:
         if content.backgroundImage:
-            content.backgroundImage = upload_content_image(
+            content.backgroundImage = await upload_content_image(
                 content.backgroundImage)
         return await self._insert(**content.dict(exclude_unset=True, exclude_none=True))
 
@@ -384,12 +1568,23 @@ class PageContentService(Base):
 
     async def update_page_content(self, content: schemas.PageContentUpdate) -> models.PageContent:
         if content.backgroundImage.startswith("data:image"):
-            image_url = upload_content_image(content.backgroundImage)
+            image_url = await upload_content_image(content.backgroundImage)
             content.backgroundImage = image_url
         content_data = content.dict(
             exclude_unset=True, exclude_none=True)
         return await self._update(models.PageContent.id == content.id, **content_data)
 
+    async def patch_page_content(self, id: int, content: schemas.PageContentCreate, version: datetime | None = None) -> models.PageContent | None:
+        values = content.dict(exclude_unset=True)
+        # New images are written only once the update has gone through
+        pending: list[dict[str, Any]] = []
+        if (values.get("backgroundImage") or "").startswith("data:image"):
+            values["backgroundImage"] = await upload_content_image(values["backgroundImage"], pending)
+        result, changed = await self._patch(id, values, version)
+        if "backgroundImage" in changed:
+            await save_images(pending)
+        return result
+
     async def delete_page_content(self, id: int) -> models.Category:
         return await self._delete(models.PageContent.id == id)
 
@@ -410,3 +1605,110 @@ class RouteMappingService(Base):
 
     async def get_all_route_mappings(self) -> Sequence[models.RouteMapping]:
         return await self._select_all()
+
+    async def upsert_route_mapping(self, slug_en: str, name: str) -> None:
+        async with self.session as session:
+            stmt = pg_insert(models.RouteMapping).values(slug_en=slug_en, name=name)
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[models.RouteMapping.slug_en],
+                set_={"name": stmt.excluded.name, "updated_at": func.now()}))
+            await session.commit()
+
+
+ORDER_EVENTS_CHANNEL = "order_events"
+
+
+def order_event_body(event: models.OrderEvent) -> dict[str, Any]:
+    return {
+        "id": event.id,
+        "type": event.event_type,
+        "order_id": event.order_id,
+        "created_at": event.created_at.isoformat() if event.created_at else None,
+        "data": event.payload,
+    }
+
+
+class OrderEventService(Base):
+    model = models.OrderEvent
+
+    async def get_events_after(self, last_id: int, limit: int) -> Sequence[models.OrderEvent]:
+        async with self.session as session:
+            stmt = select(models.OrderEvent).where(models.OrderEvent.id > last_id).order_by(
+                models.OrderEvent.id).limit(limit)
+            result = await session.scalars(stmt)
+        return result.all()
+
+    async def claim_batch(self, limit: int, lease: timedelta) -> Sequence[models.OrderEvent]:
+        # SKIP LOCKED lets every worker claim a different batch. The claim is a lease: next_attempt_at
+        # is pushed past the delivery and the caller commits before sending, so no row stays locked
+        # during network I/O. Events of a relay that dies mid-send are picked up once the lease ends
+        claimable = select(models.OrderEvent.id).where(
+            models.OrderEvent.processed_at.is_(None),
+            models.OrderEvent.next_attempt_at <= func.now()
+        ).order_by(models.OrderEvent.id).limit(limit).with_for_update(skip_locked=True)
+        stmt = update(models.OrderEvent).where(models.OrderEvent.id.in_(claimable.scalar_subquery())).values(
+            next_attempt_at=func.now() + lease).returning(models.OrderEvent)
+        result = await self.session.scalars(stmt.execution_options(populate_existing=True))
+        return sorted(result.all(), key=lambda event: event.id)
+
+    async def delete_processed(self, older_than: datetime, batch_size: int) -> int:
+        async with self.session as session:
+            processed = select(models.OrderEvent.id).where(
+                models.OrderEvent.processed_at < older_than).limit(batch_size)
+            result = await session.execute(
+                delete(models.OrderEvent).where(models.OrderEvent.id.in_(processed)))
+            await session.commit()
+        return result.rowcount
+
+
+class IdempotencyService(Base):
+    model = models.IdempotencyKey
+
+    async def claim_key(self, key: str, request_hash: str, expires_at: datetime, locked_until: datetime) -> bool:
+        # Expired rows are taken over in place, so a stale key never blocks a new request. So are
+        # claims whose lease ran out without a response: the request that made them has died
+        async with self.session as session:
+            stmt = pg_insert(models.IdempotencyKey).values(
+                key=key, request_hash=request_hash, expires_at=expires_at, locked_until=locked_until)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[models.IdempotencyKey.key],
+                set_={
+                    "request_hash": stmt.excluded.request_hash,
+                    "expires_at": stmt.excluded.expires_at,
+                    "locked_until": stmt.excluded.locked_until,
+                    "status_code": None,
+                    "response": None,
+                    "created_at": func.now(),
+                },
+                where=or_(
+                    models.IdempotencyKey.expires_at < func.now(),
+                    and_(models.IdempotencyKey.response.is_(None),
+                         or_(models.IdempotencyKey.locked_until.is_(None),
+                             models.IdempotencyKey.locked_until < func.now())))
+            ).returning(models.IdempotencyKey.id)
+            result = await session.scalar(stmt)
+            await session.commit()
+        return result is not None
+
+    async def get_key(self, key: str) -> models.IdempotencyKey:
+        return await self._select_one(models.IdempotencyKey.key == key)
+
+    async def store_response(self, key: str, status_code: int, response: Any) -> models.IdempotencyKey:
+        return await self._update(models.IdempotencyKey.key == key, status_code=status_code, response=response,
+                                  locked_until=None)
+
+    async def release_key(self, key: str) -> models.IdempotencyKey:
+        return await self._delete(models.IdempotencyKey.key == key)
+
+    async def delete_expired_keys(self, batch_size: int) -> int:
+        deleted = 0
+        while True:
+            async with self.session as session:
+                expired = select(models.IdempotencyKey.id).where(
+                    models.IdempotencyKey.expires_at < func.now()).limit(batch_size)
+                result = await session.execute(
+                    delete(models.IdempotencyKey).where(models.IdempotencyKey.id.in_(expired)))
+                await session.commit()
+            deleted += result.rowcount
+            if result.rowcount < batch_size:
+                return deleted
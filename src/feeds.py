@@ -0,0 +1,376 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, BinaryIO, Iterable, Iterator
+from xml.sax.saxutils import escape
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import array
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .database import models
+from .database.database import db
+
+
+logger = logging.getLogger(__name__)
+
+SITEMAP_NAMESPACE = "http://www.sitemaps.org/schemas/sitemap/0.9"
+MERCHANT_NAMESPACE = "http://base.google.com/ns/1.0"
+
+SITEMAP_HEADER = f'<?xml version="1.0" encoding="UTF-8"?>\n<urlset xmlns="{SITEMAP_NAMESPACE}">\n'
+SITEMAP_FOOTER = "</urlset>\n"
+FEED_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    f'<rss version="2.0" xmlns:g="{MERCHANT_NAMESPACE}">\n<channel>\n'
+    "<title>{title}</title>\n<link>{link}</link>\n<description>{title}</description>\n"
+)
+FEED_FOOTER = "</channel>\n</rss>\n"
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = ".lock"
+CATALOG_SITEMAP_NAME = "catalog.xml"
+FEED_OPEN_ATTEMPTS = 3
+
+
+def _site_url(path: str) -> str:
+    if path.startswith(("http://", "https://")):
+        return path
+    return settings.SITE_URL.rstrip("/") + "/" + path.lstrip("/")
+
+
+def _url_entry(path: str, modified_at: Any) -> str:
+    lastmod = f"<lastmod>{modified_at.date().isoformat()}</lastmod>" if modified_at else ""
+    return f"<url><loc>{escape(_site_url(path))}</loc>{lastmod}</url>\n"
+
+
+def _feed_item(row: Any) -> str:
+    on_sale = row.sale_price and 0 < row.sale_price < row.base_price
+    images = [image for image in row.images or [] if image]
+    lines = [
+        f"<g:id>{row.id}</g:id>",
+        f"<g:title>{escape(row.name)}</g:title>",
+        f"<g:description>{escape(row.description[:5000])}</g:description>",
+        f"<g:link>{escape(_site_url(settings.SITEMAP_PRODUCT_PATH.format(id=row.id, slug=row.slug_en)))}</g:link>",
+        f"<g:mpn>{escape(row.article)}</g:mpn>",
+        f"<g:product_type>{escape(row.category_name)} &gt; {escape(row.sub_name)}</g:product_type>",
+        f"<g:availability>{'in_stock' if row.status == 'Активный' else 'out_of_stock'}</g:availability>",
+        f"<g:price>{row.base_price} {settings.FEED_CURRENCY}</g:price>",
+        f"<g:shipping_weight>{row.weight} {settings.FEED_WEIGHT_UNIT}</g:shipping_weight>",
+        "<g:condition>new</g:condition>",
+        "<g:identifier_exists>no</g:identifier_exists>",
+    ]
+    if on_sale:
+        lines.append(
+            f"<g:sale_price>{row.sale_price} {settings.FEED_CURRENCY}</g:sale_price>")
+    if images:
+        lines.append(
+            f"<g:image_link>{escape(_site_url(images[0]))}</g:image_link>")
+        lines.extend(
+            f"<g:additional_image_link>{escape(_site_url(image))}</g:additional_image_link>" for image in images[1:11])
+    return "<item>" + "".join(lines) + "</item>\n"
+
+
+def _tmp_path(path: Any) -> str:
+    # Workers share the cache directory, so each one writes its own temporary file
+    return f"{path}.{os.getpid()}.tmp"
+
+
+def _watermark(value: Any) -> str | None:
+    return value.isoformat() if value else None
+
+
+class _ChunkWriter:
+    # Writes one product chunk as a standalone sitemap and a feed fragment, swapped in atomically
+    def __init__(self, directory: Path, lower_id: int, generation: int) -> None:
+        self.directory = directory
+        self.lower_id = lower_id
+        self.generation = generation
+        self.count = 0
+        self.watermark = None
+        self.sitemap = open(_tmp_path(self._path("sitemap")), "w", encoding="utf-8")
+        self.feed = open(_tmp_path(self._path("feed")), "w", encoding="utf-8")
+        self.sitemap.write(SITEMAP_HEADER)
+
+    def _path(self, kind: str) -> str:
+        return str(self.directory / chunk_file_name(self.lower_id, kind, self.generation))
+
+    def write(self, row: Any) -> None:
+        path = settings.SITEMAP_PRODUCT_PATH.format(id=row.id, slug=row.slug_en)
+        self.sitemap.write(_url_entry(path, row.modified_at))
+        self.feed.write(_feed_item(row))
+        self.count += 1
+        self.watermark = max(filter(None, (self.watermark, row.modified_at)), default=None)
+
+    def close(self) -> dict[str, Any]:
+        self.sitemap.write(SITEMAP_FOOTER)
+        for handle, kind in ((self.sitemap, "sitemap"), (self.feed, "feed")):
+            handle.close()
+            os.replace(_tmp_path(self._path(kind)), self._path(kind))
+        return {"lower_id": self.lower_id, "count": self.count, "watermark": _watermark(self.watermark),
+                "generation": self.generation}
+
+
+def chunk_sitemap_name(lower_id: int) -> str:
+    return f"products-{lower_id}.xml"
+
+
+def chunk_file_name(lower_id: int, kind: str, generation: int) -> str:
+    # Rewritten files get a new name, so a worker still reading the old one is not cut short
+    return f"products-{lower_id}.{generation}.xml" if kind == "sitemap" else f"products-{lower_id}.{generation}.feed"
+
+
+def catalog_file_name(generation: int) -> str:
+    return f"catalog.{generation}.xml"
+
+
+def _file_names(manifest: dict[str, Any]) -> set[str]:
+    if not manifest:
+        return set()
+    names = {catalog_file_name(manifest["catalog_generation"])}
+    for chunk in manifest["chunks"]:
+        names.update(chunk_file_name(chunk["lower_id"], kind, chunk["generation"]) for kind in ("sitemap", "feed"))
+    return names
+
+
+def _try_lock(lock_file: Any) -> bool:
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return False
+    return True
+
+
+def _open_files(paths: Iterable[Path]) -> list[BinaryIO]:
+    # An open handle keeps reading the file even after a later refresh unlinks it
+    handles = []
+    try:
+        for path in paths:
+            handles.append(open(path, "rb"))
+    except FileNotFoundError:
+        for handle in handles:
+            handle.close()
+        raise
+    return handles
+
+
+def _iter_file(handle: BinaryIO) -> Iterator[bytes]:
+    while block := handle.read(64 * 1024):
+        yield block
+
+
+class FeedCache:
+    # Products are split into id-range chunks of at most SITEMAP_MAX_URLS rows. Each chunk
+    # remembers its row count and max(updated_at), and only chunks whose watermark moved
+    # are streamed out of the database again.
+    #
+    # Workers share the directory: refreshes are serialized with a flock on LOCK_NAME, the
+    # manifest is always read back from disk, and a refresh only deletes files that neither
+    # the new nor the previous manifest points to.
+    def __init__(self, directory: str) -> None:
+        self.directory = Path(directory)
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def refresh(self) -> dict[str, Any]:
+        async with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            manifest = self._load_manifest()
+            if manifest and time.monotonic() - self._checked_at < settings.FEED_REFRESH_SECONDS:
+                return manifest
+
+            with open(self.directory / LOCK_NAME, "a") as lock_file:
+                while not _try_lock(lock_file):
+                    if manifest:
+                        # Another worker is refreshing; its files replace these when it is done
+                        return manifest
+                    await asyncio.sleep(0.1)
+
+                previous = self._load_manifest()
+                async with db.session_factory() as session:
+                    manifest = await self._refresh(session, previous)
+                self._save_manifest(manifest)
+                self._remove_unused_files(manifest, previous)
+
+            self._checked_at = time.monotonic()
+            return manifest
+
+    def _load_manifest(self) -> dict[str, Any]:
+        try:
+            with open(self.directory / MANIFEST_NAME, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+        # Written before file names carried a generation; rebuilt from scratch
+        return manifest if "generation" in manifest else {}
+
+    def _save_manifest(self, manifest: dict[str, Any]) -> None:
+        path = self.directory / MANIFEST_NAME
+        with open(_tmp_path(path), "w", encoding="utf-8") as f:
+            json.dump(manifest, f)
+        os.replace(_tmp_path(path), path)
+
+    async def _refresh(self, session: AsyncSession, manifest: dict[str, Any]) -> dict[str, Any]:
+        generation = manifest.get("generation", 0) + 1
+        catalog_signature = await self._catalog_signature(session)
+        rebuild_all = catalog_signature != manifest.get("catalog_signature")
+        catalog_generation = manifest.get("catalog_generation")
+        if rebuild_all:
+            # Category and sub names end up in every feed item
+            await self._render_catalog(session, generation)
+            catalog_generation = generation
+
+        chunks = manifest.get("chunks") or [{"lower_id": 0, "count": -1, "watermark": None}]
+        signatures = await self._chunk_signatures(session, [chunk["lower_id"] for chunk in chunks])
+
+        refreshed = []
+        for index, chunk in enumerate(chunks):
+            upper_id = chunks[index + 1]["lower_id"] if index + 1 < len(chunks) else None
+            count, watermark = signatures.get(index, (0, None))
+            if not rebuild_all and (chunk["count"], chunk["watermark"]) == (count, watermark):
+                refreshed.append(chunk)
+                continue
+            refreshed.extend(await self._render_products(session, chunk["lower_id"], upper_id, generation))
+            logger.info("Regenerated product feed chunk starting at id %s", chunk["lower_id"])
+
+        return {"generation": generation, "catalog_generation": catalog_generation,
+                "catalog_signature": catalog_signature, "chunks": refreshed}
+
+    async def _catalog_signature(self, session: AsyncSession) -> list[Any]:
+        signature = []
+        for model in (models.Category, models.Sub):
+            stmt = select(func.count(), func.max(
+                func.coalesce(model.updated_at, model.created_at)))
+            count, watermark = (await session.execute(stmt)).one()
+            signature.extend([count, _watermark(watermark)])
+        return signature
+
+    async def _chunk_signatures(self, session: AsyncSession, bounds: list[int]) -> dict[int, tuple[int, str | None]]:
+        bucket = func.width_bucket(models.Product.id, array(bounds))
+        stmt = select(bucket, func.count(), func.max(
+            func.coalesce(models.Product.updated_at, models.Product.created_at))).group_by(bucket)
+        rows = await session.execute(stmt)
+        return {bucket - 1: (count, _watermark(watermark)) for bucket, count, watermark in rows}
+
+    async def _render_catalog(self, session: AsyncSession, generation: int) -> None:
+        path = self.directory / catalog_file_name(generation)
+        with open(_tmp_path(path), "w", encoding="utf-8") as f:
+            f.write(SITEMAP_HEADER)
+            for model, path_template in ((models.Category, settings.SITEMAP_CATEGORY_PATH), (models.Sub, settings.SITEMAP_SUB_PATH)):
+                stmt = select(model.id, model.slug_en, func.coalesce(
+                    model.updated_at, model.created_at)).order_by(model.id)
+                result = await session.stream(stmt.execution_options(yield_per=1000))
+                async for id, slug, modified_at in result:
+                    f.write(_url_entry(path_template.format(
+                        id=id, slug=slug), modified_at))
+            f.write(SITEMAP_FOOTER)
+        os.replace(_tmp_path(path), path)
+
+    async def _render_products(self, session: AsyncSession, lower_id: int, upper_id: int | None, generation: int) -> list[dict[str, Any]]:
+        stmt = select(
+            models.Product.id,
+            models.Product.slug_en,
+            models.Product.name,
+            models.Product.article,
+            models.Product.description,
+            models.Product.images,
+            models.Product.base_price,
+            models.Product.sale_price,
+            models.Product.status,
+            models.Product.weight,
+            func.coalesce(models.Product.updated_at,
+                          models.Product.created_at).label("modified_at"),
+            models.Category.name.label("category_name"),
+            models.Sub.name.label("sub_name"),
+        ).join(models.Category, models.Product.category_id == models.Category.id).join(
+            models.Sub, models.Product.sub_id == models.Sub.id
+        ).where(models.Product.id >= lower_id).order_by(models.Product.id)
+        if upper_id is not None:
+            stmt = stmt.where(models.Product.id < upper_id)
+
+        # Server-side cursor: rows are written out as they arrive, memory stays flat
+        chunks = []
+        writer = _ChunkWriter(self.directory, lower_id, generation)
+        result = await session.stream(stmt.execution_options(yield_per=1000))
+        async for row in result:
+            if writer.count >= settings.SITEMAP_MAX_URLS:
+                chunks.append(writer.close())
+                writer = _ChunkWriter(self.directory, row.id, generation)
+            writer.write(row)
+        chunks.append(writer.close())
+        return chunks
+
+    def _remove_unused_files(self, manifest: dict[str, Any], previous: dict[str, Any]) -> None:
+        # Readers may still hold the previous manifest, so its files go one refresh later
+        used = _file_names(manifest) | _file_names(previous)
+        for path in (*self.directory.glob("products-*"), *self.directory.glob("catalog*")):
+            if path.suffix in (".xml", ".feed") and path.name not in used:
+                path.unlink(missing_ok=True)
+
+    def sitemap_index(self, manifest: dict[str, Any], base_url: str) -> str:
+        base_url = base_url.rstrip("/")
+        entries = [f"<sitemap><loc>{escape(base_url)}/sitemaps/{CATALOG_SITEMAP_NAME}</loc></sitemap>\n"]
+        for chunk in manifest["chunks"]:
+            if not chunk["count"]:
+                continue
+            lastmod = f"<lastmod>{chunk['watermark'][:10]}</lastmod>" if chunk["watermark"] else ""
+            entries.append(
+                f"<sitemap><loc>{escape(base_url)}/sitemaps/{chunk_sitemap_name(chunk['lower_id'])}</loc>{lastmod}</sitemap>\n")
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>\n'
+            f'<sitemapindex xmlns="{SITEMAP_NAMESPACE}">\n' + "".join(entries) + "</sitemapindex>\n"
+        )
+
+    def _sitemap_path(self, manifest: dict[str, Any], name: str) -> Path | None:
+        if name == CATALOG_SITEMAP_NAME:
+            return self.directory / catalog_file_name(manifest["catalog_generation"])
+        for chunk in manifest["chunks"]:
+            if chunk_sitemap_name(chunk["lower_id"]) == name:
+                return self.directory / chunk_file_name(chunk["lower_id"], "sitemap", chunk["generation"])
+        return None
+
+    async def open_sitemap(self, name: str) -> BinaryIO | None:
+        # Raises FileNotFoundError if the files kept disappearing under concurrent refreshes
+        manifest = await self.refresh()
+        for attempt in range(FEED_OPEN_ATTEMPTS):
+            path = self._sitemap_path(manifest, name)
+            if path is None:
+                return None
+            try:
+                return open(path, "rb")
+            except FileNotFoundError:
+                if attempt + 1 == FEED_OPEN_ATTEMPTS:
+                    raise
+                manifest = self._load_manifest()
+
+    async def open_product_feed(self) -> list[BinaryIO]:
+        # Every chunk is opened before the response starts, so a feed is never served truncated
+        manifest = await self.refresh()
+        for attempt in range(FEED_OPEN_ATTEMPTS):
+            try:
+                return _open_files(self.directory / chunk_file_name(chunk["lower_id"], "feed", chunk["generation"])
+                                   for chunk in manifest["chunks"])
+            except FileNotFoundError:
+                if attempt + 1 == FEED_OPEN_ATTEMPTS:
+                    raise
+                manifest = self._load_manifest()
+
+    def iter_sitemap(self, handle: BinaryIO) -> Iterator[bytes]:
+        with handle:
+            yield from _iter_file(handle)
+
+    def iter_product_feed(self, handles: list[BinaryIO]) -> Iterator[bytes]:
+        try:
+            yield FEED_HEADER.format(title=escape(settings.FEED_TITLE), link=escape(settings.SITE_URL)).encode()
+            for handle in handles:
+                yield from _iter_file(handle)
+            yield FEED_FOOTER.encode()
+        finally:
+            for handle in handles:
+                handle.close()
+
+
+feed_cache = FeedCache(settings.FEED_CACHE_DIR)
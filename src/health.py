@@ -0,0 +1,83 @@
+import asyncio
+import logging
+import time
+from typing import Any
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+
+from .config import settings
+from .database.database import db
+from .database.services import CategoryService, ContentService, RouteMappingService, SubService
+
+
+logger = logging.getLogger(__name__)
+
+
+def expected_migration_head() -> str | None:
+    try:
+        return ScriptDirectory(settings.MIGRATIONS_DIR).get_current_head()
+    except Exception:
+        logger.exception("Could not read migration head from %s", settings.MIGRATIONS_DIR)
+        return None
+
+
+async def _warm_connection() -> None:
+    # asyncpg keeps prepared statements per connection, so every warmed connection runs the reads
+    async with db.engine.connect() as conn:
+        session = db.session_factory(bind=conn)
+        await CategoryService(session).get_all_categories()
+        await SubService(session).get_all_sub()
+        await RouteMappingService(session).get_all_route_mappings()
+        await ContentService(session).get_all_content()
+
+
+async def warm_up() -> None:
+    started = time.perf_counter()
+    connections = min(settings.DB_WARM_CONNECTIONS, settings.DB_POOL_SIZE)
+    results = await asyncio.gather(*(_warm_connection() for _ in range(connections)), return_exceptions=True)
+    failed = [result for result in results if isinstance(result, Exception)]
+    for error in failed:
+        logger.warning("Warming a database connection failed: %r", error)
+    logger.info("Warmed %s database connections in %.2fs",
+                connections - len(failed), time.perf_counter() - started)
+
+
+# Readiness is checked by the orchestrator every few seconds on every worker, so results are
+# cached for HEALTH_CACHE_SECONDS and concurrent probes share a single check
+class ReadinessCheck:
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self.warmed = False
+        self.expected_head: str | None = None
+        self._result: dict[str, Any] | None = None
+        self._checked_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def status(self) -> dict[str, Any]:
+        if self._result and time.monotonic() - self._checked_at < self.ttl:
+            return self._result
+        async with self._lock:
+            if self._result and time.monotonic() - self._checked_at < self.ttl:
+                return self._result
+            self._result = await self._check()
+            self._checked_at = time.monotonic()
+        return self._result
+
+    async def _check(self) -> dict[str, Any]:
+        result: dict[str, Any] = {"warmed": self.warmed, "database": False,
+                                  "migration": None, "expected_migration": self.expected_head}
+        try:
+            async with db.engine.connect() as conn:
+                result["migration"] = await asyncio.wait_for(
+                    conn.scalar(text("SELECT version_num FROM alembic_version")),
+                    settings.HEALTH_CHECK_TIMEOUT_SECONDS)
+            result["database"] = True
+        except Exception as error:
+            logger.warning("Readiness database check failed: %r", error)
+
+        migrated = self.expected_head is None or result["migration"] == self.expected_head
+        result["ready"] = self.warmed and result["database"] and migrated
+        return result
+
+
+readiness = ReadinessCheck(ttl=settings.HEALTH_CACHE_SECONDS)
@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import json
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Type
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+from .config import settings
+from .database.database import db
+from .database.services import IdempotencyService
+
+
+logger = logging.getLogger(__name__)
+
+REPLAY_HEADER = "Idempotent-Replayed"
+
+
+# Per-worker LRU of finished responses, checked before the database
+class IdempotencyCache:
+    def __init__(self, max_size: int) -> None:
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[float, str, int, Any]] = OrderedDict()
+
+    def get(self, key: str) -> tuple[str, int, Any] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, request_hash, status_code, body = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return request_hash, status_code, body
+
+    def set(self, key: str, request_hash: str, status_code: int, body: Any, ttl: float) -> None:
+        self._entries[key] = (time.monotonic() + ttl,
+                              request_hash, status_code, body)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+# asyncio locks that only live while someone holds or waits on the key
+class KeyLocks:
+    def __init__(self) -> None:
+        self._locks: dict[str, tuple[asyncio.Lock, int]] = {}
+
+    def __call__(self, key: str) -> "_KeyLock":
+        return _KeyLock(self, key)
+
+
+class _KeyLock:
+    def __init__(self, registry: KeyLocks, key: str) -> None:
+        self.registry = registry
+        self.key = key
+
+    async def __aenter__(self) -> None:
+        lock, waiters = self.registry._locks.get(self.key, (asyncio.Lock(), 0))
+        self.registry._locks[self.key] = (lock, waiters + 1)
+        await lock.acquire()
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        lock, waiters = self.registry._locks[self.key]
+        lock.release()
+        if waiters == 1:
+            del self.registry._locks[self.key]
+        else:
+            self.registry._locks[self.key] = (lock, waiters - 1)
+
+
+cache = IdempotencyCache(max_size=settings.IDEMPOTENCY_CACHE_SIZE)
+key_locks = KeyLocks()
+
+
+def hash_payload(payload: BaseModel) -> str:
+    encoded = json.dumps(jsonable_encoder(payload),
+                         sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+
+def _check_hash(request_hash: str, stored_hash: str) -> None:
+    if request_hash != stored_hash:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                            detail="Idempotency-Key has already been used with a different request body")
+
+
+def _replay(request_hash: str, stored_hash: str, status_code: int, body: Any) -> JSONResponse:
+    _check_hash(request_hash, stored_hash)
+    return JSONResponse(content=body, status_code=status_code, headers={REPLAY_HEADER: "true"})
+
+
+async def _wait_for_response(service: IdempotencyService, key: str, request_hash: str) -> JSONResponse | None:
+    # Another worker owns the key: poll its row until the response is stored. None means its
+    # lease ran out without one and the key can be claimed again
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT_SECONDS
+    while True:
+        record = await service.get_key(key)
+
+        if record is None:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail="Previous request with this Idempotency-Key has failed, retry it")
+
+        if record.response is not None:
+            ttl = (record.expires_at - datetime.now(timezone.utc)).total_seconds()
+            cache.set(key, record.request_hash,
+                      record.status_code, record.response, ttl)
+            return _replay(request_hash, record.request_hash, record.status_code, record.response)
+
+        _check_hash(request_hash, record.request_hash)
+
+        if record.locked_until is None or record.locked_until < datetime.now(timezone.utc):
+            return None
+
+        if time.monotonic() > deadline:
+            raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                                detail="Request with this Idempotency-Key is still being processed")
+
+        await asyncio.sleep(0.1)
+
+
+async def run_idempotent(
+    scope: str,
+    idempotency_key: str,
+    payload: BaseModel,
+    handler: Callable[[], Awaitable[Any]],
+    response_model: Type[BaseModel],
+    status_code: int,
+    service: IdempotencyService,
+) -> JSONResponse:
+    key = f"{scope}:{idempotency_key}"
+    request_hash = hash_payload(payload)
+
+    cached = cache.get(key)
+    if cached:
+        return _replay(request_hash, *cached)
+
+    async with key_locks(key):
+        # Concurrent duplicates in this worker queue up behind the first request
+        cached = cache.get(key)
+        if cached:
+            return _replay(request_hash, *cached)
+
+        ttl = timedelta(hours=settings.IDEMPOTENCY_KEY_TTL_HOURS)
+        lease = timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+        while True:
+            now = datetime.now(timezone.utc)
+            if await service.claim_key(key, request_hash, now + ttl, now + lease):
+                break
+            replay = await _wait_for_response(service, key, request_hash)
+            if replay is not None:
+                return replay
+
+        try:
+            result = await handler()
+        except BaseException:
+            await service.release_key(key)
+            raise
+
+        body = jsonable_encoder(response_model.from_orm(result))
+        await service.store_response(key, status_code, body)
+        cache.set(key, request_hash, status_code, body, ttl.total_seconds())
+
+    return JSONResponse(content=body, status_code=status_code)
+
+
+async def cleanup_expired_keys() -> None:
+    while True:
+        try:
+            async with db.session_factory() as session:
+                deleted = await IdempotencyService(session).delete_expired_keys(
+                    batch_size=settings.IDEMPOTENCY_CLEANUP_BATCH_SIZE)
+            if deleted:
+                logger.info("Deleted %s expired idempotency keys", deleted)
+        except Exception:
+            logger.exception("Idempotency key cleanup failed")
+        await asyncio.sleep(settings.IDEMPOTENCY_CLEANUP_INTERVAL_SECONDS)
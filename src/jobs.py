@@ -0,0 +1,14 @@
+# Task handlers that need services. src/tasks.py can't import services (services enqueue through
+# it), so these are registered by register_tasks() when the app starts, before any worker runs
+from .database.database import db
+from .database.services import RouteMappingService
+from .tasks import task_queue
+
+
+async def sync_route_mapping(slug_en: str, name: str) -> None:
+    async with db.session_factory() as session:
+        await RouteMappingService(session).upsert_route_mapping(slug_en, name)
+
+
+def register_tasks() -> None:
+    task_queue.task("sync_route_mapping")(sync_route_mapping)
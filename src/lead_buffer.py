@@ -0,0 +1,150 @@
+import asyncio
+import fcntl
+import glob
+import json
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, TextIO
+
+from .config import settings
+from .database import schemas
+from .database.database import db
+from .database.services import RequestItemService
+from .utils import normalize_phone
+
+
+logger = logging.getLogger(__name__)
+
+
+# Write-behind buffer for the callback form: submissions are appended to a local spool segment,
+# acknowledged straight away and inserted in batches. A segment is only removed after its rows
+# are committed; segments left behind by a crashed worker are replayed on startup, and
+# submission_id makes the replay idempotent
+class LeadBuffer:
+    def __init__(self, spool_dir: str, flush_rows: int, flush_interval: float, dedup_seconds: float) -> None:
+        self.spool_dir = spool_dir
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        self.dedup_seconds = dedup_seconds
+        self._pending: list[dict[str, Any]] = []
+        self._segments: list[tuple[str, TextIO]] = []
+        self._recent: OrderedDict[str, float] = OrderedDict()
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+    def submit(self, request_item: schemas.RequestItemCreate) -> tuple[str | None, bool]:
+        phone = normalize_phone(request_item.telephone)
+        now = time.monotonic()
+        if phone and now - self._recent.get(phone, -self.dedup_seconds) < self.dedup_seconds:
+            return None, True
+
+        record = {
+            **request_item.dict(),
+            "telephone_e164": phone,
+            "submission_id": uuid.uuid4().hex,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+        }
+        self._append(record)
+        self._pending.append(record)
+
+        if phone:
+            self._recent[phone] = now
+            self._recent.move_to_end(phone)
+            while len(self._recent) > settings.LEAD_DEDUP_MAX_KEYS:
+                self._recent.popitem(last=False)
+        if len(self._pending) >= self.flush_rows:
+            self._wakeup.set()
+        return record["submission_id"], False
+
+    def _append(self, record: dict[str, Any]) -> None:
+        if not self._segments:
+            os.makedirs(self.spool_dir, exist_ok=True)
+            path = os.path.join(self.spool_dir, f"leads-{os.getpid()}-{time.time_ns()}.jsonl")
+            file = open(path, "a", encoding="utf-8")
+            # Held until the segment is flushed, so other workers never replay a live segment
+            fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            self._segments.append((path, file))
+        file = self._segments[-1][1]
+        file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        file.flush()
+        if settings.LEAD_SPOOL_FSYNC:
+            os.fsync(file.fileno())
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+            # New submissions go to a fresh segment while this batch is written
+            rows, self._pending = self._pending, []
+            segments, self._segments = self._segments, []
+            try:
+                inserted = await self._insert(rows)
+            except BaseException:
+                self._pending[:0] = rows
+                self._segments[:0] = segments
+                raise
+            for path, file in segments:
+                file.close()
+                os.remove(path)
+        return inserted
+
+    async def _insert(self, rows: list[dict[str, Any]]) -> int:
+        rows = [{**row, "created_at": datetime.fromisoformat(row["created_at"])} for row in rows]
+        async with db.session_factory() as session:
+            return await RequestItemService(session).insert_request_items(rows, dedup_seconds=self.dedup_seconds)
+
+    async def replay(self) -> int:
+        replayed = 0
+        own = {path for path, _ in self._segments}
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, "leads-*.jsonl"))):
+            if path in own:
+                continue
+            with open(path, "r+", encoding="utf-8") as file:
+                try:
+                    fcntl.flock(file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    continue
+                rows = []
+                for line in file:
+                    try:
+                        rows.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        # Torn last line from a crash mid-write; it was never acknowledged
+                        logger.warning("Skipping broken line in %s", path)
+                if rows:
+                    replayed += await self._insert(rows)
+                os.remove(path)
+        return replayed
+
+    async def run(self) -> None:
+        try:
+            replayed = await self.replay()
+            if replayed:
+                logger.info("Replayed %s spooled request items", replayed)
+        except Exception:
+            logger.exception("Replaying spooled request items failed")
+
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Flushing request items failed, keeping them spooled")
+
+    async def close(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Final request item flush failed, items stay spooled for replay")
+
+
+lead_buffer = LeadBuffer(spool_dir=settings.LEAD_SPOOL_DIR, flush_rows=settings.LEAD_FLUSH_ROWS,
+                         flush_interval=settings.LEAD_FLUSH_INTERVAL_MS / 1000, dedup_seconds=settings.LEAD_DEDUP_SECONDS)
@@ -1,11 +1,58 @@
+import asyncio
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
 from src.api.router import api_router
+from src.api.routes import feeds, health
+from src import idempotency, jobs, outbox, partitions, ratelimit, recommendations, trending
+from src.autocomplete import autocomplete_index
+from src.config import settings
+from src.database.database import db
+from src.health import expected_migration_head, readiness, warm_up
+from src.lead_buffer import lead_buffer
+from src.order_stream import broker
+from src.tasks import task_queue
+from src.view_counter import product_views
 
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    jobs.register_tasks()
+    task_queue.start()
+    background_jobs = [
+        asyncio.create_task(idempotency.cleanup_expired_keys()),
+        asyncio.create_task(partitions.maintain_partitions()),
+        asyncio.create_task(outbox.relay_events()),
+        asyncio.create_task(lead_buffer.run()),
+        asyncio.create_task(product_views.run()),
+        asyncio.create_task(recommendations.maintain_recommendations()),
+        asyncio.create_task(autocomplete_index.maintain()),
+        asyncio.create_task(trending.maintain_trend_epoch()),
+    ]
+    if settings.RATE_LIMIT_BACKEND == "postgres":
+        background_jobs.append(asyncio.create_task(ratelimit.cleanup_buckets()))
+
+    # /health/ready stays 503 until the pool and the catalog reads are warm
+    readiness.expected_head = expected_migration_head()
+    await warm_up()
+    readiness.warmed = True
+
+    yield
+
+    readiness.warmed = False
+    await broker.close()
+    await task_queue.stop()
+    for job in background_jobs:
+        job.cancel()
+    await asyncio.gather(*background_jobs, return_exceptions=True)
+    await lead_buffer.close()
+    await product_views.close()
+    await db.engine.dispose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.add_middleware(
     CORSMiddleware,
@@ -16,6 +63,8 @@ app.add_middleware(
 )
 
 app.include_router(api_router)
+app.include_router(feeds.router)
+app.include_router(health.router)
 
 
 @app.get("/")
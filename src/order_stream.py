@@ -0,0 +1,123 @@
+import asyncio
+import json
+import logging
+from typing import Any, AsyncIterator
+import asyncpg
+from sqlalchemy.engine import make_url
+
+from .config import settings
+from .database.services import ORDER_EVENTS_CHANNEL, OrderEventService, order_event_body
+
+
+logger = logging.getLogger(__name__)
+
+# Put on a subscriber's queue when it has to reconnect and replay from Last-Event-ID
+RESYNC = None
+
+
+# One LISTEN connection per worker, fanned out to every open stream through in-memory queues.
+# It is opened with the first subscriber and closed once the last one leaves
+class OrderEventBroker:
+    def __init__(self) -> None:
+        self._subscribers: set[asyncio.Queue] = set()
+        self._listener: asyncio.Task | None = None
+        self._ready = asyncio.Event()
+
+    async def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.ORDER_STREAM_QUEUE_SIZE)
+        self._subscribers.add(queue)
+        if self._listener is None or self._listener.done():
+            self._ready.clear()
+            self._listener = asyncio.create_task(self._listen())
+        # Replay happens after this returns, so LISTEN has to be active first or events
+        # committed in between would be lost
+        try:
+            await asyncio.wait_for(self._ready.wait(), settings.ORDER_STREAM_HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            self._subscribers.discard(queue)
+            raise
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+
+    def publish(self, message: Any) -> None:
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                # A stream that can't keep up is told to reconnect and catch up from the table
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(RESYNC)
+                self._subscribers.discard(queue)
+
+    async def close(self) -> None:
+        self.publish(RESYNC)
+        if self._listener:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+
+    def _on_notify(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        self.publish(json.loads(payload))
+
+    async def _listen(self) -> None:
+        dsn = make_url(settings.SQLALCHEMY_DATABASE_URI).set(
+            drivername="postgresql").render_as_string(hide_password=False)
+        reconnecting = False
+        while self._subscribers:
+            try:
+                connection = await asyncpg.connect(dsn)
+                try:
+                    await connection.add_listener(ORDER_EVENTS_CHANNEL, self._on_notify)
+                    self._ready.set()
+                    if reconnecting:
+                        self.publish(RESYNC)
+                    while self._subscribers and not connection.is_closed():
+                        await asyncio.sleep(settings.ORDER_STREAM_HEARTBEAT_SECONDS)
+                finally:
+                    self._ready.clear()
+                    await connection.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Order events listener failed")
+                await asyncio.sleep(1)
+            reconnecting = True
+
+
+broker = OrderEventBroker()
+
+
+def _format(message: dict[str, Any]) -> str:
+    return (f"id: {message['id']}\nevent: {message['type']}\n"
+            f"data: {json.dumps(message, ensure_ascii=False)}\n\n")
+
+
+async def stream_order_events(service: OrderEventService, last_event_id: str | None) -> AsyncIterator[str]:
+    queue = await broker.subscribe()
+    try:
+        yield f"retry: {settings.ORDER_STREAM_RETRY_MS}\n\n"
+
+        # Live events are delivered in commit order, not id order, so they can't be filtered by
+        # the highest id sent. Only a replayed event can show up again, as a live NOTIFY
+        replayed: set[int] = set()
+        if last_event_id and last_event_id.isdigit():
+            for event in await service.get_events_after(int(last_event_id), settings.ORDER_STREAM_REPLAY_LIMIT):
+                replayed.add(event.id)
+                yield _format(order_event_body(event))
+
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), settings.ORDER_STREAM_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": heartbeat\n\n"
+                continue
+            if message is RESYNC:
+                return
+            if message["id"] in replayed:
+                replayed.discard(message["id"])
+                continue
+            yield _format(message)
+    finally:
+        broker.unsubscribe(queue)
@@ -0,0 +1,184 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import logging
+import smtplib
+import urllib.request
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from typing import Any
+
+from .config import settings
+from .database import models
+from .database.database import db
+from .database.services import OrderEventService, order_event_body
+
+
+logger = logging.getLogger(__name__)
+
+EVENT_TITLES = {
+    "order.created": "Новый заказ",
+    "order.status_changed": "Статус заказа изменён",
+    "order.returned": "Возврат заказа",
+    "order.updated": "Заказ изменён",
+    "order.deleted": "Заказ удалён",
+}
+
+
+def event_text(event: models.OrderEvent) -> str:
+    payload = event.payload
+    line = f"{EVENT_TITLES.get(event.event_type, event.event_type)} #{event.order_id}: {payload.get('status')}"
+    if payload.get("old_status"):
+        line += f" (было: {payload['old_status']})"
+    if event.event_type == "order.created":
+        line += (f", {payload.get('full_name')}, {payload.get('telephone')}, "
+                 f"{payload.get('items')} шт., {payload.get('total')} {settings.FEED_CURRENCY}")
+    return line
+
+
+def _post_json(url: str, body: dict[str, Any], headers: dict[str, str] | None = None) -> None:
+    data = json.dumps(body, ensure_ascii=False).encode()
+    request = urllib.request.Request(url, data=data, method="POST", headers={
+        "Content-Type": "application/json", **(headers or {})})
+    with urllib.request.urlopen(request, timeout=settings.OUTBOX_SEND_TIMEOUT_SECONDS) as response:
+        response.read()
+
+
+# Sinks get a whole batch at once and raise on failure; the relay tracks per-sink delivery,
+# so a sink that fails does not cause duplicates in the ones that succeeded
+class WebhookSink:
+    name = "webhook"
+
+    def __init__(self, url: str, secret: str | None = None) -> None:
+        self.url = url
+        self.secret = secret
+
+    def _send(self, events: list[models.OrderEvent]) -> None:
+        body = {"events": [order_event_body(event) for event in events]}
+        headers = {}
+        if self.secret:
+            signed = json.dumps(body, ensure_ascii=False).encode()
+            headers["X-Signature"] = hmac.new(self.secret.encode(), signed, hashlib.sha256).hexdigest()
+        _post_json(self.url, body, headers)
+
+    async def send(self, events: list[models.OrderEvent]) -> None:
+        await asyncio.to_thread(self._send, events)
+
+
+class SmtpSink:
+    name = "smtp"
+
+    def __init__(self, host: str, port: int, sender: str, recipients: list[str], username: str | None = None, password: str | None = None, starttls: bool = True) -> None:
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.recipients = recipients
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+
+    def _send(self, events: list[models.OrderEvent]) -> None:
+        message = EmailMessage()
+        message["From"] = self.sender
+        message["To"] = ", ".join(self.recipients)
+        message["Subject"] = event_text(events[0]) if len(events) == 1 else f"Заказы: {len(events)} событий"
+        message.set_content("\n".join(event_text(event) for event in events))
+        with smtplib.SMTP(self.host, self.port, timeout=settings.OUTBOX_SEND_TIMEOUT_SECONDS) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or "")
+            smtp.send_message(message)
+
+    async def send(self, events: list[models.OrderEvent]) -> None:
+        await asyncio.to_thread(self._send, events)
+
+
+class TelegramSink:
+    name = "telegram"
+
+    def __init__(self, api_url: str, token: str, chat_id: str) -> None:
+        self.url = f"{api_url.rstrip('/')}/bot{token}/sendMessage"
+        self.chat_id = chat_id
+
+    def _send(self, events: list[models.OrderEvent]) -> None:
+        _post_json(self.url, {"chat_id": self.chat_id,
+                              "text": "\n".join(event_text(event) for event in events)})
+
+    async def send(self, events: list[models.OrderEvent]) -> None:
+        await asyncio.to_thread(self._send, events)
+
+
+def configured_sinks() -> list[Any]:
+    sinks = []
+    if settings.ORDER_WEBHOOK_URL:
+        sinks.append(WebhookSink(settings.ORDER_WEBHOOK_URL, settings.ORDER_WEBHOOK_SECRET))
+    if settings.SMTP_HOST and settings.ORDER_NOTIFY_EMAILS:
+        sinks.append(SmtpSink(settings.SMTP_HOST, settings.SMTP_PORT, settings.SMTP_SENDER, settings.ORDER_NOTIFY_EMAILS,
+                              settings.SMTP_USERNAME, settings.SMTP_PASSWORD, settings.SMTP_STARTTLS))
+    if settings.TELEGRAM_BOT_TOKEN and settings.TELEGRAM_CHAT_ID:
+        sinks.append(TelegramSink(settings.TELEGRAM_API_URL,
+                                  settings.TELEGRAM_BOT_TOKEN, settings.TELEGRAM_CHAT_ID))
+    return sinks
+
+
+def retry_delay(attempts: int) -> timedelta:
+    return timedelta(seconds=min(settings.OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+                                 settings.OUTBOX_RETRY_MAX_SECONDS))
+
+
+async def relay_batch(sinks: list[Any]) -> int:
+    async with db.session_factory() as session:
+        events = await OrderEventService(session).claim_batch(
+            settings.OUTBOX_BATCH_SIZE, timedelta(seconds=settings.OUTBOX_LEASE_SECONDS))
+        # Sinks run outside any transaction; the results are written in a second short one
+        await session.commit()
+        if not events:
+            return 0
+
+        errors = {}
+        for sink in sinks:
+            pending = [event for event in events if sink.name not in event.published_to]
+            if not pending:
+                continue
+            try:
+                await sink.send(pending)
+            except Exception as error:
+                logger.warning("Order events sink %s failed: %r", sink.name, error)
+                errors[sink.name] = repr(error)
+            else:
+                for event in pending:
+                    event.published_to = [*event.published_to, sink.name]
+
+        now = datetime.now(timezone.utc)
+        for event in events:
+            if not errors:
+                event.processed_at = now
+                continue
+            event.attempts += 1
+            event.last_error = "; ".join(f"{name}: {error}" for name, error in errors.items())
+            if event.attempts >= settings.OUTBOX_MAX_ATTEMPTS:
+                logger.error("Giving up on order event %s: %s", event.id, event.last_error)
+                event.processed_at = now
+            else:
+                event.next_attempt_at = now + retry_delay(event.attempts)
+        await session.commit()
+    return len(events)
+
+
+async def relay_events() -> None:
+    sinks = configured_sinks()
+    while True:
+        try:
+            relayed = await relay_batch(sinks)
+            if relayed < settings.OUTBOX_BATCH_SIZE:
+                async with db.session_factory() as session:
+                    await OrderEventService(session).delete_processed(
+                        datetime.now(timezone.utc) - timedelta(days=settings.OUTBOX_RETENTION_DAYS),
+                        batch_size=settings.OUTBOX_BATCH_SIZE * 10)
+        except Exception:
+            logger.exception("Order events relay failed")
+            relayed = 0
+        if relayed < settings.OUTBOX_BATCH_SIZE:
+            await asyncio.sleep(settings.OUTBOX_POLL_INTERVAL_SECONDS)
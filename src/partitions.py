@@ -0,0 +1,61 @@
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .config import settings
+from .database.database import db
+
+
+logger = logging.getLogger(__name__)
+
+# Parents first: an order_items partition is only useful once its orders partition exists
+PARTITIONED_TABLES = ("orders", "order_items")
+PARTITION_LOCK_KEY = 7_033_001
+
+
+def month_start(day: date, offset: int = 0) -> date:
+    month = day.month - 1 + offset
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def partition_bounds(month: date) -> tuple[datetime, datetime]:
+    upper = month_start(month, 1)
+    return (datetime(month.year, month.month, 1, tzinfo=timezone.utc),
+            datetime(upper.year, upper.month, 1, tzinfo=timezone.utc))
+
+
+async def ensure_partitions(conn: AsyncConnection, months_ahead: int) -> list[str]:
+    # Every worker runs this on a timer; the advisory lock keeps them from racing on DDL
+    await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PARTITION_LOCK_KEY})
+    current = month_start(datetime.now(timezone.utc).date())
+    created = []
+    for offset in range(months_ahead + 1):
+        month = month_start(current, offset)
+        start, end = partition_bounds(month)
+        for table in PARTITIONED_TABLES:
+            name = partition_name(table, month)
+            if await conn.scalar(text("SELECT to_regclass(:name)"), {"name": name}):
+                continue
+            await conn.execute(text(
+                f"CREATE TABLE {name} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"))
+            created.append(name)
+    return created
+
+
+async def maintain_partitions() -> None:
+    while True:
+        try:
+            async with db.engine.begin() as conn:
+                created = await ensure_partitions(conn, settings.ORDER_PARTITION_MONTHS_AHEAD)
+            if created:
+                logger.info("Created order partitions: %s", ", ".join(created))
+        except Exception:
+            logger.exception("Order partition maintenance failed")
+        await asyncio.sleep(settings.ORDER_PARTITION_CHECK_INTERVAL_SECONDS)
@@ -0,0 +1,128 @@
+import asyncio
+import logging
+import math
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable
+from fastapi import HTTPException, Request, status
+from sqlalchemy import text
+
+from .config import settings
+from .database.database import db
+
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {"second": 1, "minute": 60, "hour": 60 * 60, "day": 60 * 60 * 24}
+
+
+@dataclass(frozen=True)
+class Limit:
+    capacity: float
+    rate: float
+
+    @classmethod
+    def parse(cls, value: str) -> "Limit":
+        # "10/minute": bursts of up to 10, refilled evenly over a minute
+        count, period = value.split("/")
+        return cls(capacity=float(count), rate=float(count) / PERIODS[period.strip()])
+
+
+# Token buckets kept per worker; the least recently used ones are dropped past max_keys,
+# which at worst forgives a client that has been idle the longest
+class MemoryBackend:
+    def __init__(self, max_keys: int) -> None:
+        self.max_keys = max_keys
+        self._buckets: OrderedDict[str, tuple[float, float]] = OrderedDict()
+
+    async def hit(self, key: str, limit: Limit) -> float:
+        now = time.monotonic()
+        tokens, updated = self._buckets.get(key, (limit.capacity, now))
+        tokens = min(limit.capacity, tokens + (now - updated) * limit.rate)
+        retry_after = 0.0
+        if tokens >= 1:
+            tokens -= 1
+        else:
+            retry_after = (1 - tokens) / limit.rate
+
+        self._buckets[key] = (tokens, now)
+        self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+        return retry_after
+
+
+# Shared buckets in an UNLOGGED table, so limits hold across workers; one upsert per hit.
+# Every SET expression sees the old row, so the refill is computed from the previous state
+REFILL = ("LEAST(CAST(:capacity AS float8), b.tokens + "
+          "CAST(EXTRACT(EPOCH FROM now() - b.updated_at) AS float8) * CAST(:rate AS float8))")
+
+HIT_BUCKET = text(f"""
+    INSERT INTO rate_limit_buckets AS b (key, tokens, allowed, updated_at)
+    VALUES (:key, CAST(:capacity AS float8) - 1, true, now())
+    ON CONFLICT (key) DO UPDATE SET
+        tokens = CASE WHEN {REFILL} >= 1 THEN {REFILL} - 1 ELSE {REFILL} END,
+        allowed = {REFILL} >= 1,
+        updated_at = now()
+    RETURNING tokens, allowed
+""")
+
+
+class PostgresBackend:
+    async def hit(self, key: str, limit: Limit) -> float:
+        async with db.session_factory() as session:
+            tokens, allowed = (await session.execute(HIT_BUCKET, {
+                "key": key, "capacity": limit.capacity, "rate": limit.rate})).one()
+            await session.commit()
+        return 0.0 if allowed else (1 - tokens) / limit.rate
+
+
+class RateLimiter:
+    def __init__(self, backend: Any) -> None:
+        self.backend = backend
+
+    async def check(self, scope: str, key: str | None, limit: str) -> None:
+        if not settings.RATE_LIMIT_ENABLED or not key:
+            return
+        try:
+            retry_after = await self.backend.hit(f"{scope}:{key}", Limit.parse(limit))
+        except Exception:
+            # A broken limiter must not take the shop down with it
+            logger.exception("Rate limit check failed for %s", scope)
+            return
+        if retry_after > 0:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                                detail="Too many requests, try again later",
+                                headers={"Retry-After": str(math.ceil(retry_after))})
+
+    def per_ip(self, scope: str, limit: str) -> Callable[[Request], Any]:
+        async def dependency(request: Request) -> None:
+            await self.check(f"{scope}:ip", client_ip(request), limit)
+        return dependency
+
+
+def client_ip(request: Request) -> str | None:
+    if settings.RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else None
+
+
+async def cleanup_buckets() -> None:
+    # Idle buckets are full again anyway, dropping them only keeps the table small
+    while True:
+        try:
+            async with db.session_factory() as session:
+                await session.execute(text(
+                    "DELETE FROM rate_limit_buckets WHERE updated_at < now() - make_interval(secs => :idle)"),
+                    {"idle": settings.RATE_LIMIT_IDLE_SECONDS})
+                await session.commit()
+        except Exception:
+            logger.exception("Rate limit bucket cleanup failed")
+        await asyncio.sleep(settings.RATE_LIMIT_IDLE_SECONDS)
+
+
+limiter = RateLimiter(PostgresBackend() if settings.RATE_LIMIT_BACKEND == "postgres"
+                      else MemoryBackend(max_keys=settings.RATE_LIMIT_MAX_KEYS))
@@ -0,0 +1,136 @@
+# "Frequently bought together" recommendations.
+#
+#   python -m src.recommendations          # catch up on orders placed since the last run
+#   python -m src.recommendations --full   # rebuild from every order and refresh every product
+#
+# Orders are folded into product_pairs (a sparse co-occurrence matrix kept as rows) in batches
+# of RELATED_BATCH_ORDERS past the watermark in job_watermarks. Only the products a batch touched
+# get their top RELATED_PRODUCTS_K recomputed into product_recommendations. The counting is a
+# self-join inside Postgres, so no order data leaves the database. Workers also run the
+# incremental job on a timer; the advisory lock lets only one of them do it at a time, and the
+# watermark moves in the same transaction as the counts, so no order is counted twice. Returned
+# orders are left out here; an order returned (or deleted) after it was folded in has its pairs
+# taken back by ProductPairService in the same transaction as the status change.
+import argparse
+import asyncio
+import logging
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from .config import settings
+from .database import schemas
+from .database.database import db
+from .database.services import PRODUCT_ACTIVE_STATUS, RECOMMENDATIONS_SQL, RELATED_LOCK_KEY, RELATED_WATERMARK
+
+
+logger = logging.getLogger(__name__)
+
+
+async def refresh_recommendations(conn: AsyncConnection) -> int:
+    # Rebuilds the rows of every product in related_touched
+    await conn.execute(text("""
+        DELETE FROM product_recommendations r USING related_touched t WHERE r.product_id = t.product_id
+    """))
+    result = await conn.execute(text(RECOMMENDATIONS_SQL), {
+        "active": PRODUCT_ACTIVE_STATUS, "k": settings.RELATED_PRODUCTS_K})
+    return result.rowcount
+
+
+async def process_batch(conn: AsyncConnection) -> int | None:
+    # One transaction: returns the number of orders folded in, or None when another worker
+    # holds the lock
+    if not await conn.scalar(text("SELECT pg_try_advisory_xact_lock(:key)"), {"key": RELATED_LOCK_KEY}):
+        return None
+    after = await conn.scalar(text("SELECT value FROM job_watermarks WHERE name = :name"),
+                              {"name": RELATED_WATERMARK}) or 0
+    # Orders younger than the lag may belong to transactions that have not committed yet
+    upto, orders = (await conn.execute(text("""
+        SELECT max(id), count(*) FROM (
+            SELECT id FROM orders
+            WHERE id > :after AND created_at < now() - make_interval(secs => :lag)
+            ORDER BY id LIMIT :batch
+        ) batch
+    """), {"after": after, "lag": settings.RELATED_LAG_SECONDS, "batch": settings.RELATED_BATCH_ORDERS})).one()
+    if not orders:
+        return 0
+
+    # Huge orders are skipped: their pairs grow quadratically and say little about the products
+    await conn.execute(text("""
+        CREATE TEMP TABLE related_batch ON COMMIT DROP AS
+        SELECT DISTINCT oi.order_id, oi.product_id
+        FROM orders o
+        JOIN order_items oi ON oi.order_id = o.id AND oi.created_at = o.created_at
+        WHERE o.id > :after AND o.id <= :upto AND o.status <> :returned AND oi.product_id IS NOT NULL
+          AND o.id IN (
+              SELECT order_id FROM order_items WHERE order_id > :after AND order_id <= :upto
+              GROUP BY order_id HAVING count(DISTINCT product_id) BETWEEN 2 AND :max_products
+          )
+    """), {"after": after, "upto": upto, "returned": schemas.OrderStatus.Возврат.value,
+           "max_products": settings.RELATED_MAX_ORDER_PRODUCTS})
+    await conn.execute(text("""
+        INSERT INTO product_pairs (product_id, related_id, orders)
+        SELECT a.product_id, b.product_id, count(*)
+        FROM related_batch a JOIN related_batch b ON b.order_id = a.order_id AND b.product_id <> a.product_id
+        GROUP BY a.product_id, b.product_id
+        ORDER BY a.product_id, b.product_id
+        ON CONFLICT (product_id, related_id) DO UPDATE SET orders = product_pairs.orders + excluded.orders
+    """))
+    await conn.execute(text("""
+        CREATE TEMP TABLE related_touched ON COMMIT DROP AS SELECT DISTINCT product_id FROM related_batch
+    """))
+    await refresh_recommendations(conn)
+    await conn.execute(text("""
+        INSERT INTO job_watermarks (name, value) VALUES (:name, :upto)
+        ON CONFLICT (name) DO UPDATE SET value = excluded.value, updated_at = now()
+    """), {"name": RELATED_WATERMARK, "upto": upto})
+    return orders
+
+
+async def catch_up() -> int:
+    processed = 0
+    while True:
+        async with db.engine.begin() as conn:
+            orders = await process_batch(conn)
+        if not orders:
+            return processed
+        processed += orders
+
+
+async def rebuild() -> int:
+    async with db.engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": RELATED_LOCK_KEY})
+        await conn.execute(text("TRUNCATE product_pairs, product_recommendations"))
+        await conn.execute(text("DELETE FROM job_watermarks WHERE name = :name"), {"name": RELATED_WATERMARK})
+    processed = await catch_up()
+    # Products that were never sold together still get their same-sub/category fallbacks
+    async with db.engine.begin() as conn:
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": RELATED_LOCK_KEY})
+        await conn.execute(text("""
+            CREATE TEMP TABLE related_touched ON COMMIT DROP AS SELECT id AS product_id FROM products
+        """))
+        await refresh_recommendations(conn)
+    return processed
+
+
+async def maintain_recommendations() -> None:
+    while True:
+        try:
+            processed = await catch_up()
+            if processed:
+                logger.info("Folded %s orders into related products", processed)
+        except Exception:
+            logger.exception("Related products update failed")
+        await asyncio.sleep(settings.RELATED_REFRESH_SECONDS)
+
+
+async def main(full: bool) -> None:
+    db.engine.echo = False
+    processed = await (rebuild() if full else catch_up())
+    print(f"folded {processed} orders into related products")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--full", action="store_true")
+    args = parser.parse_args()
+    asyncio.run(main(args.full))
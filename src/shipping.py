@@ -0,0 +1,95 @@
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Any
+from sqlalchemy import func, select
+
+from .config import settings
+from .database import models
+from .database.database import db
+
+
+class ShippingUnavailableError(Exception):
+    pass
+
+
+# Rate tables of every zone, held per worker so quotes never touch the database. Each
+# (zone, origin) table is a sorted list of bracket upper bounds, so the bracket for a weight is
+# one bisect. The tables are reloaded when a cheap version query (checked at most every
+# SHIPPING_CACHE_SECONDS) shows a change, and right away in the worker that made the change
+class ShippingRates:
+    def __init__(self, ttl: float) -> None:
+        self.ttl = ttl
+        self._zones: dict[str, str] = {}
+        self._tables: dict[tuple[str, str], tuple[list[float], list[int]]] = {}
+        self._version: tuple[Any, ...] | None = None
+        self._checked_at = float("-inf")
+        self._lock = asyncio.Lock()
+
+    def invalidate(self) -> None:
+        self._version = None
+        self._checked_at = float("-inf")
+
+    async def _ensure_fresh(self) -> None:
+        if time.monotonic() - self._checked_at < self.ttl:
+            return
+        async with self._lock:
+            if time.monotonic() - self._checked_at < self.ttl:
+                return
+            async with db.session_factory() as session:
+                version = tuple((await session.execute(select(
+                    select(func.count(models.ShippingZone.id), func.max(func.coalesce(
+                        models.ShippingZone.updated_at, models.ShippingZone.created_at))).subquery(),
+                    select(func.count(models.ShippingRate.id), func.max(func.coalesce(
+                        models.ShippingRate.updated_at, models.ShippingRate.created_at))).subquery()
+                ))).one())
+                if version != self._version:
+                    rows = await session.execute(select(
+                        models.ShippingZone.code,
+                        models.ShippingZone.name,
+                        models.ShippingRate.origin,
+                        models.ShippingRate.max_weight,
+                        models.ShippingRate.price
+                    ).outerjoin(models.ShippingRate).where(models.ShippingZone.active.is_(True)).order_by(
+                        models.ShippingZone.code, models.ShippingRate.origin, models.ShippingRate.max_weight.asc().nulls_last()))
+                    self._load(rows)
+                    self._version = version
+            self._checked_at = time.monotonic()
+
+    def _load(self, rows: Any) -> None:
+        zones, tables = {}, {}
+        for code, name, origin, max_weight, price in rows:
+            zones[code] = name
+            if price is None:
+                continue
+            weights, prices = tables.setdefault((code, origin or ""), ([], []))
+            weights.append(float(max_weight) if max_weight is not None else float("inf"))
+            prices.append(price)
+        self._zones, self._tables = zones, tables
+
+    def _price(self, zone: str, origin: str, weight: float) -> int | None:
+        # Origin-specific table first, then the zone's table for any origin ("")
+        table = self._tables.get((zone, origin)) or self._tables.get((zone, ""))
+        if table is None:
+            return None
+        weights, prices = table
+        index = bisect_left(weights, weight)
+        return prices[index] if index < len(weights) else None
+
+    async def quote(self, zone: str, parcels: dict[str, float]) -> dict[str, Any]:
+        await self._ensure_fresh()
+        if zone not in self._zones:
+            raise ShippingUnavailableError(f"Unknown shipping zone {zone}")
+
+        lines, total = [], 0
+        for origin, weight in sorted(parcels.items()):
+            price = self._price(zone, origin, weight)
+            if price is None:
+                raise ShippingUnavailableError(
+                    f"No shipping rate to {zone} for {weight:g} {settings.FEED_WEIGHT_UNIT} from {origin or 'any origin'}")
+            lines.append({"origin": origin, "weight": weight, "price": price})
+            total += price
+        return {"zone": zone, "zone_name": self._zones[zone], "parcels": lines, "total": total}
+
+
+shipping_rates = ShippingRates(ttl=settings.SHIPPING_CACHE_SECONDS)
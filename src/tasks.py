@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import random
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .config import settings
+from .database import models
+from .database.database import db
+
+
+logger = logging.getLogger(__name__)
+
+TaskHandler = Callable[..., Awaitable[Any]]
+
+
+@dataclass
+class Job:
+    name: str
+    payload: dict[str, Any]
+    attempts: int = 0
+    id: int | None = None
+
+
+@dataclass
+class RegisteredTask:
+    handler: TaskHandler
+    durable: bool = True
+    max_attempts: int = field(default_factory=lambda: settings.TASK_MAX_ATTEMPTS)
+
+
+def retry_delay(attempts: int) -> float:
+    delay = min(settings.TASK_RETRY_BASE_SECONDS * 2 ** (attempts - 1),
+                settings.TASK_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+# In-process queue for side effects that should not hold up the request. Handlers are registered
+# by name, jobs only carry JSON-able payloads, so the same job can also live in the tasks table
+# when TASK_QUEUE_DURABLE is on and every uvicorn worker pulls from it
+class TaskQueue:
+    def __init__(self, workers: int, max_size: int, durable: bool) -> None:
+        self.workers = workers
+        self.durable = durable
+        self.registry: dict[str, RegisteredTask] = {}
+        self._queue: asyncio.Queue[Job] = asyncio.Queue(maxsize=max_size)
+        self._retries: set[asyncio.Task] = set()
+        self._workers: list[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+
+    def task(self, name: str, durable: bool = True, max_attempts: int | None = None) -> Callable[[TaskHandler], TaskHandler]:
+        def register(handler: TaskHandler) -> TaskHandler:
+            self.registry[name] = RegisteredTask(
+                handler, durable, max_attempts or settings.TASK_MAX_ATTEMPTS)
+            return handler
+        return register
+
+    async def enqueue(self, task: str, /, session: AsyncSession | None = None, **payload: Any) -> None:
+        # With a session the durable row is written in the caller's transaction and only becomes
+        # visible to workers once it commits; in-memory jobs should be enqueued after the commit.
+        # The task name is positional-only so payloads are free to carry a "name" key
+        if task not in self.registry:
+            raise KeyError(f"Unknown task {task}")
+
+        if not (self.durable and self.registry[task].durable):
+            await self._queue.put(Job(task, payload))
+            return
+
+        stmt = insert(models.Task).values(name=task, payload=payload)
+        if session is not None:
+            await session.execute(stmt)
+            return
+        async with db.session_factory() as session:
+            await session.execute(stmt)
+            await session.commit()
+
+    def start(self) -> None:
+        self._stopping.clear()
+        self._workers = [asyncio.create_task(self._memory_worker())
+                         for _ in range(self.workers)]
+        if self.durable:
+            self._workers += [asyncio.create_task(self._durable_worker())
+                              for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        # Finish what is already queued (including pending retries), then stop the workers
+        self._stopping.set()
+        try:
+            await asyncio.wait_for(self._drain(), settings.TASK_DRAIN_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            logger.warning("Task queue did not drain in time, %s jobs dropped",
+                           self._queue.qsize() + len(self._retries))
+        for worker in self._workers:
+            worker.cancel()
+        for retry in self._retries:
+            retry.cancel()
+        await asyncio.gather(*self._workers, *self._retries, return_exceptions=True)
+        self._workers = []
+
+    async def _drain(self) -> None:
+        while True:
+            await self._queue.join()
+            if not self._retries:
+                return
+            await asyncio.gather(*self._retries, return_exceptions=True)
+
+    async def _run(self, job: Job) -> None:
+        await self.registry[job.name].handler(**job.payload)
+
+    async def _memory_worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                job.attempts += 1
+                await self._run(job)
+            except Exception:
+                registered = self.registry[job.name]
+                if job.attempts >= registered.max_attempts:
+                    logger.exception("Task %s failed after %s attempts", job.name, job.attempts)
+                else:
+                    logger.warning("Task %s failed, retrying", job.name, exc_info=True)
+                    retry = asyncio.create_task(self._retry_later(job, retry_delay(job.attempts)))
+                    self._retries.add(retry)
+                    retry.add_done_callback(self._retries.discard)
+            finally:
+                self._queue.task_done()
+
+    async def _retry_later(self, job: Job, delay: float) -> None:
+        await asyncio.sleep(delay)
+        await self._queue.put(job)
+
+    async def _durable_worker(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                job = await self._claim()
+            except Exception:
+                logger.exception("Claiming a task failed")
+                job = None
+
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), settings.TASK_POLL_INTERVAL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            try:
+                await self._run(job)
+            except Exception as error:
+                await self._fail(job, error)
+            else:
+                async with db.session_factory() as session:
+                    await session.execute(delete(models.Task).where(models.Task.id == job.id))
+                    await session.commit()
+
+    async def _claim(self) -> Job | None:
+        # SKIP LOCKED lets every worker grab a different row; locked_until hands the job to
+        # someone else if this process dies before finishing it
+        now = datetime.now(timezone.utc)
+        async with db.session_factory() as session:
+            claimable = select(models.Task.id).where(
+                models.Task.status == "pending",
+                models.Task.run_at <= now,
+                models.Task.name.in_(list(self.registry))
+            ).where(
+                (models.Task.locked_until.is_(None)) | (models.Task.locked_until < now)
+            ).order_by(models.Task.run_at).limit(1).with_for_update(skip_locked=True).scalar_subquery()
+            task = await session.scalar(update(models.Task).where(models.Task.id == claimable).values(
+                attempts=models.Task.attempts + 1,
+                locked_until=now + timedelta(seconds=settings.TASK_LOCK_SECONDS)
+            ).returning(models.Task))
+            await session.commit()
+        if task is None:
+            return None
+        return Job(task.name, task.payload, task.attempts, task.id)
+
+    async def _fail(self, job: Job, error: Exception) -> None:
+        registered = self.registry[job.name]
+        values: dict[str, Any] = {"locked_until": None, "last_error": repr(error)}
+        if job.attempts >= registered.max_attempts:
+            logger.error("Task %s (%s) failed after %s attempts: %r", job.name, job.id, job.attempts, error)
+            values["status"] = "failed"
+        else:
+            logger.warning("Task %s (%s) failed, retrying: %r", job.name, job.id, error)
+            values["run_at"] = datetime.now(timezone.utc) + timedelta(seconds=retry_delay(job.attempts))
+        async with db.session_factory() as session:
+            await session.execute(update(models.Task).where(models.Task.id == job.id).values(**values))
+            await session.commit()
+
+
+task_queue = TaskQueue(workers=settings.TASK_WORKERS,
+                       max_size=settings.TASK_QUEUE_SIZE, durable=settings.TASK_QUEUE_DURABLE)
@@ -0,0 +1,24 @@
+import asyncio
+import logging
+
+from .config import settings
+from .database.database import db
+from .database.services import ProductSalesService
+
+
+logger = logging.getLogger(__name__)
+
+
+# Every worker checks on a timer; the first one past PRODUCT_TREND_REBASE_DAYS moves the epoch
+# and the others find nothing left to do
+async def maintain_trend_epoch() -> None:
+    while True:
+        try:
+            async with db.session_factory() as session:
+                shift = await ProductSalesService(session).rebase_trend_scores(
+                    min_days=settings.PRODUCT_TREND_REBASE_DAYS)
+            if shift:
+                logger.info("Moved the trend score epoch forward by %s days", shift)
+        except Exception:
+            logger.exception("Trend score rebase failed")
+        await asyncio.sleep(settings.PRODUCT_TREND_REBASE_CHECK_SECONDS)
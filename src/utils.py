@@ -1,13 +1,14 @@
+import asyncio
 import base64
+import binascii
 import os
+import re
 import uuid
-from dotenv import load_dotenv
-from passlib.context import CryptContext
 from datetime import datetime, timedelta
+from functools import lru_cache
 from typing import Any
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from jose import JWTError, jwt
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
@@ -15,11 +16,26 @@ from .config import settings
 from .database import schemas
 from .database.database import db
 from .database import models
+from .tasks import task_queue
 
-load_dotenv()
+# passlib (bcrypt), python-jose (ecdsa, rsa) and slugify are imported on first use rather than
+# with the app; see gunicorn.conf.py for loading them once before workers fork
+@lru_cache(maxsize=None)
+def get_pwd_context() -> Any:
+    from passlib.context import CryptContext
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+@lru_cache(maxsize=None)
+def get_jwt() -> Any:
+    from jose import jwt
+    return jwt
+
+
+def slugify(text: str) -> str:
+    from slugify import slugify as _slugify
+    return _slugify(text)
+
 
 reusable_oauth2 = OAuth2PasswordBearer(tokenUrl="api/login")
 
@@ -28,7 +44,25 @@ ALGORITHM = settings.ALGORITHM
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 
 
+def normalize_phone(phone: str) -> str | None:
+    # "+7 (700) 123-45-67", "87001234567" and "7001234567" all become "+77001234567"
+    digits = re.sub(r"\D", "", phone or "")
+    if not digits:
+        return None
+
+    national_length = settings.PHONE_NATIONAL_LENGTH
+    country_code = settings.PHONE_COUNTRY_CODE
+    if not phone.strip().startswith("+"):
+        if len(digits) == national_length:
+            digits = country_code + digits
+        elif len(digits) == national_length + 1 and digits.startswith(settings.PHONE_TRUNK_PREFIX):
+            digits = country_code + digits[1:]
+
+    return "+" + digits
+
+
 async def create_access_token(token_payload: dict[str:Any]) -> str:
+    jwt = get_jwt()
     to_encode = token_payload.copy()
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     to_encode.update({"exp": expire})
@@ -37,6 +71,8 @@ async def create_access_token(token_payload: dict[str:Any]) -> str:
 
 
 async def verify_access_token(token: str, credential_exception: HTTPException):
+    from jose import JWTError
+    jwt = get_jwt()
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("user_id")
@@ -63,101 +99,63 @@ async def get_current_user(token: str = Depends(reusable_oauth2), session: Async
     return user
 
 
-def upload_product_images(images: list[str]) -> list[str]:
-    image_urls = []
-
-    for image_data in images:
-        # Extract the file extension from the base64 image data
-        file_extension = '.' + image_data.split('/')[1].split(';')[0]
-
-       # Generate a unique filename using UUID
-        unique_id = str(uuid.uuid4())
-        dynamic_filename = f"productImage_{unique_id}{file_extension}"
-
-        # Decode the base64 image data
-        image_data = image_data.split(',')[1]
-        image_bytes = base64.b64decode(image_data)
-
-        # Specify the directory where you want to save the image
-        directory = f"{os.getenv('MEDIA_URL')}/ProductImages"
-
-        # Create the directory if it doesn't exist
-        if not os.path.exists(directory):
-            os.makedirs(directory)
+def _write_image(image_bytes: bytes, save_path: str) -> None:
+    # Create the directory if it doesn't exist
+    os.makedirs(os.path.dirname(save_path), exist_ok=True)
 
-        # Specify the save path for the image
-        save_path = os.path.join(directory, dynamic_filename)
+    # Save the image to the specified path
+    with open(save_path, 'wb') as f:
+        f.write(image_bytes)
 
-        # Save the image to the specified path
-        with open(save_path, 'wb') as f:
-            f.write(image_bytes)
 
-        # Store the generated image filename
-        image_urls.append(
-            f"{os.getenv('MEDIA_URL')}/ProductImages/{dynamic_filename}")
+# Kept in memory only, so the job may carry the decoded bytes instead of a JSON payload
+@task_queue.task("save_image", durable=False)
+async def save_image(image_bytes: bytes, save_path: str) -> None:
+    await asyncio.to_thread(_write_image, image_bytes, save_path)
 
-    return image_urls
 
+async def _upload_image(image_data: str, folder: str, prefix: str, pending: list[dict[str, Any]] | None = None) -> str:
+    # Validate and decode while the client is still waiting, only the file write is deferred
+    header, _, encoded = image_data.partition(',')
+    match = re.fullmatch(r"data:image/([\w.+-]+);base64", header)
+    try:
+        image_bytes = base64.b64decode(encoded, validate=True) if match else b""
+    except binascii.Error:
+        image_bytes = b""
+    if not image_bytes:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail="Image must be a base64 encoded data:image URL")
 
-def upload_category_image(image_base64: str) -> str:
     # Extract the file extension from the base64 image data
-    file_extension = '.' + image_base64.split('/')[1].split(';')[0]
+    file_extension = '.' + match.group(1)
 
     # Generate a unique filename using UUID
     unique_id = str(uuid.uuid4())
-    dynamic_filename = f"categoryImage_{unique_id}{file_extension}"
+    dynamic_filename = f"{prefix}_{unique_id}{file_extension}"
 
-    # Decode the base64 image data
-    image_base64 = image_base64.split(',')[1]
-    image = base64.b64decode(image_base64)
+    # The URL is known up front, writing the file happens on the task queue. With a pending
+    # list the write waits for save_images, so a rejected update leaves no file behind
+    save_path = os.path.join(f"{os.getenv('MEDIA_URL')}/{folder}", dynamic_filename)
+    if pending is None:
+        await task_queue.enqueue("save_image", image_bytes=image_bytes, save_path=save_path)
+    else:
+        pending.append({"image_bytes": image_bytes, "save_path": save_path})
 
-    # Specify the directory where you want to save the image
-    directory = f"{os.getenv('MEDIA_URL')}/CategoryImages"
-
-    # Create the directory if it doesn't exist
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-
-    # Specify the save path for the image
-    save_path = os.path.join(directory, dynamic_filename)
-
-    # Save the image to the specified path
-    with open(save_path, 'wb') as f:
-        f.write(image)
-
-    # Store the generated image filename
-    image_url = f"{os.getenv('MEDIA_URL')}/CategoryImages/{dynamic_filename}"
-
-    return image_url
+    return f"{os.getenv('MEDIA_URL')}/{folder}/{dynamic_filename}"
 
 
-def upload_content_image(image_base64: str) -> str:
-    # Extract the file extension from the base64 image data
-    file_extension = '.' + image_base64.split('/')[1].split(';')[0]
-
-    # Generate a unique filename using UUID
-    unique_id = str(uuid.uuid4())
-    dynamic_filename = f"contentImage_{unique_id}{file_extension}"
+async def save_images(pending: list[dict[str, Any]]) -> None:
+    for image in pending:
+        await task_queue.enqueue("save_image", **image)
 
-    # Decode the base64 image data
-    image_base64 = image_base64.split(',')[1]
-    image = base64.b64decode(image_base64)
 
-    # Specify the directory where you want to save the image
-    directory = f"{os.getenv('MEDIA_URL')}/ContentImages"
+async def upload_product_images(images: list[str], pending: list[dict[str, Any]] | None = None) -> list[str]:
+    return [await _upload_image(image_data, "ProductImages", "productImage", pending) for image_data in images]
 
-    # Create the directory if it doesn't exist
-    if not os.path.exists(directory):
-        os.makedirs(directory)
-
-    # Specify the save path for the image
-    save_path = os.path.join(directory, dynamic_filename)
 
-    # Save the image to the specified path
-    with open(save_path, 'wb') as f:
-        f.write(image)
+async def upload_category_image(image_base64: str, pending: list[dict[str, Any]] | None = None) -> str:
+    return await _upload_image(image_base64, "CategoryImages", "categoryImage", pending)
 
-    # Store the generated image filename
-    image_url = f"{os.getenv('MEDIA_URL')}/ContentImages/{dynamic_filename}"
 
-    return image_url
+async def upload_content_image(image_base64: str, pending: list[dict[str, Any]] | None = None) -> str:
+    return await _upload_image(image_base64, "ContentImages", "contentImage", pending)
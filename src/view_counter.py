@@ -0,0 +1,81 @@
+import asyncio
+import logging
+
+from .config import settings
+from .database.database import db
+from .database.services import ProductViewService
+
+
+logger = logging.getLogger(__name__)
+
+
+# Per-worker product view counts, added to product_view_counts in one upsert per flush instead
+# of an UPDATE per page view on the hottest product rows. Counts are only in memory: a crashed
+# worker loses at most one flush interval of views, which is acceptable for merchandising numbers
+class ViewCounter:
+    def __init__(self, flush_interval: float, max_keys: int) -> None:
+        self.flush_interval = flush_interval
+        self.max_keys = max_keys
+        self._counts: dict[int, int] = {}
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+
+    def record(self, product_id: int) -> None:
+        if not settings.PRODUCT_VIEWS_ENABLED:
+            return
+        self._counts[product_id] = self._counts.get(product_id, 0) + 1
+        if len(self._counts) >= self.max_keys:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        async with self._flush_lock:
+            if not self._counts:
+                return 0
+            counts, self._counts = self._counts, {}
+            # At most max_keys products per statement keeps the VALUES list well under asyncpg's
+            # 32767 bind parameters, however far the counts grew while the database was away
+            pending = sorted(counts.items())
+            try:
+                while pending:
+                    async with db.session_factory() as session:
+                        await ProductViewService(session).add_views(dict(pending[:self.max_keys]))
+                    pending = pending[self.max_keys:]
+            except Exception:
+                # Not BaseException: a flush cancelled after its commit must not be counted twice
+                self._requeue(pending)
+                raise
+        return len(counts)
+
+    def _requeue(self, pending: list[tuple[int, int]]) -> None:
+        # Put the unsaved views back so the next flush retries them with whatever came in since,
+        # up to max_keys products; the rest are dropped rather than grow without bound
+        dropped = 0
+        for product_id, views in pending:
+            if product_id in self._counts or len(self._counts) < self.max_keys:
+                self._counts[product_id] = self._counts.get(product_id, 0) + views
+            else:
+                dropped += 1
+        if dropped:
+            logger.warning("Dropped views of %s products after a failed flush", dropped)
+
+    async def run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Flushing product views failed, keeping them for the next flush")
+
+    async def close(self) -> None:
+        try:
+            await self.flush()
+        except Exception:
+            logger.exception("Final product view flush failed")
+
+
+product_views = ViewCounter(flush_interval=settings.PRODUCT_VIEWS_FLUSH_SECONDS,
+                            max_keys=settings.PRODUCT_VIEWS_MAX_KEYS)
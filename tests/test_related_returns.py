@@ -0,0 +1,121 @@
+# Runs against the database in DB_URL_ASYNCPG (migrated to head); skipped without one.
+#
+#   DB_URL_ASYNCPG=postgresql+asyncpg://... python -m pytest tests
+import asyncio
+import os
+import time
+
+import pytest
+
+if not os.getenv("DB_URL_ASYNCPG"):
+    pytest.skip("DB_URL_ASYNCPG is not set", allow_module_level=True)
+
+from sqlalchemy import delete, insert, select
+
+from src import recommendations
+from src.config import settings
+from src.database import models, schemas
+from src.database.database import db
+from src.database.services import OrderService
+
+
+db.engine.echo = False
+
+
+async def seed_products(count: int) -> tuple[list[int], list[int]]:
+    marker = f"related-test-{time.time_ns()}"
+    async with db.session_factory() as session:
+        category_id = await session.scalar(insert(models.Category).values(
+            name=marker, slug_en=marker).returning(models.Category.id))
+        sub_id = await session.scalar(insert(models.Sub).values(
+            name=marker, slug_en=marker).returning(models.Sub.id))
+        product_ids = [await session.scalar(insert(models.Product).values(
+            name=f"{marker}-{n}", article=f"{marker}-{n}", base_price=1000, description=marker, weight=1,
+            product_origin="test", category_id=category_id, sub_id=sub_id, sizes=[],
+            slug_en=f"{marker}-{n}").returning(models.Product.id)) for n in range(count)]
+        await session.commit()
+    return product_ids, [category_id, sub_id]
+
+
+async def order(product_ids: list[int]) -> int:
+    async with db.session_factory() as session:
+        created = await OrderService(session).create_order(schemas.OrderCreate(
+            full_name="Related Test", telephone="+77000000000",
+            items=[schemas.OrderItemCreate(product_id=product_id, quantity=1) for product_id in product_ids]))
+    return created.id
+
+
+async def set_status(order_id: int, status: schemas.OrderStatus) -> None:
+    async with db.session_factory() as session:
+        await OrderService(session).update_order_info(schemas.OrderUpdate(
+            id=order_id, full_name="Related Test", telephone="+77000000000", status=status, items=[]))
+
+
+async def pair_orders(product_ids: list[int]) -> int:
+    async with db.session_factory() as session:
+        return await session.scalar(select(models.ProductPair.orders).where(
+            models.ProductPair.product_id == product_ids[0],
+            models.ProductPair.related_id == product_ids[1])) or 0
+
+
+async def bought_together(product_id: int) -> list[int]:
+    async with db.session_factory() as session:
+        return list(await session.scalars(select(models.ProductRecommendation.related_id).where(
+            models.ProductRecommendation.product_id == product_id,
+            models.ProductRecommendation.source == "bought_together")))
+
+
+async def cleanup(product_ids: list[int], category_id: int, sub_id: int, order_ids: list[int]) -> None:
+    async with db.session_factory() as session:
+        await session.execute(delete(models.Order).where(models.Order.id.in_(order_ids)))
+        await session.execute(delete(models.Product).where(models.Product.id.in_(product_ids)))
+        await session.execute(delete(models.Category).where(models.Category.id == category_id))
+        await session.execute(delete(models.Sub).where(models.Sub.id == sub_id))
+        await session.commit()
+
+
+async def returns_after_folding() -> None:
+    product_ids, (category_id, sub_id) = await seed_products(2)
+    order_ids = []
+    try:
+        order_ids += [await order(product_ids), await order(product_ids)]
+        await recommendations.catch_up()
+        assert await pair_orders(product_ids) == 2
+        assert await pair_orders(product_ids[::-1]) == 2
+
+        async with db.session_factory() as session:
+            await OrderService(session).return_order(schemas.OrderUpdate(
+                id=order_ids[0], full_name="Related Test", telephone="+77000000000", items=[]))
+        assert await pair_orders(product_ids) == 1
+        assert await bought_together(product_ids[0]) == [product_ids[1]]
+
+        # Taking the return back counts the order again; deleting it takes it out for good
+        await set_status(order_ids[0], schemas.OrderStatus.Оплачен)
+        assert await pair_orders(product_ids) == 2
+        async with db.session_factory() as session:
+            await OrderService(session).delete_order(order_ids[0])
+            await OrderService(session).delete_order(order_ids[1])
+        assert await pair_orders(product_ids) == 0
+        assert await pair_orders(product_ids[::-1]) == 0
+        assert await bought_together(product_ids[0]) == []
+
+        # Returned before the job got to it: never counted, and the return has nothing to undo
+        order_ids.append(await order(product_ids))
+        await set_status(order_ids[-1], schemas.OrderStatus.Возврат)
+        await recommendations.catch_up()
+        assert await pair_orders(product_ids) == 0
+    finally:
+        await cleanup(product_ids, category_id, sub_id, order_ids)
+
+
+async def run(check) -> None:
+    # Pooled connections belong to the event loop that opened them
+    try:
+        await check()
+    finally:
+        await db.engine.dispose()
+
+
+def test_returns_after_folding(monkeypatch) -> None:
+    monkeypatch.setattr(settings, "RELATED_LAG_SECONDS", 0)
+    asyncio.run(run(returns_after_folding))
@@ -0,0 +1,154 @@
+# Runs against the database in DB_URL_ASYNCPG (migrated to head); skipped without one.
+#
+#   DB_URL_ASYNCPG=postgresql+asyncpg://... python -m pytest tests
+import asyncio
+import math
+import os
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+if not os.getenv("DB_URL_ASYNCPG"):
+    pytest.skip("DB_URL_ASYNCPG is not set", allow_module_level=True)
+
+from sqlalchemy import delete, insert, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DBAPIError
+
+from src.database import models, schemas
+from src.database.database import db
+from src.database.services import TREND_EPOCH, TREND_EPOCH_WATERMARK, OrderService, ProductSalesService
+
+
+db.engine.echo = False
+
+
+async def set_epoch_days(days: int | None) -> None:
+    async with db.session_factory() as session:
+        if days is None:
+            await session.execute(delete(models.JobWatermark).where(
+                models.JobWatermark.name == TREND_EPOCH_WATERMARK))
+        else:
+            stmt = pg_insert(models.JobWatermark).values(name=TREND_EPOCH_WATERMARK, value=days)
+            await session.execute(stmt.on_conflict_do_update(
+                index_elements=[models.JobWatermark.name], set_={"value": days}))
+        await session.commit()
+
+
+async def get_epoch_days() -> int | None:
+    async with db.session_factory() as session:
+        return await session.scalar(select(models.JobWatermark.value).where(
+            models.JobWatermark.name == TREND_EPOCH_WATERMARK))
+
+
+async def seed_products(count: int) -> tuple[list[int], list[int]]:
+    marker = f"trend-test-{time.time_ns()}"
+    async with db.session_factory() as session:
+        category_id = await session.scalar(insert(models.Category).values(
+            name=marker, slug_en=marker).returning(models.Category.id))
+        sub_id = await session.scalar(insert(models.Sub).values(
+            name=marker, slug_en=marker).returning(models.Sub.id))
+        product_ids = [await session.scalar(insert(models.Product).values(
+            name=f"{marker}-{n}", article=f"{marker}-{n}", base_price=1000, description=marker, weight=1,
+            product_origin="test", category_id=category_id, sub_id=sub_id, sizes=[],
+            slug_en=f"{marker}-{n}").returning(models.Product.id)) for n in range(count)]
+        await session.commit()
+    return product_ids, [category_id, sub_id]
+
+
+async def order(product_id: int, quantity: int) -> int:
+    async with db.session_factory() as session:
+        created = await OrderService(session).create_order(schemas.OrderCreate(
+            full_name="Trend Test", telephone="+77000000000",
+            items=[schemas.OrderItemCreate(product_id=product_id, quantity=quantity)]))
+    return created.id
+
+
+async def trend_scores(product_ids: list[int]) -> list[float]:
+    async with db.session_factory() as session:
+        scores = dict((await session.execute(select(
+            models.ProductSalesStats.product_id, models.ProductSalesStats.trend_score).where(
+            models.ProductSalesStats.product_id.in_(product_ids)))).all())
+    return [scores[product_id] for product_id in product_ids]
+
+
+async def cleanup(product_ids: list[int], category_id: int, sub_id: int, order_ids: list[int]) -> None:
+    async with db.session_factory() as session:
+        await session.execute(delete(models.Order).where(models.Order.id.in_(order_ids)))
+        await session.execute(delete(models.Product).where(models.Product.id.in_(product_ids)))
+        await session.execute(delete(models.Category).where(models.Category.id == category_id))
+        await session.execute(delete(models.Sub).where(models.Sub.id == sub_id))
+        await session.commit()
+
+
+def today_days() -> int:
+    return (datetime.now(timezone.utc) - TREND_EPOCH).days
+
+
+async def far_from_epoch() -> None:
+    saved = await get_epoch_days()
+    (product_id,), (category_id, sub_id) = await seed_products(1)
+    order_ids = []
+    try:
+        # An epoch 12 years back: 2^(4380 days / 3 days) is past float8, where the fixed 2026 epoch got in 2034
+        await set_epoch_days(today_days() - 4380)
+        with pytest.raises(DBAPIError, match="out of range"):
+            await order(product_id, 1)
+
+        async with db.session_factory() as session:
+            shift = await ProductSalesService(session).rebase_trend_scores(min_days=30)
+        assert shift == 4380
+        assert await get_epoch_days() == today_days()
+
+        order_ids.append(await order(product_id, 2))
+        (score,) = await trend_scores([product_id])
+        assert math.isfinite(score) and 2 <= score < 4
+    finally:
+        await cleanup([product_id], category_id, sub_id, order_ids)
+        await set_epoch_days(saved)
+
+
+async def rebase_keeps_ranking() -> None:
+    saved = await get_epoch_days()
+    product_ids, (category_id, sub_id) = await seed_products(2)
+    order_ids = []
+    try:
+        await set_epoch_days(today_days() - 40)
+        order_ids += [await order(product_ids[0], 3), await order(product_ids[1], 1)]
+        before = await trend_scores(product_ids)
+
+        async with db.session_factory() as session:
+            assert await ProductSalesService(session).rebase_trend_scores(min_days=30) == 40
+            # Nothing to do until the epoch is min_days old again
+            assert await ProductSalesService(session).rebase_trend_scores(min_days=30) == 0
+        after = await trend_scores(product_ids)
+        assert after[0] > after[1]
+        assert after[0] / after[1] == pytest.approx(before[0] / before[1])
+        assert after[0] == pytest.approx(before[0] * 2 ** -(40 * 24 / 72))
+
+        # Sales after the rebase are weighted against the new epoch, so a return still cancels out
+        order_ids.append(await order(product_ids[1], 1))
+        async with db.session_factory() as session:
+            await OrderService(session).return_order(schemas.OrderUpdate(
+                id=order_ids[-1], full_name="Trend Test", telephone="+77000000000", items=[]))
+        assert (await trend_scores(product_ids))[1] == pytest.approx(after[1])
+    finally:
+        await cleanup(product_ids, category_id, sub_id, order_ids)
+        await set_epoch_days(saved)
+
+
+async def run(check) -> None:
+    # Pooled connections belong to the event loop that opened them
+    try:
+        await check()
+    finally:
+        await db.engine.dispose()
+
+
+def test_trend_weight_far_from_epoch() -> None:
+    asyncio.run(run(far_from_epoch))
+
+
+def test_rebase_keeps_ranking() -> None:
+    asyncio.run(run(rebase_keeps_ranking))